@@ -0,0 +1,56 @@
+import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.responses import JSONResponse, Response, StreamingResponse
+
+from common.change_feed import ChangeFeed, async_sse_stream, parse_since
+
+# blocking calls (serial, logging to file, queues) of the asyncio apps, bounded so the clients can't exhaust threads
+BLOCKING_EXECUTOR_MAX_WORKERS = 16
+blocking_executor = ThreadPoolExecutor(max_workers=BLOCKING_EXECUTOR_MAX_WORKERS, thread_name_prefix='asgi-blocking')
+
+
+async def run_blocking(fn, *args, executor=None):
+    """ Runs blocking fn(*args) by the executor (the shared bounded one by default), so the event loop is not blocked """
+    return await asyncio.get_running_loop().run_in_executor(executor or blocking_executor, fn, *args)
+
+
+async def request_json(request):
+    """ Parsed JSON body of the request, None if there is no valid one (like flask request.json of the sync apps) """
+    body = await request.body()
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return None
+
+
+def make_json_response(resp_json, status_code):
+    """ The same {"status": ..., "body": ...} envelope as the flask apps have """
+    return JSONResponse(resp_json, status_code=status_code)
+
+
+def is_not_modified(request, version):
+    """ Client has this version already: it sent it in If-None-Match of GET """
+    if_none_match = request.headers.get('if-none-match')
+    if request.method != 'GET' or not if_none_match:
+        return False
+    etags = [etag.strip() for etag in if_none_match.split(',')]
+    return '*' in etags or any(etag.removeprefix('W/').strip('"') == str(version) for etag in etags)
+
+
+def make_versioned_response(resp_json, version):
+    """ Response with ETag of the version, 304 without a body if client has this version already (resp_json is None) """
+    headers = {'ETag': f'"{version}"'}
+    if resp_json is None:
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(resp_json, status_code=200, headers=headers)
+
+
+def make_sse_response(request, change_feed: ChangeFeed):
+    """ Server-Sent Events stream of the change feed, resumed from Last-Event-ID or ?since= """
+    since = parse_since(change_feed, request.headers.get('last-event-id'), request.query_params.get('since'))
+    return StreamingResponse(async_sse_stream(change_feed, since), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
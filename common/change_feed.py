@@ -0,0 +1,216 @@
+import json
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    def __init__(self, get_state, coalesce_interval=0.1, history_size=512):
+        """
+        Push stream of the state deltas, one producer for any number of consumers
+
+        Owner calls notify() on each change (it's cheap and may be called under owner's locks).
+        The producer thread wakes up no more often than coalesce_interval, so rapid changes are merged,
+        takes the state by get_state() as a flat dict (key -> json-able value), compares it with the previous one
+        and stores the delta {key: new value or None if key is gone} with the next version in the history.
+
+        Consumers read the deltas by events(since), where since is the last version they have.
+        If it is unknown or too old for the history, consumer gets the whole state at first.
+        Versions start over with the process, so the cursors given out (SSE event ids) carry the epoch of the feed.
+        """
+        self.get_state = get_state
+        self.coalesce_interval = coalesce_interval
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._state = {}
+        self._history = deque(maxlen=history_size)  # (version, delta)
+        self._condition = threading.Condition()
+        self._changed = threading.Event()
+        self._wakers = []  # called from the producer thread on each new version, for asyncio consumers
+        self._stopped = False
+        self._producer_thread = None
+
+    def start(self):
+        self._refresh()
+        self._producer_thread = threading.Thread(target=self._producer, daemon=True)
+        self._producer_thread.start()
+
+    def stop(self):
+        self._stopped = True
+        self._changed.set()
+        with self._condition:
+            self._condition.notify_all()
+
+    def notify(self, *args):
+        """ Something has been changed. Takes any args, so it can be used as a callback directly """
+        self._changed.set()
+
+    def _producer(self):
+        while True:
+            self._changed.wait()
+            if self._stopped:
+                return
+            # let the rapid changes pile up
+            self._changed.clear()
+            time.sleep(self.coalesce_interval)
+            try:
+                self._refresh()
+            except Exception:
+                logger.exception('Change feed state refreshing has been failed')
+
+    def _refresh(self):
+        state = self.get_state()
+        delta = {key: value for key, value in state.items() if self._state.get(key) != value}
+        delta.update((key, None) for key in self._state.keys() - state.keys())
+        if not delta and self.version:
+            return
+        with self._condition:
+            self._state = state
+            self.version += 1
+            self._history.append((self.version, delta))
+            self._condition.notify_all()
+        for waker in list(self._wakers):
+            waker()
+
+    def _initial_event(self, since):
+        """ The whole state event, if consumer's cursor is unknown or too old. Returns (event or None, cursor) """
+        with self._condition:
+            if since is None or not self._history or not self._history[0][0] - 1 <= since <= self.version:
+                return ('state', self.version, self._state), self.version
+            return None, since
+
+    def _pending_events(self, since):
+        """ Events after the cursor, doesn't block. Call it under the condition """
+        if self.version <= since:
+            return []
+        if self._history[0][0] - 1 > since:
+            # consumer is too slow for the history, resync it by the whole state
+            return [('state', self.version, self._state)]
+        return [('delta', version, delta) for version, delta in self._history if version > since]
+
+    def events(self, since=None, keepalive_interval=15):
+        """
+        Generator of (event, version, data) for one consumer. Blocks till the next change
+
+        event is 'state' (data is the whole state) or 'delta' (data is changes since the previous version).
+        Yields None every keepalive_interval without changes
+        """
+        initial_event, since = self._initial_event(since)
+        if initial_event is not None:
+            yield initial_event
+
+        while not self._stopped:
+            with self._condition:
+                if self.version <= since:
+                    self._condition.wait(keepalive_interval)
+                pending = self._pending_events(since)
+            if not pending:
+                yield None
+                continue
+            for event in pending:
+                yield event
+            since = pending[-1][1]
+
+    async def async_events(self, since=None, keepalive_interval=15):
+        """ The same as events(), but for asyncio consumers: waits without holding a thread """
+        loop = asyncio.get_running_loop()
+        changed = asyncio.Event()
+
+        def waker():
+            loop.call_soon_threadsafe(changed.set)
+
+        initial_event, since = self._initial_event(since)
+        if initial_event is not None:
+            yield initial_event
+
+        self._wakers.append(waker)
+        try:
+            while not self._stopped:
+                changed.clear()
+                with self._condition:
+                    pending = self._pending_events(since)
+                if not pending:
+                    try:
+                        await asyncio.wait_for(changed.wait(), keepalive_interval)
+                    except asyncio.TimeoutError:
+                        yield None
+                    continue
+                for event in pending:
+                    yield event
+                since = pending[-1][1]
+        finally:
+            self._wakers.remove(waker)
+
+
+def _format_sse(epoch, event):
+    if event is None:
+        return ': keepalive\n\n'
+    event_name, version, data = event
+    return f'id: {epoch}-{version}\nevent: {event_name}\ndata: {json.dumps(data)}\n\n'
+
+
+def sse_stream(change_feed: ChangeFeed, since=None, keepalive_interval=15):
+    """
+    Server-Sent Events text stream of the change feed
+
+    Event id is "<epoch>-<version>", parse_since() takes the version of it for resuming
+    """
+    yield 'retry: 1000\n\n'
+    for event in change_feed.events(since, keepalive_interval):
+        yield _format_sse(change_feed.epoch, event)
+
+
+async def async_sse_stream(change_feed: ChangeFeed, since=None, keepalive_interval=15):
+    """ The same as sse_stream(), for asyncio servers """
+    yield 'retry: 1000\n\n'
+    async for event in change_feed.async_events(since, keepalive_interval):
+        yield _format_sse(change_feed.epoch, event)
+
+
+class StreamSlots:
+    def __init__(self, max_streams):
+        """
+        Limit of the concurrent streams of the sync (WSGI) app
+
+        Each stream holds a worker thread till its client goes away, so the streams must not take all the workers.
+        The asyncio apps don't need it
+        """
+        self._slots = threading.BoundedSemaphore(max_streams)
+
+    def stream(self, chunks):
+        """ The chunks generator holding a slot till it's closed, None if all the slots are taken """
+        if not self._slots.acquire(blocking=False):
+            return None
+        stream = self._release_after(chunks)
+        # started generator runs its finally on close(), even if the client has not read anything
+        next(stream)
+        return stream
+
+    def _release_after(self, chunks):
+        try:
+            yield
+            yield from chunks
+        finally:
+            self._slots.release()
+
+
+def parse_since(change_feed: ChangeFeed, last_event_id, since_arg):
+    """
+    Resume cursor from Last-Event-ID header or ?since= arg, None if there is no valid one
+
+    The event id of the other epoch (the previous process) is not valid: its version may be taken by other state,
+    so the consumer gets the whole state
+    """
+    for value in (last_event_id, since_arg):
+        epoch, _, version = str(value).rpartition('-')
+        if epoch != change_feed.epoch:
+            continue
+        try:
+            return int(version)
+        except ValueError:
+            pass
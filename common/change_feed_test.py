@@ -0,0 +1,90 @@
+import asyncio
+from unittest import TestCase
+
+from common.change_feed import ChangeFeed, StreamSlots, sse_stream, parse_since
+
+
+class TestChangeFeed(TestCase):
+
+    def setUp(self):
+        self.state = {'a': 1, 'b': 2}
+        self.feed = ChangeFeed(lambda: dict(self.state), coalesce_interval=0.05, history_size=3)
+        self.feed.start()
+
+    def tearDown(self):
+        self.feed.stop()
+
+    def _change(self, **changes):
+        self.state.update(changes)
+        self.feed.notify()
+
+    def test_state_then_deltas(self):
+        events = self.feed.events(keepalive_interval=1)
+        self.assertEqual(next(events), ('state', 1, {'a': 1, 'b': 2}), "First event must be the whole state")
+        self._change(a=10)
+        self._change(a=11, b=2)
+        self.assertEqual(next(events), ('delta', 2, {'a': 11}), "Rapid changes have not been coalesced")
+        del self.state['b']
+        self.feed.notify()
+        self.assertEqual(next(events), ('delta', 3, {'b': None}), "Removed key is not in the delta")
+
+    def test_resume(self):
+        self._change(a=10)
+        next(self.feed.events(since=1, keepalive_interval=1))
+        events = self.feed.events(since=1, keepalive_interval=1)
+        self.assertEqual(next(events), ('delta', 2, {'a': 10}), "Stream has not been resumed")
+
+    def test_resync_by_state(self):
+        for value in range(5):
+            self._change(a=value)
+            next(self.feed.events(since=self.feed.version, keepalive_interval=0.5), None)
+        events = self.feed.events(since=1, keepalive_interval=1)
+        self.assertEqual(next(events)[0], 'state', "Too old cursor must get the whole state")
+
+    def test_keepalive(self):
+        events = sse_stream(self.feed, since=self.feed.version, keepalive_interval=0.05)
+        self.assertEqual(next(events), 'retry: 1000\n\n', "Stream must start with the retry interval")
+        self.assertEqual(next(events), ': keepalive\n\n', "Keepalive has not been sent")
+
+    def test_async_events(self):
+        async def read_events():
+            events = self.feed.async_events(keepalive_interval=1)
+            first = await anext(events)
+            self._change(b=20)
+            second = await anext(events)
+            await events.aclose()
+            return first, second
+
+        first, second = asyncio.run(read_events())
+        self.assertEqual(first, ('state', 1, {'a': 1, 'b': 2}), "First event must be the whole state")
+        self.assertEqual(second, ('delta', 2, {'b': 20}), "Async consumer has not been woken up")
+        self.assertFalse(self.feed._wakers, "Async consumer has not been unsubscribed")
+
+    def test_parse_since(self):
+        epoch = self.feed.epoch
+        self.assertEqual(parse_since(self.feed, f'{epoch}-5', f'{epoch}-3'), 5, "Last-Event-ID must win")
+        self.assertEqual(parse_since(self.feed, None, f'{epoch}-3'), 3, "since arg is not parsed")
+        self.assertIsNone(parse_since(self.feed, f'{epoch}-x', None), "Invalid cursor must be ignored")
+        self.assertIsNone(parse_since(self.feed, '5', None), "Cursor without the epoch must be ignored")
+
+    def test_other_epoch(self):
+        events = sse_stream(self.feed, keepalive_interval=1)
+        next(events)
+        self.assertTrue(next(events).startswith(f'id: {self.feed.epoch}-1\n'), "Event id is incorrect")
+        restarted_feed = ChangeFeed(lambda: dict(self.state))
+        restarted_feed.start()
+        since = parse_since(restarted_feed, f'{self.feed.epoch}-1', None)
+        self.assertEqual(next(restarted_feed.events(since))[0], 'state',
+                         "Cursor of the other epoch must get the whole state")
+        restarted_feed.stop()
+
+    def test_stream_slots(self):
+        slots = StreamSlots(1)
+        stream = slots.stream(sse_stream(self.feed, keepalive_interval=1))
+        self.assertEqual(next(stream), 'retry: 1000\n\n', "Stream is incorrect")
+        self.assertIsNone(slots.stream(sse_stream(self.feed)), "Streams are not limited")
+        stream.close()
+        unread_stream = slots.stream(sse_stream(self.feed))
+        self.assertIsNotNone(unread_stream, "Slot of the closed stream has not been released")
+        unread_stream.close()
+        self.assertIsNotNone(slots.stream(sse_stream(self.feed)), "Slot of the unread stream has not been released")
@@ -0,0 +1,132 @@
+"""
+asyncio (ASGI) variant of the conveyor web API: the same /api/v1/conveyor/* routes and JSON envelopes
+
+GPIO calls are run by the conveyor bounded executor, pass_one "wait" is an await of the scheduled closing,
+so one process serves many concurrent clients without a worker per request.
+
+    uvicorn conveyor.conveyor_asgi_api:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.routing import Route, Mount
+
+from common.asgi import request_json, make_json_response, is_not_modified, make_versioned_response, make_sse_response
+from conveyor.conveyor_web_common import cv, conveyor_feed, conveyor_api_url_prefix, PASS_ONE_MAX_WAIT_TIME, \
+    validate_lock_id_or_name, select_snapshot_locks, lock_snapshot_json, snapshot_etag
+
+
+async def _run_gpio(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(cv.executor, fn, *args)
+
+
+async def _map_locks(method, locks):
+    """ The same as Conveyor.map_locks, but awaits the executor instead of blocking """
+    return await asyncio.gather(*(_run_gpio(method, lock) for lock in locks))
+
+
+async def _validate_request(request):
+    params = await request_json(request)
+    error, locks = validate_lock_id_or_name(params)
+    return error, params, locks
+
+
+def _make_locks_response(locks, message):
+    resp_json = {
+        "status": 200, "body": {
+            "lock(id:{}, name: {})".format(lock.id, lock.name): message
+            for lock, _ in cv.locks_state(locks)
+        }
+    }
+    return make_json_response(resp_json, 200)
+
+
+def _make_error_response(error):
+    return make_json_response({"status": 400, "body": error}, 400)
+
+
+async def locks_status(request):
+    error, _, locks = await _validate_request(request)
+    if error:
+        return _make_error_response(error)
+    snapshot = await _run_gpio(cv.snapshot)
+    error, selected_locks = select_snapshot_locks(snapshot, locks)
+    if error:
+        return _make_error_response(error)
+    etag = snapshot_etag(snapshot, selected_locks)
+    if is_not_modified(request, etag):
+        return make_versioned_response(None, etag)
+    resp_json = {
+        "status": 200, "body": [
+            lock_snapshot_json(lock) for lock in selected_locks
+        ]
+    }
+    return make_versioned_response(resp_json, etag)
+
+
+async def locks_open(request):
+    error, _, locks = await _validate_request(request)
+    if error:
+        return _make_error_response(error)
+    await _map_locks(cv.lock_open, locks)
+    return _make_locks_response(locks, "Has been opened")
+
+
+async def locks_close(request):
+    error, _, locks = await _validate_request(request)
+    if error:
+        return _make_error_response(error)
+    await _map_locks(cv.lock_close, locks)
+    return _make_locks_response(locks, "Has been closed")
+
+
+async def locks_pass_one(request):
+    error, params, locks = await _validate_request(request)
+    if error:
+        return _make_error_response(error)
+    # locks are closed by the scheduler, so only opening is awaited here
+    pass_one_calls = await _map_locks(cv.lock_pass_one, locks)
+    pending_calls = [asyncio.wrap_future(call) for call in pass_one_calls if call is not None]
+    if params.get("wait") and pending_calls:
+        await asyncio.wait(pending_calls, timeout=PASS_ONE_MAX_WAIT_TIME)
+    return _make_locks_response(locks, "Car has been released")
+
+
+async def conveyor_status(request):
+    snapshot = await _run_gpio(cv.snapshot)
+    etag = snapshot_etag(snapshot)
+    if is_not_modified(request, etag):
+        return make_versioned_response(None, etag)
+    resp_json = {
+        "status": 200, "body": {
+            "conveyor_state": snapshot.state.name,
+            "locks_state": [lock_snapshot_json(lock) for lock in snapshot.locks],
+        }
+    }
+    return make_versioned_response(resp_json, etag)
+
+
+async def conveyor_stream(request):
+    """ Server-Sent Events stream of the conveyor state, the same as the flask app has """
+    return make_sse_response(request, conveyor_feed)
+
+
+conveyor_api = Mount(conveyor_api_url_prefix, routes=[
+    Route('/locks/status', locks_status, methods=['GET', 'POST']),
+    Route('/locks/open', locks_open, methods=['GET', 'POST']),
+    Route('/locks/close', locks_close, methods=['GET', 'POST']),
+    Route('/locks/pass_one', locks_pass_one, methods=['GET', 'POST']),
+    Route('/status', conveyor_status, methods=['GET', 'POST']),
+    Route('/stream', conveyor_stream, methods=['GET']),
+])
+
+app = Starlette(routes=[conveyor_api], middleware=[
+    # ETag is needed by the pollers for If-None-Match
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'], expose_headers=['ETag']),
+])
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app)
@@ -1,12 +1,28 @@
-from time import sleep
+import time
+import logging
+import threading
 from enum import Enum
+from contextlib import ExitStack
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import RPi.GPIO as GPIO
 
+from conveyor.scheduler import Scheduler, ScheduledCall, scheduler as default_scheduler
+
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
+logger = logging.getLogger(__name__)
+
+
+def _gpio_input_many(ports):
+    """ Reads several input ports. By one call, if GPIO backend supports it (simulation GPIO mock does) """
+    input_many = getattr(GPIO, 'input_many', None)
+    if input_many is not None:
+        return input_many(ports)
+    return [GPIO.input(port) for port in ports]
+
 
 class LockState(Enum):
     CLOSED = 0
@@ -18,29 +34,335 @@ class ConveyorState(Enum):
     ENABLED = 1
 
 
+# immutable records of Conveyor.snapshot()
+LockSnapshot = namedtuple('LockSnapshot', ('id', 'name', 'state', 'is_busy', 'last_transition_time'))
+ConveyorSnapshot = namedtuple('ConveyorSnapshot', ('version', 'state', 'locks'))
+
+
+class OccupancyTracker:
+    def __init__(self, locks, debounce_time=0.05, poll_interval=0.05, mutex=None, scheduler: Scheduler=None):
+        """
+        Event-driven cache of the locks occupancy
+
+        Fed by GPIO edge callbacks (add_event_detect) if GPIO backend supports them,
+        otherwise (e.g. the simulation GPIO mock) by the fallback poller thread,
+        that reads all the in ports by one batch call every poll_interval.
+        The new level is accepted only if it stays the same during debounce_time: the poller sees it
+        on the polls, the edge is confirmed by the scheduler re-reading the port after debounce_time
+        (GPIO bouncetime may swallow the last edge of the bounce, so the level seen at the edge is not trusted).
+
+        Subscribers are called as callback(lock, is_busy, transition_time) on each accepted transition.
+        They are called under the tracker mutex (may be shared with the owner), so they must be short
+        """
+        self.debounce_time = debounce_time
+        self.poll_interval = poll_interval
+        self.is_edge_triggered = False
+        self._locks = {}  # in_port -> Lock
+        self._is_busy = {}  # in_port -> bool
+        self._last_transition_time = {}  # in_port -> time.time() of the last accepted transition
+        self._candidates = {}  # in_port -> (level, time.monotonic() when it has been seen at first)
+        self._confirm_calls = {}  # in_port -> ScheduledCall re-reading the port after the edge
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        self._subscribers = []
+        self._lock = mutex if mutex is not None else threading.RLock()
+        self._stop_event = threading.Event()
+        self._poller_thread = None
+        self._is_started = False
+        for lock in locks:
+            self.track(lock)
+
+    def _enable_edge_detection(self, in_port):
+        """ Returns False if GPIO backend can't call us back on edges """
+        add_event_detect = getattr(GPIO, 'add_event_detect', None)
+        both = getattr(GPIO, 'BOTH', None)
+        if add_event_detect is None or both is None:
+            return False
+        kwargs = {'callback': self._on_edge}
+        if self.debounce_time > 0:
+            kwargs['bouncetime'] = max(1, int(self.debounce_time * 1000))
+        try:
+            add_event_detect(in_port, both, **kwargs)
+        except RuntimeError:
+            return False
+        return True
+
+    def start(self):
+        """ Subscribes to the edges of all the tracked ports, or starts the poller if edges are not available """
+        with self._lock:
+            if self._is_started:
+                return
+            self._is_started = True
+            in_ports = list(self._locks)
+        self.is_edge_triggered = all(self._enable_edge_detection(in_port) for in_port in in_ports)
+        if not self.is_edge_triggered:
+            for in_port in in_ports:
+                self._disable_edge_detection(in_port)
+            self._stop_event.clear()
+            self._poller_thread = threading.Thread(target=self._poller, daemon=True)
+            self._poller_thread.start()
+
+    def stop(self):
+        with self._lock:
+            if not self._is_started:
+                return
+            self._is_started = False
+            in_ports = list(self._locks)
+        if self.is_edge_triggered:
+            for in_port in in_ports:
+                self._disable_edge_detection(in_port)
+            with self._lock:
+                confirm_calls, self._confirm_calls = self._confirm_calls, {}
+            for confirm_call in confirm_calls.values():
+                confirm_call.cancel()
+        else:
+            self._stop_event.set()
+            self._poller_thread.join()
+
+    @staticmethod
+    def _disable_edge_detection(in_port):
+        remove_event_detect = getattr(GPIO, 'remove_event_detect', None)
+        if remove_event_detect is not None:
+            try:
+                remove_event_detect(in_port)
+            except RuntimeError:
+                pass
+
+    def track(self, lock):
+        """ Starts tracking of the lock, its current level is read immediately """
+        is_busy = bool(GPIO.input(lock.in_port))
+        with self._lock:
+            self._locks[lock.in_port] = lock
+            self._is_busy[lock.in_port] = is_busy
+            self._last_transition_time[lock.in_port] = None
+            is_started = self._is_started
+        lock.occupancy_tracker = self
+        if is_started and self.is_edge_triggered:
+            self._enable_edge_detection(lock.in_port)
+
+    def untrack(self, lock):
+        with self._lock:
+            self._locks.pop(lock.in_port, None)
+            self._is_busy.pop(lock.in_port, None)
+            self._last_transition_time.pop(lock.in_port, None)
+            self._candidates.pop(lock.in_port, None)
+            confirm_call = self._confirm_calls.pop(lock.in_port, None)
+            is_started = self._is_started
+        if confirm_call is not None:
+            confirm_call.cancel()
+        lock.occupancy_tracker = None
+        if is_started and self.is_edge_triggered:
+            self._disable_edge_detection(lock.in_port)
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def is_busy(self, lock):
+        return self._is_busy[lock.in_port]
+
+    def last_transition_time(self, lock):
+        return self._last_transition_time[lock.in_port]
+
+    def _on_edge(self, in_port):
+        """ GPIO edge callback. The level is accepted if the port has it after debounce_time """
+        self._expect_level(in_port, bool(GPIO.input(in_port)))
+
+    def _expect_level(self, in_port, level):
+        with self._lock:
+            if in_port not in self._locks:
+                return
+            confirm_call = self._confirm_calls.pop(in_port, None)
+            if confirm_call is not None:
+                confirm_call.cancel()
+            if self.debounce_time <= 0:
+                self._set_level(in_port, level)
+                return
+            self._confirm_calls[in_port] = self.scheduler.call_later(
+                self.debounce_time, self._confirm_level, in_port, level
+            )
+
+    def _confirm_level(self, in_port, level):
+        current_level = bool(GPIO.input(in_port))
+        with self._lock:
+            self._confirm_calls.pop(in_port, None)
+            if current_level == level:
+                self._set_level(in_port, level)
+            elif current_level != self._is_busy.get(in_port, current_level):
+                # still bouncing, or the last edge has been swallowed by bouncetime: the level is checked again
+                self._expect_level(in_port, current_level)
+
+    def _set_level(self, in_port, is_busy):
+        transition_time = time.time()
+        with self._lock:
+            if in_port not in self._locks or self._is_busy[in_port] == is_busy:
+                return
+            self._is_busy[in_port] = is_busy
+            self._last_transition_time[in_port] = transition_time
+            lock = self._locks[in_port]
+            for callback in list(self._subscribers):
+                callback(lock, is_busy, transition_time)
+
+    def _poll_once(self):
+        with self._lock:
+            in_ports = list(self._locks)
+        levels = _gpio_input_many(in_ports)
+        now = time.monotonic()
+        with self._lock:
+            for in_port, level in zip(in_ports, levels):
+                level = bool(level)
+                if level == self._is_busy.get(in_port, level):
+                    self._candidates.pop(in_port, None)
+                    continue
+                candidate = self._candidates.get(in_port)
+                if candidate is None or candidate[0] != level:
+                    candidate = self._candidates[in_port] = (level, now)
+                if now - candidate[1] >= self.debounce_time:
+                    del self._candidates[in_port]
+                    self._set_level(in_port, level)
+
+    def _poller(self):
+        """ Fallback for GPIO backends without edge callbacks """
+        while not self._stop_event.is_set():
+            try:
+                self._poll_once()
+            except Exception:
+                logger.exception('Locks occupancy polling has been failed')
+            self._stop_event.wait(self.poll_interval)
+
+
 class Conveyor:
-    def __init__(self, locks):
-        self.locks = locks
-        for lock_id, lock in enumerate(self.locks, 1):
-            lock.id = lock_id
+    EXECUTOR_MAX_WORKERS = 8
+
+    def __init__(self, locks, track_occupancy=True):
+        # long-lived and bounded, shared by all the requests for locks fan-out
+        self.executor = ThreadPoolExecutor(max_workers=self.EXECUTOR_MAX_WORKERS, thread_name_prefix='conveyor')
+        # guards the whole conveyor state (locks states, occupancy) and its version
+        self._state_lock = threading.RLock()
+        self._version = 0
+        self._snapshot: ConveyorSnapshot = None
+        self._state_subscribers = []
+        self.occupancy_tracker = None
+        if track_occupancy:
+            self.occupancy_tracker = OccupancyTracker([], mutex=self._state_lock)
+            self.occupancy_tracker.subscribe(self._on_state_change)
+        # self.locks list is never changed in place, it's replaced on adding/removing, so it's safe to iterate it
+        self.locks = []
+        self._locks_by_id = {}
+        self._locks_by_name = {}  # by lower-cased name
+        self._locks_lock = threading.Lock()
+        self._last_lock_id = 0
+        for lock in locks:
+            self.add_lock(lock)
+        if self.occupancy_tracker is not None:
+            self.occupancy_tracker.start()
         self.state = ConveyorState.ENABLED
         GPIO.setup(7, GPIO.OUT)
         GPIO.output(7, GPIO.LOW)
         self._lock_with_state = namedtuple('lock_with_state', ('lock', 'state'))
+        self._lock_with_full_state = namedtuple('lock_with_full_state', ('lock', 'state', 'is_busy'))
+
+    def cleanup(self):
+        if self.occupancy_tracker is not None:
+            self.occupancy_tracker.stop()
+        self.executor.shutdown(wait=True)
 
     def conveyor_e_stop(self):
         GPIO.output(7, GPIO.HIGH)
-        self.state = ConveyorState.E_STOP
+        with self._state_lock:
+            self.state = ConveyorState.E_STOP
+            self._on_state_change()
+
+    @property
+    def version(self):
+        """ Increases on each change of the conveyor state """
+        return self._version
+
+    def subscribe(self, callback):
+        """ callback() is called on each conveyor state change, under the state lock, so it must be short """
+        self._state_subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._state_subscribers.remove(callback)
+
+    def _on_state_change(self, *args):
+        """ Called under the state lock by the conveyor itself, the locks and the occupancy tracker """
+        self._version += 1
+        for callback in list(self._state_subscribers):
+            callback()
+
+    def snapshot(self) -> ConveyorSnapshot:
+        """
+        Immutable record of the whole conveyor state, captured at one moment
+
+        It's cached till the next change, so it's cheap to call it often
+        """
+        with self._state_lock:
+            if self.occupancy_tracker is None:
+                # nobody tells about occupancy changes, so read it and compare with the previous snapshot
+                locks_busy = [bool(is_busy) for is_busy in _gpio_input_many([lock.in_port for lock in self.locks])]
+                if self._snapshot is not None and locks_busy != [lock.is_busy for lock in self._snapshot.locks]:
+                    self._on_state_change()
+            else:
+                locks_busy = [lock.is_busy for lock in self.locks]
+
+            if self._snapshot is None or self._snapshot.version != self._version:
+                self._snapshot = ConveyorSnapshot(self._version, self.state, tuple(
+                    LockSnapshot(lock.id, lock.name, lock.state, is_busy, lock.last_transition_time)
+                    for lock, is_busy in zip(self.locks, locks_busy)
+                ))
+            return self._snapshot
+
+    def add_lock(self, lock):
+        """ Attaches the lock to the conveyor, it gets the next id """
+        with self._locks_lock:
+            if lock.name in self._locks_by_name:
+                raise ValueError(f'Lock with name {lock.name!r} is attached to conveyor already')
+            self._last_lock_id += 1
+            lock.id = self._last_lock_id
+            self._locks_by_id[lock.id] = lock
+            self._locks_by_name[lock.name] = lock
+            self.locks = self.locks + [lock]
+        with self._state_lock:
+            lock.state_lock = self._state_lock
+            lock.on_state_change = self._on_state_change
+            self._on_state_change()
+        if self.occupancy_tracker is not None:
+            self.occupancy_tracker.track(lock)
+        return lock
+
+    def remove_lock(self, lock_identifier):
+        """ Detaches the lock from the conveyor. Ids of other locks stay the same """
+        with self._locks_lock:
+            lock = self._get_lock_by_id_or_name(lock_identifier)
+            if lock is None:
+                raise KeyError(lock_identifier)
+            del self._locks_by_id[lock.id]
+            del self._locks_by_name[lock.name]
+            self.locks = [attached_lock for attached_lock in self.locks if attached_lock is not lock]
+        with self._state_lock:
+            lock.state_lock = threading.RLock()
+            lock.on_state_change = None
+            self._on_state_change()
+        if self.occupancy_tracker is not None:
+            self.occupancy_tracker.untrack(lock)
+        return lock
+
+    def has_lock_id(self, lock_id):
+        return isinstance(lock_id, int) and lock_id in self._locks_by_id
+
+    def has_lock_name(self, lock_name):
+        return isinstance(lock_name, str) and self._find_lock_by_name(lock_name) is not None
 
     def _find_lock_by_id(self, lock_id):
-        for lock in self.locks:
-            if lock.id == lock_id:
-                return lock
+        return self._locks_by_id.get(lock_id)
 
     def _find_lock_by_name(self, lock_name):
-        for lock in self.locks:
-            if lock.name == lock_name.lower():
-                return lock
+        lock = self._locks_by_name.get(lock_name)
+        if lock is None:
+            lock = self._locks_by_name.get(lock_name.lower())
+        return lock
 
     def _get_lock_by_id_or_name(self, searching_parameter):
         if isinstance(searching_parameter, int):
@@ -49,7 +371,7 @@ class Conveyor:
             return self._find_lock_by_name(searching_parameter)
 
     def lock_pass_one(self, lock_identifier):
-        self._get_lock_by_id_or_name(lock_identifier).pass_one()
+        return self._get_lock_by_id_or_name(lock_identifier).pass_one()
 
     def lock_open(self, lock_identifier):
         self._get_lock_by_id_or_name(lock_identifier).open()
@@ -57,10 +379,66 @@ class Conveyor:
     def lock_close(self, lock_identifier):
         self._get_lock_by_id_or_name(lock_identifier).close()
 
-    def locks_state(self):
+    def _write_locks_state(self, locks, state):
+        """ Sets the state of several locks by one GPIO write """
+        with ExitStack() as stack:
+            # fixed order of mutexes acquiring, against the deadlocks
+            for lock in sorted(set(locks), key=lambda lock: lock.id):
+                stack.enter_context(lock.mutex)
+            if state == LockState.CLOSED:
+                for lock in locks:
+                    lock.cancel_pending_pass_one()
+            locks = [lock for lock in locks if lock.state != state]
+            if not locks:
+                return
+            value = GPIO.HIGH if state == LockState.OPEN else GPIO.LOW
+            GPIO.output([lock.out_port for lock in locks], [value] * len(locks))
+            with self._state_lock:
+                for lock in locks:
+                    lock.state = state
+
+    def map_locks(self, method, lock_identifiers):
+        """
+        Calls method(lock_identifier) for all the locks in parallel by the conveyor executor
+
+        Blocks till all the calls are done, returns their results. Calls for the same lock are serialized
+        by the lock mutex, so concurrent requests can't interleave its GPIO writes
+        """
+        return list(self.executor.map(method, lock_identifiers))
+
+    def locks_open(self, lock_identifiers):
+        self._write_locks_state([self._get_lock_by_id_or_name(i) for i in lock_identifiers], LockState.OPEN)
+
+    def locks_close(self, lock_identifiers):
+        self._write_locks_state([self._get_lock_by_id_or_name(i) for i in lock_identifiers], LockState.CLOSED)
+
+    def locks_full_state(self, lock_identifiers=None):
+        """
+        States with occupancy of the locks (all by default)
+
+        Occupancy is taken from the occupancy tracker, or read by one GPIO call if conveyor doesn't track it
+        """
+        if lock_identifiers is None:
+            locks = self.locks
+        else:
+            locks = [self._get_lock_by_id_or_name(i) for i in lock_identifiers]
+        if self.occupancy_tracker is not None:
+            locks_busy = [lock.is_busy for lock in locks]
+        else:
+            locks_busy = _gpio_input_many([lock.in_port for lock in locks])
+        return [
+            self._lock_with_full_state(lock, lock.state, bool(is_busy))
+            for lock, is_busy in zip(locks, locks_busy)
+        ]
+
+    def locks_state(self, lock_identifiers=None):
+        if lock_identifiers is None:
+            locks = self.locks
+        else:
+            locks = [self._get_lock_by_id_or_name(i) for i in lock_identifiers]
         return [
             self._lock_with_state(lock, lock.state)
-            for lock in self.locks
+            for lock in locks
         ]
 
     def lock_state(self, lock_identifier):
@@ -71,42 +449,100 @@ class Conveyor:
 class Lock:
     PASS_ONE_AWAIT_TIME = 0.8
 
-    def __init__(self, name, in_port, out_port):
+    def __init__(self, name, in_port, out_port, scheduler: Scheduler=None):
         self.name = name.lower()
         self.in_port = in_port
         self.out_port = out_port
         GPIO.setup(self.in_port, GPIO.IN)
         GPIO.setup(self.out_port, GPIO.OUT)
         GPIO.output(self.out_port, GPIO.LOW)
-        self.state = LockState.CLOSED
+        # replaced by the conveyor ones, when the lock is attached to it
+        self.state_lock = threading.RLock()
+        self.on_state_change = None
+        self._state = LockState.CLOSED
+        self.occupancy_tracker: OccupancyTracker = None
+        self.scheduler = scheduler if scheduler is not None else default_scheduler
+        self._pass_one_call: ScheduledCall = None
+        self._pass_one_call_number = 0
+        # serializes GPIO writes of the lock: requests, executor tasks and scheduled closing
+        self.mutex = threading.RLock()
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, state):
+        with self.state_lock:
+            if self._state is state:
+                return
+            self._state = state
+            if self.on_state_change is not None:
+                self.on_state_change(self)
 
     @property
     def is_busy(self):
+        if self.occupancy_tracker is not None:
+            return self.occupancy_tracker.is_busy(self)
         if GPIO.input(self.in_port):
             return True
         else:
             return False
 
+    @property
+    def last_transition_time(self):
+        """ time.time() of the last occupancy change, None if it is not tracked or has not been changed yet """
+        if self.occupancy_tracker is not None:
+            return self.occupancy_tracker.last_transition_time(self)
+
     def open(self):
-        if self.state == LockState.OPEN:
-            return
-        GPIO.output(self.out_port, GPIO.HIGH)
-        self.state = LockState.OPEN
+        with self.mutex:
+            if self.state == LockState.OPEN:
+                return
+            GPIO.output(self.out_port, GPIO.HIGH)
+            self.state = LockState.OPEN
+
+    def cancel_pending_pass_one(self):
+        """ Cancels the scheduled closing of pass_one, if any """
+        with self.mutex:
+            if self._pass_one_call is not None:
+                self._pass_one_call.cancel()
+                self._pass_one_call = None
 
     def close(self):
-        if self.state == LockState.CLOSED:
-            return
-        GPIO.output(self.out_port, GPIO.LOW)
-        self.state = LockState.CLOSED
+        with self.mutex:
+            self.cancel_pending_pass_one()
+            if self.state == LockState.CLOSED:
+                return
+            GPIO.output(self.out_port, GPIO.LOW)
+            self.state = LockState.CLOSED
 
     def pass_one(self):
-        if self.state == LockState.OPEN:
-            return
-        GPIO.output(self.out_port, GPIO.HIGH)
-        self.state = LockState.OPEN
-        sleep(self.PASS_ONE_AWAIT_TIME)
-        GPIO.output(self.out_port, GPIO.LOW)
-        self.state = LockState.CLOSED
+        """
+        Opens the lock and lets the scheduler close it in PASS_ONE_AWAIT_TIME
+
+        Doesn't block. Returns the ScheduledCall of closing, so caller may wait for it,
+        or None if the lock is open already
+        """
+        with self.mutex:
+            if self.state == LockState.OPEN:
+                return
+            GPIO.output(self.out_port, GPIO.HIGH)
+            self.state = LockState.OPEN
+            self._pass_one_call = self.scheduler.call_later(
+                self.PASS_ONE_AWAIT_TIME, self._finish_pass_one, self._pass_one_call_number + 1
+            )
+            self._pass_one_call_number += 1
+            return self._pass_one_call
+
+    def _finish_pass_one(self, pass_one_call_number):
+        with self.mutex:
+            # lock may be closed and passed again while this call was waiting for the mutex
+            if pass_one_call_number != self._pass_one_call_number or self._pass_one_call is None:
+                return
+            self._pass_one_call = None
+            GPIO.output(self.out_port, GPIO.LOW)
+            self.state = LockState.CLOSED
 
 
 if __name__ == "__main__":
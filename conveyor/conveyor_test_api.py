@@ -50,7 +50,8 @@ modules = {
 with patch.dict("sys.modules", modules):
     import RPi.GPIO as GPIO
 
-    from conveyor.conveyor_hardware_api import Lock, Conveyor, ConveyorState, LockState
+    from conveyor.scheduler import Scheduler, VirtualScheduler
+    from conveyor.conveyor_hardware_api import Lock, Conveyor, ConveyorState, LockState, OccupancyTracker
 
 
 class TestLock(TestCase):
@@ -91,6 +92,122 @@ class TestLock(TestCase):
         self.assertEqual(self.lock.state, LockState.CLOSED, "Lock state is incorrect")
 
 
+class TestScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = Scheduler()
+
+    def test_calls_order(self):
+        calls = []
+        self.scheduler.call_later(0.2, calls.append, 2)
+        first_call = self.scheduler.call_later(0.1, calls.append, 1)
+        cancelled_call = self.scheduler.call_later(0.15, calls.append, 3)
+        self.assertTrue(cancelled_call.cancel(), "Call has not been cancelled")
+        first_call.result(timeout=1)
+        self.assertEqual(calls, [1], "Calls are incorrect")
+        sleep(0.2)
+        self.assertEqual(calls, [1, 2], "Calls are incorrect")
+
+    def test_pass_one_handle(self):
+        lock = Lock('ZYL.1', 4, 18, scheduler=self.scheduler)
+        pass_one_call = lock.pass_one()
+        self.assertEqual(lock.state, LockState.OPEN, "Lock state is incorrect")
+        self.assertIsNone(lock.pass_one(), "Opened lock can't pass one")
+        pass_one_call.result(timeout=lock.PASS_ONE_AWAIT_TIME + 1)
+        self.assertEqual(lock.state, LockState.CLOSED, "Lock state is incorrect")
+
+    def test_close_cancels_pass_one(self):
+        lock = Lock('ZYL.1', 4, 18, scheduler=self.scheduler)
+        pass_one_call = lock.pass_one()
+        lock.close()
+        self.assertTrue(pass_one_call.cancelled(), "Pass one has not been cancelled")
+        self.assertEqual(lock.state, LockState.CLOSED, "Lock state is incorrect")
+
+
+class TestVirtualScheduler(TestCase):
+
+    def setUp(self):
+        self.scheduler = VirtualScheduler()
+
+    def test_calls_order(self):
+        calls = []
+        self.scheduler.call_later(20, calls.append, 2)
+        self.scheduler.call_later(10, lambda: calls.append(1) or self.scheduler.call_later(5, calls.append, 4))
+        self.scheduler.call_later(10, calls.append, 3)
+        self.scheduler.run_until(15)
+        self.assertEqual(calls, [1, 3, 4], "Calls are incorrect")
+        self.assertEqual(self.scheduler.time(), 15, "Simulated time is incorrect")
+        self.scheduler.run_for(10)
+        self.assertEqual(calls, [1, 3, 4, 2], "Calls are incorrect")
+
+    def test_pass_one_handle(self):
+        lock = Lock('ZYL.1', 4, 18, scheduler=self.scheduler)
+        pass_one_call = lock.pass_one()
+        self.scheduler.run_for(lock.PASS_ONE_AWAIT_TIME / 2)
+        self.assertEqual(lock.state, LockState.OPEN, "Lock state is incorrect")
+        self.scheduler.run_for(lock.PASS_ONE_AWAIT_TIME)
+        self.assertTrue(pass_one_call.done(), "Pass one has not been finished")
+        self.assertEqual(lock.state, LockState.CLOSED, "Lock state is incorrect")
+
+
+class TestOccupancyTracker(TestCase):
+
+    def setUp(self):
+        self.locks = [Lock('ZYL.1', 4, 18), Lock('ZYL.2', 17, 23)]
+        self.tracker = OccupancyTracker(self.locks, debounce_time=0.03, poll_interval=0.01)
+        self.transitions = []
+        self.tracker.subscribe(lambda lock, is_busy, transition_time: self.transitions.append((lock.name, is_busy)))
+        self.tracker.start()
+
+    def tearDown(self):
+        self.tracker.stop()
+
+    def test_lock_is_busy_from_cache(self):
+        self.assertFalse(self.tracker.is_edge_triggered, "GPIO mock has no edge callbacks")
+        self.assertEqual(self.locks[0].is_busy, False, "Lock is_busy value is incorrect")
+        self.assertIsNone(self.locks[0].last_transition_time, "Lock has no transitions yet")
+        with patch.object(GPIOMock, 'input', staticmethod(lambda port: 1 if port == 4 else 0)):
+            sleep(0.2)
+        self.assertEqual(self.locks[0].is_busy, True, "Lock is_busy value is incorrect")
+        self.assertEqual(self.locks[1].is_busy, False, "Lock is_busy value is incorrect")
+        self.assertIsNotNone(self.locks[0].last_transition_time, "Lock transition time is not stored")
+        self.assertEqual(self.transitions, [("zyl.1", True)], "Transitions are incorrect")
+
+    def test_debounce(self):
+        with patch.object(GPIOMock, 'input', staticmethod(lambda port: 1)):
+            sleep(0.015)
+        sleep(0.1)
+        self.assertEqual(self.locks[0].is_busy, False, "Bounce has been accepted")
+        self.assertEqual(self.transitions, [], "Transitions are incorrect")
+
+
+class TestOccupancyTrackerEdges(TestCase):
+
+    def setUp(self):
+        self.scheduler = VirtualScheduler()
+        self.locks = [Lock('ZYL.1', 4, 18)]
+        self.tracker = OccupancyTracker(self.locks, debounce_time=0.03, scheduler=self.scheduler)
+        self.transitions = []
+        self.tracker.subscribe(lambda lock, is_busy, transition_time: self.transitions.append(is_busy))
+
+    def test_bounce_ended_in_window(self):
+        with patch.object(GPIOMock, 'input', staticmethod(lambda port: 1)):
+            self.tracker._on_edge(4)
+        self.scheduler.run_for(0.1)
+        self.assertEqual(self.locks[0].is_busy, False, "Bounce has been accepted")
+        self.assertEqual(self.transitions, [], "Transitions are incorrect")
+
+    def test_last_edge_swallowed(self):
+        with patch.object(GPIOMock, 'input', staticmethod(lambda port: 0)):
+            self.tracker._on_edge(4)
+        with patch.object(GPIOMock, 'input', staticmethod(lambda port: 1)):
+            self.scheduler.run_for(0.02)
+            self.assertEqual(self.locks[0].is_busy, False, "Level has been accepted before debounce_time")
+            self.scheduler.run_for(0.1)
+        self.assertEqual(self.locks[0].is_busy, True, "Stable level has not been accepted")
+        self.assertEqual(self.transitions, [True], "Transitions are incorrect")
+
+
 class TestConveyor(TestCase):
 
     def setUp(self):
@@ -98,6 +215,9 @@ class TestConveyor(TestCase):
             [Lock("ZYL.1", 4, 18), Lock("ZYL.2", 17, 23), Lock("ZYL.3", 27, 24), Lock("ZYL.4", 22, 25)]
         )
 
+    def tearDown(self):
+        self.cv.cleanup()
+
     def test_conveyor_state(self):
         self.assertEqual(self.cv.state, ConveyorState.ENABLED, "Conveyor state is incorrect")
 
@@ -153,3 +273,49 @@ class TestConveyor(TestCase):
         expected_locks_state = [LockState.CLOSED, LockState.CLOSED, LockState.CLOSED, LockState.CLOSED]
 
         self.assertEqual(locks_state, expected_locks_state, "Locks states are incorrect")
+
+    def test_conveyor_locks_open_close(self):
+        self.cv.locks_open([1, "zyl.3"])
+        locks_state = [state for lock, state in self.cv.locks_state()]
+        expected_locks_state = [LockState.OPEN, LockState.CLOSED, LockState.OPEN, LockState.CLOSED]
+        self.assertEqual(locks_state, expected_locks_state, "Locks states are incorrect")
+        self.cv.locks_close([1, 3])
+        locks_state = [state for lock, state in self.cv.locks_state()]
+        expected_locks_state = [LockState.CLOSED, LockState.CLOSED, LockState.CLOSED, LockState.CLOSED]
+        self.assertEqual(locks_state, expected_locks_state, "Locks states are incorrect")
+
+    def test_conveyor_locks_full_state(self):
+        locks_full_state = [(state, is_busy) for lock, state, is_busy in self.cv.locks_full_state([2, "zyl.4"])]
+        expected_locks_full_state = [(LockState.CLOSED, False), (LockState.CLOSED, False)]
+        self.assertEqual(locks_full_state, expected_locks_full_state, "Locks states are incorrect")
+
+    def test_conveyor_map_locks(self):
+        self.cv.map_locks(self.cv.lock_open, [1, "zyl.2", 3, 1])
+        locks_state = [state for lock, state in self.cv.locks_state()]
+        expected_locks_state = [LockState.OPEN, LockState.OPEN, LockState.OPEN, LockState.CLOSED]
+        self.assertEqual(locks_state, expected_locks_state, "Locks states are incorrect")
+
+    def test_conveyor_add_remove_lock(self):
+        lock = self.cv.add_lock(Lock("ZYL.5", 5, 6))
+        self.assertEqual(lock.id, 5, "Lock id is incorrect")
+        self.assertIs(self.cv.lock_state("ZYL.5").lock, lock, "Lock is not found by name")
+        self.cv.remove_lock(2)
+        self.assertFalse(self.cv.has_lock_id(2), "Lock has not been removed")
+        self.assertFalse(self.cv.has_lock_name("zyl.2"), "Lock has not been removed")
+        self.assertEqual([lock.id for lock in self.cv.locks], [1, 3, 4, 5], "Locks ids are incorrect")
+        self.assertEqual(self.cv.add_lock(Lock("ZYL.2", 17, 23)).id, 6, "Lock id is incorrect")
+        with self.assertRaises(ValueError):
+            self.cv.add_lock(Lock("zyl.1", 4, 18))
+
+    def test_conveyor_snapshot(self):
+        snapshot = self.cv.snapshot()
+        self.assertIs(self.cv.snapshot(), snapshot, "Snapshot has not been cached")
+        self.assertEqual(snapshot.state, ConveyorState.ENABLED, "Conveyor state is incorrect")
+        self.assertEqual([lock.state for lock in snapshot.locks], [LockState.CLOSED] * 4, "Locks states are incorrect")
+        self.cv.lock_open(2)
+        new_snapshot = self.cv.snapshot()
+        self.assertGreater(new_snapshot.version, snapshot.version, "Snapshot version has not been increased")
+        self.assertEqual(new_snapshot.locks[1].state, LockState.OPEN, "Lock state is incorrect")
+        self.assertEqual(snapshot.locks[1].state, LockState.CLOSED, "Old snapshot has been changed")
+        with self.assertRaises(AttributeError):
+            new_snapshot.locks[1].state = LockState.CLOSED
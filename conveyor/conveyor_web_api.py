@@ -1,66 +1,56 @@
-from flask import Flask, Blueprint, jsonify, request, make_response
+from concurrent import futures
+
+from flask import Flask, Blueprint, Response, jsonify, request, make_response
 from flask_cors import CORS
-from multiprocessing.pool import ThreadPool
 
-from conveyor.conveyor_hardware_api import Conveyor, Lock
+from common.change_feed import StreamSlots, sse_stream, parse_since
+from conveyor.conveyor_web_common import cv, conveyor_feed, conveyor_api_url_prefix, PASS_ONE_MAX_WAIT_TIME, \
+    validate_lock_id_or_name, select_snapshot_locks, lock_snapshot_json, snapshot_etag
 
 
 app = Flask(__name__)
-CORS(app)
-
-conveyor_api = Blueprint('conveyor_api', __name__, url_prefix='/api/v1/conveyor')
-
-cv = Conveyor([Lock('ZYL.1', 4, 18), Lock('ZYL.2', 17, 23), Lock('ZYL.3', 27, 24), Lock('ZYL.4', 22, 25)])
-
-
-def _validate_lock_id_or_name(request_json):
-    try:
-        lock_ids = request_json.get("ids")
-        lock_names = request_json.get("names")
-    except AttributeError:
-        lock_ids = None
-        lock_names = None
-    error = None
-    unknown_locks = []
-    if lock_ids:
-        parameter = lock_ids
-        parameter_name = "ids"
-        conveyor_lock_ids = [lock.id for lock in cv.locks]
-        for lock_id in lock_ids:
-            if lock_id not in conveyor_lock_ids:
-                unknown_locks.append(lock_id)
-    elif lock_names:
-        parameter = lock_names
-        parameter_name = "names"
-        conveyor_lock_names = [lock.name for lock in cv.locks]
-        for lock_name in lock_names:
-            if lock_name not in conveyor_lock_names:
-                unknown_locks.append(lock_name)
+# ETag is needed by the pollers for If-None-Match
+CORS(app, expose_headers=['ETag'])
+
+conveyor_api = Blueprint('conveyor_api', __name__, url_prefix=conveyor_api_url_prefix)
+
+# each /stream client holds a worker thread, the rest of them are for the requests. The ASGI app has no limit
+STREAM_MAX_CLIENTS = 8
+stream_slots = StreamSlots(STREAM_MAX_CLIENTS)
+
+
+def _is_not_modified(etag):
+    """ Client has this response already: it sent its ETag in If-None-Match of GET """
+    return request.method == "GET" and request.if_none_match.contains(etag)
+
+
+def _make_snapshot_response(resp_json, etag):
+    """ Response with the snapshot ETag, 304 without a body if client has this response already """
+    if resp_json is None:
+        response = make_response("", 304)
     else:
-        parameter = None
-        parameter_name = None
-        error = "No data was sent"
-    if unknown_locks:
-            error = "Locks with {}:{} are not attached to conveyor".format(parameter_name, unknown_locks)
-    return error, parameter
+        response = make_response(jsonify(resp_json), 200)
+    response.set_etag(etag)
+    return response
 
 
 @conveyor_api.route("/locks/status", methods=["GET", "POST"])
 def locks_status():
     params = request.json
-    error, locks = _validate_lock_id_or_name(params)
+    error, locks = validate_lock_id_or_name(params)
+    if not error:
+        snapshot = cv.snapshot()
+        error, selected_locks = select_snapshot_locks(snapshot, locks)
     if not error:
+        etag = snapshot_etag(snapshot, selected_locks)
+        if _is_not_modified(etag):
+            return _make_snapshot_response(None, etag)
         resp_json = {
             "status": 200, "body": [
-                {
-                    "id": cv.lock_state(lock).lock.id,
-                    "name": cv.lock_state(lock).lock.name,
-                    "status": cv.lock_state(lock).state.name,
-                    "is_busy": cv.lock_state(lock).lock.is_busy,
-                } for lock in locks
+                lock_snapshot_json(lock) for lock in selected_locks
                 ]
             }
-        return make_response(jsonify(resp_json), 200)
+        return _make_snapshot_response(resp_json, etag)
     else:
         resp_json = {"status": 400, "body": error}
         return make_response(jsonify(resp_json), 400)
@@ -69,16 +59,13 @@ def locks_status():
 @conveyor_api.route("/locks/open", methods=["GET", "POST"])
 def locks_open():
     params = request.json
-    error, locks = _validate_lock_id_or_name(params)
+    error, locks = validate_lock_id_or_name(params)
     if not error:
-        p = ThreadPool(len(cv.locks))
-        p.map(cv.lock_open, tuple(locks))
-        p.close()
-        p.join()
+        cv.map_locks(cv.lock_open, locks)
         resp_json = {
             "status": 200, "body": {
-                "lock(id:{}, name: {})".format(cv.lock_state(lock).lock.id, cv.lock_state(lock).lock.name):
-                    "Has been opened" for lock in locks
+                "lock(id:{}, name: {})".format(lock.id, lock.name): "Has been opened"
+                for lock, _ in cv.locks_state(locks)
             }
         }
         return make_response(jsonify(resp_json), 200)
@@ -90,16 +77,13 @@ def locks_open():
 @conveyor_api.route("/locks/close", methods=["GET", "POST"])
 def locks_close():
     params = request.json
-    error, locks = _validate_lock_id_or_name(params)
+    error, locks = validate_lock_id_or_name(params)
     if not error:
-        p = ThreadPool(len(cv.locks))
-        p.map(cv.lock_close, tuple(locks))
-        p.close()
-        p.join()
+        cv.map_locks(cv.lock_close, locks)
         resp_json = {
             "status": 200, "body": {
-                "lock(id:{}, name: {})".format(cv.lock_state(lock).lock.id, cv.lock_state(lock).lock.name):
-                    "Has been closed" for lock in locks
+                "lock(id:{}, name: {})".format(lock.id, lock.name): "Has been closed"
+                for lock, _ in cv.locks_state(locks)
             }
         }
         return make_response(jsonify(resp_json), 200)
@@ -111,16 +95,16 @@ def locks_close():
 @conveyor_api.route("/locks/pass_one", methods=["GET", "POST"])
 def locks_pass_one():
     params = request.json
-    error, locks = _validate_lock_id_or_name(params)
+    error, locks = validate_lock_id_or_name(params)
     if not error:
-        p = ThreadPool(len(cv.locks))
-        p.map(cv.lock_pass_one, tuple(locks))
-        p.close()
-        p.join()
+        # locks are closed by the scheduler, so it returns immediately
+        pass_one_calls = [cv.lock_pass_one(lock) for lock in locks]
+        if params.get("wait"):
+            futures.wait([call for call in pass_one_calls if call is not None], timeout=PASS_ONE_MAX_WAIT_TIME)
         resp_json = {
             "status": 200, "body": {
-                "lock(id:{}, name: {})".format(cv.lock_state(lock).lock.id, cv.lock_state(lock).lock.name):
-                    "Car has been released" for lock in locks
+                "lock(id:{}, name: {})".format(lock.id, lock.name): "Car has been released"
+                for lock, _ in cv.locks_state(locks)
             }
         }
         return make_response(jsonify(resp_json), 200)
@@ -131,19 +115,34 @@ def locks_pass_one():
 
 @conveyor_api.route("/status", methods=["GET", "POST"])
 def conveyor_status():
+    snapshot = cv.snapshot()
+    etag = snapshot_etag(snapshot)
+    if _is_not_modified(etag):
+        return _make_snapshot_response(None, etag)
     resp_json = {
         "status": 200, "body": {
-            "conveyor_state": cv.state.name, "locks_state": [
-                {
-                    "id": lock.lock.id,
-                    "name": lock.lock.name,
-                    "status": lock.state.name,
-                    "is_busy": lock.lock.is_busy,
-                } for lock in cv.locks_state()
-            ]
+            "conveyor_state": snapshot.state.name,
+            "locks_state": [lock_snapshot_json(lock) for lock in snapshot.locks],
         }
     }
-    return make_response(jsonify(resp_json), 200)
+    return _make_snapshot_response(resp_json, etag)
+
+
+@conveyor_api.route("/stream", methods=["GET"])
+def conveyor_stream():
+    """
+    Server-Sent Events stream of the conveyor state: "state" event with the whole state at first,
+    then "delta" events with changed keys ("conveyor_state", "lock/<id>"). Resumes from Last-Event-ID or ?since=
+    """
+    since = parse_since(conveyor_feed, request.headers.get("Last-Event-ID"), request.args.get("since"))
+    events = stream_slots.stream(sse_stream(conveyor_feed, since))
+    if events is None:
+        resp_json = {
+            "status": 503, "body": "There are {} streams already, use the ASGI app".format(STREAM_MAX_CLIENTS)
+        }
+        return make_response(jsonify(resp_json), 503, {"Retry-After": "5"})
+    return Response(events, mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 
 app.register_blueprint(conveyor_api)
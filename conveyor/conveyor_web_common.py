@@ -0,0 +1,100 @@
+"""
+Conveyor of the web apps (flask and ASGI ones): its construction, the state feed, the request validator and
+the lock serialiser, so both apps serve the same /api/v1/conveyor/* responses
+"""
+import uuid
+
+from common.change_feed import ChangeFeed
+from conveyor.conveyor_hardware_api import Conveyor, Lock
+
+conveyor_api_url_prefix = '/api/v1/conveyor'
+
+# long-poll limit for pass_one with "wait"
+PASS_ONE_MAX_WAIT_TIME = 5
+
+# snapshot version starts over with the process, so the ETag of the previous one must not match
+BOOT_ID = uuid.uuid4().hex[:8]
+
+cv = Conveyor([Lock('ZYL.1', 4, 18), Lock('ZYL.2', 17, 23), Lock('ZYL.3', 27, 24), Lock('ZYL.4', 22, 25)])
+
+
+def validate_lock_id_or_name(request_json):
+    try:
+        lock_ids = request_json.get("ids")
+        lock_names = request_json.get("names")
+    except AttributeError:
+        lock_ids = None
+        lock_names = None
+    error = None
+    unknown_locks = []
+    if lock_ids:
+        parameter = lock_ids
+        parameter_name = "ids"
+        for lock_id in lock_ids:
+            if not cv.has_lock_id(lock_id):
+                unknown_locks.append(lock_id)
+    elif lock_names:
+        parameter = lock_names
+        parameter_name = "names"
+        for lock_name in lock_names:
+            if not cv.has_lock_name(lock_name):
+                unknown_locks.append(lock_name)
+    else:
+        parameter = None
+        parameter_name = None
+        error = "No data was sent"
+    if unknown_locks:
+            error = "Locks with {}:{} are not attached to conveyor".format(parameter_name, unknown_locks)
+    return error, parameter
+
+
+def lock_snapshot_json(lock):
+    return {
+        "id": lock.id,
+        "name": lock.name,
+        "status": lock.state.name,
+        "is_busy": lock.is_busy,
+    }
+
+
+def select_snapshot_locks(snapshot, lock_identifiers):
+    """
+    Locks of the snapshot by the validated ids or names, so the ones detached after the validation are not looked
+    up in the conveyor. Returns error, if some of them are not in the snapshot, and the locks
+    """
+    locks_by_id = {lock.id: lock for lock in snapshot.locks}
+    locks_by_name = {lock.name.lower(): lock for lock in snapshot.locks}
+    locks = []
+    unknown_locks = []
+    for identifier in lock_identifiers:
+        if isinstance(identifier, str):
+            lock = locks_by_name.get(identifier.lower())
+        else:
+            lock = locks_by_id.get(identifier)
+        if lock is None:
+            unknown_locks.append(identifier)
+        else:
+            locks.append(lock)
+    if unknown_locks:
+        return "Locks {} are not attached to conveyor".format(unknown_locks), None
+    return None, locks
+
+
+def snapshot_etag(snapshot, locks=None):
+    """ ETag of the process and the snapshot version, with ids of the locks if the response has only these ones """
+    if locks is None:
+        return "{}-{}".format(BOOT_ID, snapshot.version)
+    return "{}-{}-{}".format(BOOT_ID, snapshot.version, ".".join(str(lock.id) for lock in locks))
+
+
+def _conveyor_feed_state():
+    snapshot = cv.snapshot()
+    state = {"conveyor_state": snapshot.state.name}
+    state.update(("lock/{}".format(lock.id), lock_snapshot_json(lock)) for lock in snapshot.locks)
+    return state
+
+
+# one producer of the state deltas for all the /stream clients
+conveyor_feed = ChangeFeed(_conveyor_feed_state)
+conveyor_feed.start()
+cv.subscribe(conveyor_feed.notify)
@@ -0,0 +1,108 @@
+import time
+import heapq
+import itertools
+import threading
+from concurrent.futures import Future
+
+
+class ScheduledCall(Future):
+    def __init__(self, when, fn, args):
+        """ Handle of the scheduled call. It's a Future, resolved by the result of the call """
+        super().__init__()
+        self.when = when
+        self.fn = fn
+        self.args = args
+
+
+class Scheduler:
+    def __init__(self):
+        """
+        Runs the calls at the given time in one daemon thread
+
+        Calls are stored in the heap ordered by time, so the thread sleeps till the nearest one.
+        Calls are executed one by one, so they must be short (like GPIO writes)
+        """
+        self._heap = []
+        self._counter = itertools.count()  # keeps FIFO order for the calls with the same time
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def call_later(self, delay, fn, *args) -> ScheduledCall:
+        """ Schedules fn(*args) in delay seconds. Doesn't block. Cancel it by ScheduledCall.cancel() """
+        call = ScheduledCall(time.monotonic() + delay, fn, args)
+        with self._condition:
+            heapq.heappush(self._heap, (call.when, next(self._counter), call))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return call
+
+    def __len__(self):
+        with self._condition:
+            return len(self._heap)
+
+    def _next_due_call(self):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    return heapq.heappop(self._heap)[-1]
+                timeout = self._heap[0][0] - now if self._heap else None
+                self._condition.wait(timeout)
+
+    def _run(self):
+        while True:
+            call = self._next_due_call()
+            if not call.set_running_or_notify_cancel():
+                continue  # has been cancelled
+            try:
+                call.set_result(call.fn(*call.args))
+            except BaseException as e:
+                call.set_exception(e)
+
+
+class VirtualScheduler:
+    def __init__(self, start=0.0):
+        """
+        Scheduler on the simulated clock, for the headless simulation
+
+        Same calls as Scheduler, but they are run by run_until() in the caller thread: the clock jumps from one call
+        to the next one, so hours of the simulation take seconds. Order is the same: by time, FIFO for the same time,
+        so the run is deterministic
+        """
+        self.now = start
+        self._heap = []
+        self._counter = itertools.count()
+
+    def time(self):
+        return self.now
+
+    def call_later(self, delay, fn, *args) -> ScheduledCall:
+        """ Schedules fn(*args) in delay simulated seconds. Cancel it by ScheduledCall.cancel() """
+        call = ScheduledCall(self.now + delay, fn, args)
+        heapq.heappush(self._heap, (call.when, next(self._counter), call))
+        return call
+
+    def __len__(self):
+        return len(self._heap)
+
+    def run_until(self, when):
+        """ Runs the calls due till the time, including the ones scheduled by them, then sets the clock to it """
+        while self._heap and self._heap[0][0] <= when:
+            call_time, _, call = heapq.heappop(self._heap)
+            self.now = max(self.now, call_time)
+            if not call.set_running_or_notify_cancel():
+                continue  # has been cancelled
+            try:
+                call.set_result(call.fn(*call.args))
+            except BaseException as e:
+                call.set_exception(e)
+        self.now = max(self.now, when)
+
+    def run_for(self, duration):
+        self.run_until(self.now + duration)
+
+
+# shared by the locks by default
+scheduler = Scheduler()
@@ -0,0 +1,225 @@
+import numpy as np
+
+from conveyor.simulation.simulation import Rail, Lock, StorageDeployPad, Diverter
+from conveyor.simulation.topology import Topology
+
+NO_PALETTE = -1
+# rank of the first palette going to the cell, when there is no one
+NO_FIRST_RANK = np.iinfo(np.int64).max
+
+
+class ArrayRail(Rail):
+    """ View of the ArrayWay cell with the Rail interface """
+    def __init__(self, way, position):
+        self.way = way
+        self.position = position
+
+    @property
+    def next_obj(self):
+        return self.way[int(self.way.next_cells[self.position])]
+
+    def is_empty(self):
+        return not self.way.occupied[self.position]
+
+
+class ArrayLock(ArrayRail, Lock):
+    """ View of the ArrayWay lock with the Lock interface """
+    @property
+    def is_closed(self):
+        return bool(self.way.closed[self.position])
+
+    @is_closed.setter
+    def is_closed(self, is_closed):
+        self.way.closed[self.position] = is_closed
+        self._state_changed()
+
+    @property
+    def is_pass_one(self):
+        return bool(self.way.pass_one[self.position])
+
+    @is_pass_one.setter
+    def is_pass_one(self, is_pass_one):
+        self.way.pass_one[self.position] = is_pass_one
+        self._state_changed()
+
+
+class ArrayStorageDeployPad(ArrayRail, StorageDeployPad):
+    """ View of the ArrayWay deploy pad with the StorageDeployPad interface """
+    @property
+    def is_picking_from(self):
+        return bool(self.way.picking_from[self.position])
+
+    @is_picking_from.setter
+    def is_picking_from(self, is_picking_from):
+        self.way.picking_from[self.position] = is_picking_from
+        self._state_changed()
+
+
+class ArrayDiverter(ArrayRail, Diverter):
+    """ View of the ArrayWay diverter with the Diverter interface """
+    @property
+    def next_objs(self):
+        return [self.way[position] for position in self.way.topology.next_positions[self.position]]
+
+    @property
+    def direction(self):
+        return self.way.topology.next_positions[self.position].index(int(self.way.next_cells[self.position]))
+
+    @direction.setter
+    def direction(self, direction):
+        next_positions = self.way.topology.next_positions[self.position]
+        if not 0 <= direction < len(next_positions):
+            raise ValueError(f'Unknown direction {direction} of the diverter')
+        self.way.next_cells[self.position] = next_positions[direction]
+        self._state_changed()
+
+
+class ArrayWay:
+    def __init__(self, locks_coords: [int] = None, conv_len: int = None, deploy_position: int = None,
+                 topology: Topology = None):
+        """
+        Assembly line container on NumPy arrays, the engine for the long lines with many palettes
+
+        Same line and the same moves as Way: occupancy, locks states and the deploy pad flag are the arrays
+        by the position, the palettes are the positions with their order of adding (rank). Tick is computed
+        for all the palettes at once. Way moves the palettes one by one in the order of adding, so the palette
+        moves if the cell ahead is free, or the palette there is moved earlier in the same tick (it's added earlier)
+        and is moved. The latter is the chain to the first palette of the train, it's resolved by pointer jumping.
+        At the merge the first of the palettes going to the cell takes it, the rest wait (the picked ones
+        before it are not blocked: they don't take the cell).
+        Elements (locks, deploy_pad, iteration) are the views with the Rail, Lock and StorageDeployPad interface,
+        the states are changed by them: if the tick has moved nothing, the next ones are skipped till the change
+        """
+        self.topology = topology or Topology.ring(locks_coords, conv_len, deploy_position)
+        self.locks_coords = self.topology.locks
+        self.way_len = len(self.topology) - 1
+        self.deploy_position = self.topology.pads[0]
+
+        size = len(self.topology)
+        # next cell of each one, by the direction for the diverters
+        self._default_next_cells = np.array([next_positions[0] for next_positions in self.topology.next_positions])
+        self.next_cells = self._default_next_cells.copy()
+        all_next_cells = [position for next_positions in self.topology.next_positions for position in next_positions]
+        self._has_merges = bool((np.bincount(all_next_cells, minlength=size) > 1).any())
+        self._first_ranks = np.full(size, NO_FIRST_RANK, dtype=np.int64)
+        self.occupied = np.zeros(size, dtype=bool)
+        self.ranks = np.full(size, NO_PALETTE, dtype=np.int64)
+        # locks are closed, the rest of the cells are always open
+        self.closed = np.zeros(size, dtype=bool)
+        self.closed[self.locks_coords] = True
+        self.pass_one = np.zeros(size, dtype=bool)
+        self.picking_from = np.zeros(size, dtype=bool)
+        self._next_rank = 0
+        # the last tick has moved nothing and nothing is changed since it: the next one would move nothing too
+        self._is_idle = False
+        # incremented on each change of the palettes or the elements states
+        self.version = 0
+        # positions of the changed elements (palette or the state) since the last take_changes()
+        self._changed = set(range(size))
+
+        self.locks: [ArrayLock] = [ArrayLock(self, position) for position in self.topology.locks]
+        # deploy_pad is the first of the deploy pads
+        self.deploy_pads: [ArrayStorageDeployPad] = [
+            ArrayStorageDeployPad(self, position) for position in self.topology.pads
+        ]
+        self.deploy_pad = self.deploy_pads[0]
+        self.diverters: [ArrayDiverter] = [ArrayDiverter(self, position) for position in self.topology.diverters]
+        self._way_container = [ArrayRail(self, position) for position in range(size)]
+        for element in (*self.locks, *self.deploy_pads, *self.diverters):
+            self._way_container[element.position] = element
+
+    def __iter__(self):
+        return iter(self._way_container)
+
+    def __getitem__(self, position):
+        return self._way_container[position]
+
+    def __len__(self):
+        return len(self._way_container)
+
+    def take_changes(self):
+        """ Positions of the elements changed since the last call """
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def wake(self, element: ArrayRail):
+        """ State of the element has been changed: the palettes may move """
+        self.version += 1
+        self._is_idle = False
+        self._changed.add(element.position)
+
+    def add_palette(self, position):
+        self.occupied[position] = True
+        self.ranks[position] = self._next_rank
+        self._next_rank += 1
+        self.wake(self[position])
+
+    @property
+    def palettes(self):
+        return self.positions()
+
+    def positions(self):
+        """ Positions of the palettes in the order they have been added """
+        positions = np.flatnonzero(self.occupied)
+        return positions[np.argsort(self.ranks[positions], kind='stable')].tolist()
+
+    def _moved(self):
+        """ Positions of the palettes moved (or picked) by this tick """
+        positions = np.flatnonzero(self.occupied)
+        next_cells = self.next_cells[positions]
+        ranks = self.ranks[positions]
+        # closed lock holds the palette, pass one lets it go; the palette ahead (if any) must be moved earlier
+        can_move = (~self.closed[positions] | self.pass_one[positions]) & (ranks > self.ranks[next_cells])
+        if self._has_merges:
+            # the first palette going to the cell takes it, only the picked ones before it may go as well
+            takes_cell = can_move & ~self.picking_from[positions]
+            np.minimum.at(self._first_ranks, next_cells[takes_cell], ranks[takes_cell])
+            can_move &= ranks <= self._first_ranks[next_cells]
+            self._first_ranks[next_cells[takes_cell]] = NO_FIRST_RANK
+        next_occupied = self.occupied[next_cells]
+        is_moved = can_move & ~next_occupied
+        # moved after the palette ahead: if it's moved, this one is too
+        follows = can_move & next_occupied
+        indexes = np.arange(positions.size)
+        chain_ends = np.where(follows, np.searchsorted(positions, next_cells), indexes)
+        while True:
+            next_chain_ends = chain_ends[chain_ends]
+            if np.array_equal(next_chain_ends, chain_ends):
+                break
+            chain_ends = next_chain_ends
+        return positions[is_moved[chain_ends]]
+
+    def tick(self):
+        """ Moves all the palettes by one step at once, as Way.tick() does. Returns count of the picked ones """
+        if self._is_idle:
+            return 0
+        moved = self._moved()
+        if not moved.size:
+            self._is_idle = True
+            return 0
+        self.version += 1
+        is_picked = self.picking_from[moved]
+        picked = moved[is_picked]
+        moved_forward = moved[~is_picked]
+        self.picking_from[picked] = False
+        self.pass_one[moved_forward] = False
+
+        ranks = self.ranks[moved_forward]
+        self.occupied[moved] = False
+        self.ranks[moved] = NO_PALETTE
+        destinations = self.next_cells[moved_forward]
+        self.occupied[destinations] = True
+        self.ranks[destinations] = ranks
+        self._changed.update(moved.tolist())
+        self._changed.update(destinations.tolist())
+        return int(picked.size)
+
+    def reset(self):
+        self.occupied[:] = False
+        self.ranks[:] = NO_PALETTE
+        self.closed[:] = False
+        self.closed[self.locks_coords] = True
+        self.pass_one[:] = False
+        self.next_cells[:] = self._default_next_cells
+        self.wake(self.deploy_pad)
+        self._changed.update(range(len(self)))
@@ -0,0 +1,84 @@
+import random
+from unittest import TestCase
+
+import conveyor.simulation.config as sim_conf
+from conveyor.simulation.simulation import Conveyor
+from conveyor.simulation.array_way import ArrayWay
+from conveyor.simulation.topology import Topology, Segment
+
+
+class TestArrayWay(TestCase):
+
+    def _conveyors(self, locks_coords=None, deploy_coord=None, conv_len=None, topology=None):
+        conveyors = [Conveyor(locks_coords, deploy_coord, conv_len, topology=topology),
+                     Conveyor(locks_coords, deploy_coord, conv_len, way_class=ArrayWay, topology=topology)]
+        for conveyor in conveyors:
+            self.addCleanup(conveyor.quit)
+        return conveyors
+
+    def _state(self, conveyor):
+        way = conveyor.way
+        return ([element.is_empty() for element in way],
+                [(lock.is_closed, lock.is_pass_one) for lock in way.locks],
+                [pad.is_picking_from for pad in way.deploy_pads],
+                [diverter.direction for diverter in way.diverters],
+                way.positions())
+
+    def _compare_random_traffic(self, locks_coords, deploy_coord, conv_len, palettes_count, ticks, seed,
+                                topology=None):
+        rng = random.Random(seed)
+        conveyors = self._conveyors(locks_coords, deploy_coord, conv_len, topology)
+        way = conveyors[0].way
+        for position in rng.sample(range(len(way)), palettes_count):
+            for conveyor in conveyors:
+                conveyor._add_palette(position)
+
+        for tick in range(ticks):
+            action = rng.choice(['open', 'close', 'pass_one', 'pick', 'place', 'divert', 'none'])
+            lock_index = rng.randrange(len(way.locks))
+            pad_index = rng.randrange(len(way.deploy_pads))
+            diverter = rng.randrange(len(way.diverters)) if way.diverters else None
+            direction = rng.randrange(2)
+            for conveyor in conveyors:
+                if action == 'open':
+                    conveyor.lock_open(lock_index)
+                elif action == 'close':
+                    conveyor.lock_close(lock_index)
+                elif action == 'pass_one':
+                    conveyor.lock_pass_one(lock_index)
+                elif action == 'pick':
+                    conveyor.pick_from_conveyor(pad_index)
+                elif action == 'place' and conveyor.way.deploy_pads[pad_index].is_empty():
+                    conveyor.place_to_conveyor(pad_index)
+                elif action == 'divert' and diverter is not None:
+                    conveyor.diverter_switch(diverter, direction)
+                conveyor._one_loop_tick()
+            self.assertEqual(self._state(conveyors[1]), self._state(conveyors[0]),
+                             f"State of the array engine is incorrect at the tick {tick}")
+
+    def test_default_line(self):
+        self._compare_random_traffic(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len,
+                                     palettes_count=12, ticks=300, seed=1)
+
+    def test_long_line(self):
+        locks_coords = list(range(0, 2000, 40))
+        self._compare_random_traffic(locks_coords, 1001, 1999, palettes_count=600, ticks=200, seed=2)
+
+    def test_topology(self):
+        # two loops joined by the transfer: merges at the starts of the main line and of the side loop
+        topology = Topology([
+            Segment('main', 40, ('back', 'side'), locks=(5, 20), pads=(30,)),
+            Segment('back', 20, 'main', locks=(10,)),
+            Segment('side', 30, ('main', 'side'), locks=(3,), pads=(15,)),
+        ])
+        self._compare_random_traffic(None, None, None, palettes_count=70, ticks=1000, seed=3, topology=topology)
+
+    def test_full_train(self):
+        conveyors = self._conveyors(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len)
+        for conveyor in conveyors:
+            # train added from the front to the back moves as a whole, from the back to the front it's split
+            for position in [20, 19, 18, 17, 25, 26, 27]:
+                conveyor._add_palette(position)
+            conveyor._one_loop_tick()
+        self.assertEqual(conveyors[1].way.positions(), [21, 20, 19, 18, 25, 26, 28], "Train moves are incorrect")
+        self.assertEqual(self._state(conveyors[1]), self._state(conveyors[0]), "State of the array engine is incorrect")
@@ -64,3 +64,8 @@ template_for_format = """\
 locks_coords_list = [0, 7, 15, 32]
 deploy_coord = 44
 conv_len = 54
+
+# headless traffic (headless.py): palettes deployed from the storage per hour, Poisson arrivals,
+# and the processing time at each lock, seconds, uniformly distributed
+arrival_rate = 60
+processing_time = (20, 60)
@@ -0,0 +1,69 @@
+"""
+Tick time of the simulation engines: Way (objects) vs ArrayWay (NumPy arrays)
+
+The ring of the given length with the lock each 40 cells, the palettes are spread randomly,
+half of the locks are open. Only the ticks are timed, the conveyor thread is not involved.
+The first ticks move most of the palettes, then they are timed again when all the palettes are stuck
+at the closed locks: the blocked ones are not tried. With several loops the cells are split to the loops
+joined by the transfers: each loop ends with the diverter to itself or to the next loop (half of them transfer),
+so there is the merge at the start of each loop.
+
+    python -m conveyor.simulation.engine_benchmark [cells count] [palettes count] [ticks] [loops]
+"""
+import sys
+import time
+import random
+
+from conveyor.simulation.simulation import Way
+from conveyor.simulation.array_way import ArrayWay
+from conveyor.simulation.topology import Topology, Segment
+
+LOCKS_STEP = 40
+
+
+def time_ticks(way, ticks):
+    start_time = time.perf_counter()
+    for _ in range(ticks):
+        way.tick()
+    return (time.perf_counter() - start_time) / ticks
+
+
+def cell_topology(cells_count, loops):
+    """ Loops of the same length joined by the transfers, a deploy pad on each one """
+    loop_len = cells_count // loops
+    return Topology([
+        Segment(f'loop {loop}', loop_len, (f'loop {loop}', f'loop {(loop + 1) % loops}'),
+                locks=tuple(range(0, loop_len - 1, LOCKS_STEP)), pads=(LOCKS_STEP // 2,))
+        for loop in range(loops)
+    ])
+
+
+def run(way_class, cells_count, palettes_count, ticks, seed=1, loops=1):
+    """ Returns mean tick time of the moving palettes and of the blocked line, seconds """
+    rng = random.Random(seed)
+    if loops > 1:
+        way = way_class(topology=cell_topology(cells_count, loops))
+    else:
+        way = way_class(list(range(0, cells_count, LOCKS_STEP)), cells_count - 1, 1)
+    for position in rng.sample(range(len(way)), palettes_count):
+        way.add_palette(position)
+    for lock in way.locks[::2]:
+        lock.is_closed = False
+    for diverter in way.diverters[::2]:
+        diverter.direction = 1
+
+    moving_time = time_ticks(way, ticks)
+    # full circle: all the palettes reach the closed locks
+    for _ in range(cells_count):
+        way.tick()
+    return moving_time, time_ticks(way, ticks)
+
+
+if __name__ == '__main__':
+    cells_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    palettes_count = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    ticks = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    loops = int(sys.argv[4]) if len(sys.argv) > 4 else 1
+    for name, way_class in [('objects', Way), ('arrays', ArrayWay)]:
+        moving_time, blocked_time = run(way_class, cells_count, palettes_count, ticks, loops=loops)
+        print(f'{name:>7}: {moving_time * 1e6:.0f} us per tick, {blocked_time * 1e6:.2f} us when blocked')
@@ -0,0 +1,125 @@
+"""
+Headless simulation of the conveyor traffic on the simulated clock, for the capacity planning
+
+Palettes come from the storage by Poisson process to the backlog and are deployed to the free deploy pad.
+Each lock is the station: the palette there is processed for the random time, then the lock passes it.
+Palette back at the deploy pad is taken to the storage. Everything runs on VirtualScheduler in one thread,
+so the run is deterministic by the seed, and a day takes seconds.
+
+    python -m conveyor.simulation.headless [hours] [seed] [arrival rate, palettes/h] [--arrays]
+"""
+import sys
+import time
+import random
+
+import conveyor.simulation.config as sim_conf
+from conveyor.scheduler import VirtualScheduler
+from conveyor.simulation.simulation import Conveyor, Way
+
+
+class Traffic:
+    def __init__(self, conveyor: Conveyor, scheduler: VirtualScheduler, rng: random.Random,
+                 arrival_rate=sim_conf.arrival_rate, processing_time=sim_conf.processing_time):
+        """ Palettes arrivals, stations at the locks and the deploy pad control, checked after each tick """
+        self.conveyor = conveyor
+        self.scheduler = scheduler
+        self.rng = rng
+        self.arrival_rate = arrival_rate
+        self.processing_time = processing_time
+        # palettes waiting in the storage to be deployed
+        self.backlog = 0
+        self.placed_count = 0
+        self.ticks_count = 0
+        self.backlog_sum = 0
+        self.max_backlog = 0
+        self.on_line_sum = 0
+        self.locks_busy_ticks = [0] * len(conveyor.way.locks)
+        self._processing = set()  # indexes of the locks, which stations are busy
+        self._is_placed_on_pad = False  # the palette on the pad is the deployed one, not the returned one
+
+    def start(self):
+        self.scheduler.call_later(self.rng.expovariate(self.arrival_rate / 3600), self._arrive)
+        # after the conveyor tick of the same time
+        self.scheduler.call_later(self.conveyor.sim_speed_delay, self._control)
+
+    def _arrive(self):
+        self.backlog += 1
+        self.scheduler.call_later(self.rng.expovariate(self.arrival_rate / 3600), self._arrive)
+
+    def _processed(self, lock_index):
+        self._processing.discard(lock_index)
+        self.conveyor.lock_pass_one(lock_index)
+
+    def _control(self):
+        way = self.conveyor.way
+        pad = way.deploy_pad
+        if pad.is_empty():
+            self._is_placed_on_pad = False
+            if self.backlog and not pad.is_picking_from:
+                self.conveyor.place_to_conveyor()
+                self.backlog -= 1
+                self.placed_count += 1
+                self._is_placed_on_pad = True
+        elif not self._is_placed_on_pad and not pad.is_picking_from:
+            self.conveyor.pick_from_conveyor()
+
+        for lock_index, lock in enumerate(way.locks):
+            if lock.is_empty():
+                continue
+            self.locks_busy_ticks[lock_index] += 1
+            if lock.is_closed and not lock.is_pass_one and lock_index not in self._processing:
+                self._processing.add(lock_index)
+                self.scheduler.call_later(self.rng.uniform(*self.processing_time), self._processed, lock_index)
+
+        self.ticks_count += 1
+        self.backlog_sum += self.backlog
+        self.max_backlog = max(self.max_backlog, self.backlog)
+        self.on_line_sum += self.placed_count - self.conveyor.picked_count
+        self.scheduler.call_later(self.conveyor.sim_speed_delay, self._control)
+
+
+def run(hours, seed=1, arrival_rate=sim_conf.arrival_rate, processing_time=sim_conf.processing_time, way_class=Way,
+        locks_coords=sim_conf.locks_coords_list, deploy_coord=sim_conf.deploy_coord, conv_len=sim_conf.conv_len):
+    """ Simulates the hours of the traffic. Returns the report """
+    scheduler = VirtualScheduler()
+    conveyor = Conveyor(locks_coords, deploy_coord, conv_len, way_class, scheduler=scheduler)
+    conveyor.start_assembly_line()
+    traffic = Traffic(conveyor, scheduler, random.Random(seed), arrival_rate, processing_time)
+    traffic.start()
+
+    start_time = time.perf_counter()
+    scheduler.run_for(hours * 3600)
+    wall_time = time.perf_counter() - start_time
+    conveyor.quit()
+
+    ticks_count = max(traffic.ticks_count, 1)
+    return {
+        'placed': traffic.placed_count,
+        'picked': conveyor.picked_count,
+        'throughput': conveyor.picked_count / hours,
+        'mean_backlog': traffic.backlog_sum / ticks_count,
+        'max_backlog': traffic.max_backlog,
+        'mean_on_line': traffic.on_line_sum / ticks_count,
+        'locks_busy': [busy_ticks / ticks_count for busy_ticks in traffic.locks_busy_ticks],
+        'wall_time': wall_time,
+    }
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    hours = float(args[0]) if len(args) > 0 else 24
+    seed = int(args[1]) if len(args) > 1 else 1
+    arrival_rate = float(args[2]) if len(args) > 2 else sim_conf.arrival_rate
+    if '--arrays' in sys.argv:
+        from conveyor.simulation.array_way import ArrayWay
+        way_class = ArrayWay
+    else:
+        way_class = Way
+
+    report = run(hours, seed, arrival_rate, way_class=way_class)
+    print(f'{hours:g} h simulated in {report["wall_time"]:.1f} s, seed {seed}, arrivals {arrival_rate:g} palettes/h')
+    print(f'palettes: {report["placed"]} deployed, {report["picked"]} taken back, '
+          f'{report["throughput"]:.1f} per hour')
+    print(f'backlog: mean {report["mean_backlog"]:.1f}, max {report["max_backlog"]}; '
+          f'on the line: mean {report["mean_on_line"]:.1f}')
+    print('locks busy: ' + ', '.join(f'{share:.0%}' for share in report['locks_busy']))
@@ -0,0 +1,16 @@
+from unittest import TestCase
+
+from conveyor.simulation import headless
+from conveyor.simulation.array_way import ArrayWay
+
+
+class TestHeadless(TestCase):
+
+    def test_deterministic(self):
+        reports = [headless.run(2, seed=3), headless.run(2, seed=3), headless.run(2, seed=3, way_class=ArrayWay)]
+        for report in reports:
+            del report['wall_time']
+        self.assertGreater(reports[0]['picked'], 0, "Palettes have not been taken back")
+        self.assertEqual(reports[1], reports[0], "Run with the same seed is different")
+        self.assertEqual(reports[2], reports[0], "Array engine run is different")
+        self.assertNotEqual(headless.run(2, seed=4)['placed'], reports[0]['placed'], "Seed is not used")
@@ -1,4 +1,5 @@
 import queue
+import socket
 import threading
 import socketserver
 
@@ -6,25 +7,62 @@ from conveyor.simulation.simulation import Conveyor
 
 
 class Listener:
+    REQUEST_ID_PREFIX = b'#'
+
     # TODO: handle conveyor start/stop. out_port = 7
-    def __init__(self, locks_conf: [str, int, int], conveyor: Conveyor=None):
+    def __init__(self, locks_conf: [str, int, int], conveyor: Conveyor=None, pads_conf: [str, int, int]=(),
+                 diverters_conf: [str, int]=()):
         """
         Base simulation listener class
 
         Must handle commands like:
             - OUTPUT <out_port(int)> <value(0|1)>
             - INPUT <in_port(int)>
+            - OUTPUTS <out_port(int)>:<value(0|1)> [<out_port(int)>:<value(0|1)> ...]
+            - INPUTS <in_port(int)> [<in_port(int)> ...]
+
+        Batch commands OUTPUTS/INPUTS are applied/captured atomically in one simulation step
+
+        that works with GPI-mock and operates with Conveyor simulation locks.
 
-        that works with GPI-mock and operates with Conveyor simulation locks
+        Command may be prefixed with the request id: ``#<id> <command>``.
+        Such requests are session requests: response is ``#<id> <result>\\n``, and the connection stays open
+        for the next commands, so client can pipeline them. Commands without id are one-shot requests:
+        response is bare ``<result>`` and the connection is closed after it.
+
+        Ports of the deploy pads (pads_conf) are like the locks ones: in is the occupancy, out is taking
+        the palette to the storage. Diverters (diverters_conf) have the out port only, its value is the direction.
         """
         self.conveyor = conveyor
         self.command_map = {
             'OUTPUT': self.handle_output,
-            'INPUT': self.handle_input
+            'INPUT': self.handle_input,
+            'OUTPUTS': self.handle_outputs,
+            'INPUTS': self.handle_inputs,
         }
-        self.in_ports, self.out_ports = zip(*[(in_p, out_p) for _, in_p, out_p in locks_conf])
+        # port -> (elements of the way: 'locks', 'deploy_pads' or 'diverters', index of the element)
+        self.in_ports = {}
+        self.out_ports = {}
+        for elements, elements_conf in [('locks', locks_conf), ('deploy_pads', pads_conf)]:
+            for index, (_, in_port, out_port) in enumerate(elements_conf):
+                self._add_port(self.in_ports, in_port, elements, index)
+                self._add_port(self.out_ports, out_port, elements, index)
+        for index, (_, out_port) in enumerate(diverters_conf):
+            self._add_port(self.out_ports, out_port, 'diverters', index)
         self.handle_queue = queue.Queue()
 
+    @staticmethod
+    def _add_port(ports, port, elements, index):
+        if port in ports:
+            raise ValueError(f'Port {port} is used twice')
+        ports[port] = (elements, index)
+
+    @staticmethod
+    def _port_element(ports, port):
+        if port not in ports:
+            raise ValueError(f'Unknown port {port}')
+        return ports[port]
+
     def fetch_conveyor(self, conveyor: Conveyor):
         self.conveyor = conveyor
 
@@ -41,19 +79,48 @@ class Listener:
         self.handle_queue.put(f'<- Response: {result.decode("utf8")}\n')
         return result
 
+    def handle_line(self, line: bytes):
+        """
+        Protocol framing. Handles one received line
+
+        :return: (response, keep_alive) pair, keep_alive is False for one-shot requests
+        """
+        if line.startswith(self.REQUEST_ID_PREFIX):
+            request_id, _, data = line.partition(b' ')
+            return b'%s %s\n' % (request_id, self.handler(data)), True
+        return self.handler(line), False
+
     def handle_output(self, out_port, value):
-        """ Open/Close lock """
-        out_port, value = int(out_port), int(value)
-        action_map = {1: self.conveyor.lock_open,
-                      0: self.conveyor.lock_close}
-        action_map[value](self.out_ports.index(out_port))
-        return b'OK'
+        """ Open/Close lock, take the palette from the deploy pad or switch the diverter """
+        return self.handle_outputs(f'{out_port}:{value}')
 
     def handle_input(self, in_port):
-        """ Get status of the lock """
-        in_port = int(in_port)
-        lock_status = self.conveyor.way.locks[self.in_ports.index(in_port)].is_empty()
-        return str(int(not lock_status)).encode('utf8')  # 'not' is for inverting
+        """ Get status of the lock or the deploy pad """
+        return self.handle_inputs(in_port)
+
+    def handle_outputs(self, *ports_values):
+        """ Set several outputs at once """
+        outputs = {'locks': {}, 'deploy_pads': {}, 'diverters': {}}
+        for port_value in ports_values:
+            out_port, value = port_value.split(':')
+            out_port, value = int(out_port), int(value)
+            elements, index = self._port_element(self.out_ports, out_port)
+            if elements != 'diverters' and value not in (0, 1):
+                raise ValueError(f'Unknown value {value} for out_port {out_port}')
+            outputs[elements][index] = value
+        self.conveyor.set_outputs({index: bool(value) for index, value in outputs['locks'].items()},
+                                  {index: bool(value) for index, value in outputs['deploy_pads'].items()},
+                                  outputs['diverters'])
+        return b'OK'
+
+    def handle_inputs(self, *in_ports):
+        """ Get statuses of several locks and deploy pads """
+        positions = []
+        for in_port in in_ports:
+            elements, index = self._port_element(self.in_ports, int(in_port))
+            positions.append(getattr(self.conveyor.way, elements)[index].position)
+        is_busy = self.conveyor.positions_is_busy(positions)
+        return ' '.join(str(int(element_is_busy)) for element_is_busy in is_busy).encode('utf8')
 
     def start(self):
         if self.conveyor is not None:
@@ -70,22 +137,49 @@ class Listener:
 
 
 class SocketServerListener(Listener):
-    def __init__(self, locks_conf: [str, int, int], conveyor: Conveyor=None, host='localhost', port=42024):
-        """ Listener based on the simple socketserver in the thread """
-        super().__init__(locks_conf, conveyor)
-        server, handler = self.prepare_server_and_handler(self.handler)
+    def __init__(self, locks_conf: [str, int, int], conveyor: Conveyor=None, host='localhost', port=42024,
+                 pads_conf: [str, int, int]=(), diverters_conf: [str, int]=()):
+        """
+        Listener based on the simple socketserver in the thread
+
+        Each connection is served by its own thread. One-shot connections are closed after the first command,
+        session connections live until the client closes them or the listener stops.
+        """
+        super().__init__(locks_conf, conveyor, pads_conf, diverters_conf)
+        self._connections = set()
+        self._connections_lock = threading.Lock()
+        server, handler = self.prepare_server_and_handler(self.handle_line)
         self.server = server((host, port), handler)
 
-    def prepare_server_and_handler(self, handler):
+    def prepare_server_and_handler(self, line_handler):
+        connections, connections_lock = self._connections, self._connections_lock
+
         class ThreadedTCPRequestHandler(socketserver.StreamRequestHandler):
+            def setup(self):
+                super().setup()
+                # responses are tiny, don't let Nagle delay them
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                with connections_lock:
+                    connections.add(self.connection)
+
+            def finish(self):
+                with connections_lock:
+                    connections.discard(self.connection)
+                super().finish()
+
             def handle(self):
                 # self.rfile is a file-like object created by the handler;
                 # we can now use e.g. readline() instead of raw recv() calls
-                data = self.rfile.readline().strip()
-                result = handler(data)
-                # Likewise, self.wfile is a file-like object used to write back
-                # to the client
-                self.wfile.write(result)
+                for line in self.rfile:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    result, keep_alive = line_handler(line)
+                    # Likewise, self.wfile is a file-like object used to write back
+                    # to the client
+                    self.wfile.write(result)
+                    if not keep_alive:
+                        break
 
         class ThreadedTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
             _block_on_close = True
@@ -98,5 +192,12 @@ class SocketServerListener(Listener):
         server_thread.start()
 
     def stop(self):
-        self.server.server_close()
         self.server.shutdown()
+        # session connections are blocked on reading, wake them up
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.server.server_close()
@@ -1,6 +1,10 @@
 import time
-import queue
+import heapq
+import itertools
 import threading
+from collections import namedtuple
+
+from conveyor.simulation.topology import Topology
 
 
 class Rail:
@@ -11,32 +15,90 @@ class Rail:
     """
     def __init__(self, next_obj=None):
         self.next_obj: Rail = next_obj
+        # the objects, which palettes come to this one
+        self.prev_objs: [Rail] = []
         self.palette = None
+        # the way is notified about the state changes, which may let the palette move
+        self.way = None
+        self.position = None
 
     def is_empty(self):
         return True if self.palette is None else False
 
+    def _state_changed(self):
+        if self.way is not None:
+            self.way.wake(self)
+
 
 class Lock(Rail):
     """ Assembly line lock """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.is_closed = True
-        self.is_pass_one = False
+        self._is_closed = True
+        self._is_pass_one = False
+
+    @property
+    def is_closed(self):
+        return self._is_closed
+
+    @is_closed.setter
+    def is_closed(self, is_closed):
+        self._is_closed = is_closed
+        self._state_changed()
+
+    @property
+    def is_pass_one(self):
+        return self._is_pass_one
+
+    @is_pass_one.setter
+    def is_pass_one(self, is_pass_one):
+        self._is_pass_one = is_pass_one
+        self._state_changed()
 
 
 class StorageDeployPad(Rail):
     """ Palettes deploy pad """
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.is_picking_from = False
+        self._is_picking_from = False
+
+    @property
+    def is_picking_from(self):
+        return self._is_picking_from
+
+    @is_picking_from.setter
+    def is_picking_from(self, is_picking_from):
+        self._is_picking_from = is_picking_from
+        self._state_changed()
+
+
+class Diverter(Rail):
+    """ Assembly line diverter: the palette goes to one of the next objects, chosen by the direction """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.next_objs: [Rail] = []
+        self._direction = 0
+
+    @property
+    def direction(self):
+        return self._direction
+
+    @direction.setter
+    def direction(self, direction):
+        if not 0 <= direction < len(self.next_objs):
+            raise ValueError(f'Unknown direction {direction} of the diverter')
+        self._direction = direction
+        self.next_obj = self.next_objs[direction]
+        self._state_changed()
 
 
 class Palette:
     """ Palette object """
 
-    def __init__(self, way_obj: Rail):
+    def __init__(self, way_obj: Rail, rank=0):
         self.way_obj = way_obj
+        # order of adding, palettes are moved by it in the tick
+        self.rank = rank
 
     def move_forward(self):
         """ The main palettes method. Here is the logic about movement decisions """
@@ -62,7 +124,8 @@ class Palette:
 
 
 class Way:
-    def __init__(self, locks_coords: [int], conv_len: int, deploy_position: int):
+    def __init__(self, locks_coords: [int] = None, conv_len: int = None, deploy_position: int = None,
+                 topology: Topology = None):
         """
         Assembly line container
 
@@ -71,75 +134,249 @@ class Way:
         :param [int] locks_coords: indexes of locks in list
         :param int conv_len: conveyor length
         :param int deploy_position: index of deploy pad in list
+        :param Topology topology: the line of several segments with merges, diverters and deploy pads,
+            the locks_coords, conv_len and deploy_position are not used then
         """
-        self.locks_coords = locks_coords
-        self.way_len = conv_len
+        self.topology = topology or Topology.ring(locks_coords, conv_len, deploy_position)
+        self.locks_coords = self.topology.locks
+        self.way_len = len(self.topology) - 1
 
+        # deploy_pad is the first of the deploy pads
         self.deploy_pad: StorageDeployPad = None
-        self.deploy_position = deploy_position
+        self.deploy_pads: [StorageDeployPad] = []
+        self.deploy_position = self.topology.pads[0]
 
         self.locks: [Lock] = []
+        self.diverters: [Diverter] = []
         self._way_container = []
+        self._palettes = {}  # palette -> None, in the order of adding
+        self._ranks = itertools.count()
+        # palettes, which may move by the next tick: the rest are blocked till the cell ahead is freed
+        # or the state of their element is changed
+        self._movable = set()
+        # incremented on each change of the palettes or the elements states
+        self.version = 0
+        # positions of the changed elements (palette or the state) since the last take_changes()
+        self._changed = set(range(len(self.topology)))
         self.init_way()
 
     def init_way(self):
-        """ Init the assembly line container by all coordinates """
-        prev_obj: Rail = None
-        first_obj = None
-
-        for position in range(self.way_len + 1):
-            if position in self.locks_coords:
+        """ Init the assembly line container by the topology """
+        locks, pads, diverters = set(self.topology.locks), set(self.topology.pads), set(self.topology.diverters)
+        for position in range(len(self.topology)):
+            if position in locks:
                 new_obj = Lock()
-                self.locks.append(new_obj)
-            elif position == self.deploy_position:
+            elif position in pads:
                 new_obj = StorageDeployPad()
-                self.deploy_pad = new_obj
+            elif position in diverters:
+                new_obj = Diverter()
             else:
                 new_obj = Rail()
 
+            new_obj.way = self
+            new_obj.position = position
             self._way_container.append(new_obj)
 
-            if position == 0:  # is first
-                first_obj = new_obj
-            if position == self.way_len:  # is last
-                new_obj.next_obj = first_obj
-
-            if prev_obj is not None:
-                prev_obj.next_obj = new_obj
+        self.locks = [self._way_container[position] for position in self.topology.locks]
+        self.deploy_pads = [self._way_container[position] for position in self.topology.pads]
+        self.deploy_pad = self.deploy_pads[0]
+        self.diverters = [self._way_container[position] for position in self.topology.diverters]
 
-            prev_obj = new_obj
+        for element, next_positions in zip(self._way_container, self.topology.next_positions):
+            next_objs = [self._way_container[position] for position in next_positions]
+            element.next_obj = next_objs[0]
+            if isinstance(element, Diverter):
+                element.next_objs = next_objs
+            for next_obj in next_objs:
+                next_obj.prev_objs.append(element)
 
     def __iter__(self):
         return iter(self._way_container)
 
+    def __getitem__(self, position):
+        return self._way_container[position]
+
+    def __len__(self):
+        return len(self._way_container)
+
+    @property
+    def palettes(self):
+        return list(self._palettes)
+
+    def take_changes(self):
+        """ Positions of the elements changed since the last call """
+        changed, self._changed = self._changed, set()
+        return changed
+
+    def wake(self, element: Rail):
+        """ State of the element has been changed: its palette may move """
+        self.version += 1
+        self._changed.add(element.position)
+        if element.palette is not None:
+            self._movable.add(element.palette)
+
+    def add_palette(self, position):
+        way_obj = self._way_container[position]
+        palette = Palette(way_obj, next(self._ranks))
+        way_obj.palette = palette
+        self._palettes[palette] = None
+        self._movable.add(palette)
+        self.version += 1
+        self._changed.add(position)
+
+    def positions(self):
+        """ Positions of the palettes in the order they have been added """
+        return [palette.way_obj.position for palette in self._palettes]
+
+    def tick(self):
+        """
+        Moves the palettes one by one in the order they have been added. Returns count of the picked ones
+
+        Only the movable palettes are tried. Palette behind the moved one becomes movable: in this tick,
+        if it goes later by the order, in the next one otherwise. Blocked palettes are not movable till they are woken
+        """
+        if not self._movable:
+            return 0
+        movable, self._movable = self._movable, set()
+        queued = set(movable)
+        heap = [(palette.rank, palette) for palette in movable]
+        heapq.heapify(heap)
+        picked_count = 0
+        while heap:
+            rank, palette = heapq.heappop(heap)
+            way_obj = palette.way_obj
+            palette_to_delete = palette.move_forward()
+            if palette_to_delete:
+                del self._palettes[palette_to_delete]
+                picked_count += 1
+            elif palette.way_obj is way_obj:
+                # blocked, the flags of the element are not changed
+                self._movable.discard(palette)
+                continue
+            self.version += 1
+            self._changed.add(way_obj.position)
+            if palette_to_delete:
+                self._movable.discard(palette)
+            else:
+                self._movable.add(palette)
+                self._changed.add(palette.way_obj.position)
+            for prev_obj in way_obj.prev_objs:
+                behind = prev_obj.palette
+                if behind is None:
+                    continue
+                if behind.rank > rank and behind not in queued:
+                    queued.add(behind)
+                    heapq.heappush(heap, (behind.rank, behind))
+                elif behind.rank < rank:
+                    self._movable.add(behind)
+        return picked_count
+
+    def reset(self):
+        self._palettes.clear()
+        for element in self:
+            element.palette = None
+            if isinstance(element, Lock):
+                element.is_closed = True
+                element.is_pass_one = False
+            elif isinstance(element, Diverter):
+                element.direction = 0
+        self._movable.clear()
+        self.version += 1
+        self._changed.update(range(len(self)))
+
+
+# changes of the way since the previous delta: cells ((position, is_empty),),
+# locks ((lock_index, is_closed, is_pass_one, is_empty),), deploy pads ((pad_index, is_picking_from),),
+# diverters ((diverter_index, direction),), is_full if all the cells are there (the first delta, reset)
+WayDelta = namedtuple('WayDelta', 'sequence, cells, locks, pads, diverters, is_full')
+
+
+class VisualisationFeed:
+    def __init__(self):
+        """
+        Feed of the way deltas for the visualisers, bounded and latest wins
+
+        There is one pending delta at most: the published changes are merged into the unread ones,
+        so the reader falling behind gets all the changes at once and skips the intermediate states.
+        They are kept as dicts updated in place, the reader makes the WayDelta of them
+        """
+        self._lock = threading.Lock()
+        self._sequence = None  # of the latest published changes, None if there are no unread ones
+        self._cells = {}  # position -> is_empty
+        self._locks = {}  # lock index -> (lock_index, is_closed, is_pass_one, is_empty)
+        self._pads = {}  # pad index -> is_picking_from
+        self._diverters = {}  # diverter index -> direction
+        self._is_full = False
+
+    def publish(self, sequence, cells, locks=(), pads=(), diverters=(), is_full=False):
+        """ Merges the changes (as the WayDelta fields, in any order) into the unread ones """
+        with self._lock:
+            self._sequence = sequence
+            self._cells.update(cells)
+            self._locks.update((lock[0], lock) for lock in locks)
+            self._pads.update(pads)
+            self._diverters.update(diverters)
+            self._is_full = self._is_full or is_full
+
+    def get(self):
+        """ Pending delta or None, doesn't block """
+        with self._lock:
+            if self._sequence is None:
+                return None
+            sequence, cells, locks, pads, diverters, is_full = (
+                self._sequence, self._cells, self._locks, self._pads, self._diverters, self._is_full
+            )
+            self._sequence, self._cells, self._locks, self._pads, self._diverters, self._is_full = (
+                None, {}, {}, {}, {}, False
+            )
+        return WayDelta(sequence, tuple(sorted(cells.items())), tuple(sorted(locks.values())),
+                        tuple(sorted(pads.items())), tuple(sorted(diverters.items())), is_full)
+
 
 class Conveyor:
     sim_speed_delay = 0.9
 
-    def __init__(self, locks_coords: [int], deploy_coord: int, conv_len: int):
+    def __init__(self, locks_coords: [int] = None, deploy_coord: int = None, conv_len: int = None, way_class=Way,
+                 scheduler=None, topology: Topology = None):
         """
         Simulation core.
 
-        Simulation loop runs in thread
+        Simulation loop runs in thread. With the scheduler (VirtualScheduler) it's headless: there is no thread,
+        ticks are the scheduler calls each sim_speed_delay of its simulated time, run by scheduler.run_until(),
+        and the visualisation feed is not fed
 
         :param locks_coords [int]: indexes of locks in list
         :param deploy_coord: conveyor length
         :param conv_len: index of deploy pad in list
+        :param way_class: engine of the assembly line: Way (objects) or ArrayWay (NumPy arrays, for the long lines)
+        :param scheduler: VirtualScheduler for the headless simulation
+        :param topology: Topology of the line with several segments, instead of the ring by the coordinates
         """
-        self.locks_coords = locks_coords
-        self.conv_len = conv_len
-        self.storage_deploy_pad_position = deploy_coord
-        self.way = Way(self.locks_coords, self.conv_len, self.storage_deploy_pad_position)
-
-        self.palettes = []
+        self.way = way_class(locks_coords, conv_len, deploy_coord, topology=topology)
+        self.locks_coords = self.way.locks_coords
+        self.conv_len = self.way.way_len
+        self.storage_deploy_pad_position = self.way.deploy_position
 
-        self.visualisation_queue = queue.Queue()
+        self.visualisation_feed = VisualisationFeed()
+        self._sequence = 0
 
         self.active = False
+        # palettes taken from the deploy pad
+        self.picked_count = 0
 
         self._lock = threading.Lock()
-        self._conv_thread = self._start_conveyor_thread()
         self._quit = False
+        self.scheduler = scheduler
+        self._locks_indexes = {lock.position: lock_index for lock_index, lock in enumerate(self.way.locks)}
+        self._pads_indexes = {pad.position: pad_index for pad_index, pad in enumerate(self.way.deploy_pads)}
+        self._diverters_indexes = {diverter.position: diverter_index
+                                   for diverter_index, diverter in enumerate(self.way.diverters)}
+        self._publish_changes()
+        if scheduler is None:
+            self._conv_thread = self._start_conveyor_thread()
+        else:
+            self._conv_thread = None
+            self.scheduler.call_later(self.sim_speed_delay, self._tick_by_scheduler)
 
     def _start_conveyor_thread(self):
         thread = threading.Thread(target=self._loop_by_time, daemon=True)  # daemon for easy quit
@@ -164,13 +401,45 @@ class Conveyor:
         with self._lock:
             self.way.locks[lock_index].is_closed = True
 
-    def place_to_conveyor(self):
-        self._add_palette(self.storage_deploy_pad_position)
+    def locks_set_open(self, locks_open: {int: bool}):
+        """ Opens/closes several locks atomically. Takes {lock_index: is_open} """
+        self.set_outputs(locks_open)
+
+    def set_outputs(self, locks_open: {int: bool}, pads_picking_from: {int: bool} = None,
+                    diverters_directions: {int: int} = None):
+        """ Sets the states of several locks, deploy pads and diverters atomically """
+        diverters_directions = diverters_directions or {}
+        with self._lock:
+            for diverter_index, direction in diverters_directions.items():
+                if not 0 <= direction < len(self.way.diverters[diverter_index].next_objs):
+                    raise ValueError(f'Unknown direction {direction} of the diverter {diverter_index}')
+            for lock_index, is_open in locks_open.items():
+                self.way.locks[lock_index].is_closed = not is_open
+            for pad_index, is_picking_from in (pads_picking_from or {}).items():
+                self.way.deploy_pads[pad_index].is_picking_from = is_picking_from
+            for diverter_index, direction in diverters_directions.items():
+                self.way.diverters[diverter_index].direction = direction
+
+    def locks_is_busy(self, locks_indexes: [int]):
+        """ Occupancy of several locks, captured at one moment """
+        with self._lock:
+            return [not self.way.locks[lock_index].is_empty() for lock_index in locks_indexes]
 
-    def pick_from_conveyor(self):
+    def positions_is_busy(self, positions: [int]):
+        """ Occupancy of several elements of the way by their positions, captured at one moment """
         with self._lock:
-            self.way.deploy_pad: StorageDeployPad
-            self.way.deploy_pad.is_picking_from = True
+            return [not self.way[position].is_empty() for position in positions]
+
+    def diverter_switch(self, diverter_index, direction):
+        with self._lock:
+            self.way.diverters[diverter_index].direction = direction
+
+    def place_to_conveyor(self, pad_index=0):
+        self._add_palette(self.way.deploy_pads[pad_index].position)
+
+    def pick_from_conveyor(self, pad_index=0):
+        with self._lock:
+            self.way.deploy_pads[pad_index].is_picking_from = True
 
     def stop_assembly_line(self):
         with self._lock:
@@ -180,12 +449,13 @@ class Conveyor:
         with self._lock:
             self.active = True
 
+    @property
+    def palettes(self):
+        return self.way.palettes
+
     def _add_palette(self, position):
         with self._lock:
-            way_obj = self.way._way_container[position]
-            palette = Palette(way_obj)
-            way_obj.palette = palette
-            self.palettes.append(palette)
+            self.way.add_palette(position)
 
     def _loop_by_time(self):
         while True:
@@ -195,27 +465,46 @@ class Conveyor:
             if self._quit:
                 break
 
+    def _tick_by_scheduler(self):
+        if self._quit:
+            return
+        if self.active:
+            self._one_loop_tick()
+        self.scheduler.call_later(self.sim_speed_delay, self._tick_by_scheduler)
+
     def _one_loop_tick(self):
         with self._lock:
-            for palette in self.palettes[:]:
-                palette_to_delete = palette.move_forward()
-                if palette_to_delete:
-                    self.palettes.remove(palette_to_delete)
-        self.visualisation_queue.put(self.way)
+            self.picked_count += self.way.tick()
+            self._publish_changes()
+
+    def _publish_changes(self):
+        """ Publishes the delta of the way changed since the previous one, nothing if nothing is changed """
+        changed = self.way.take_changes()
+        if self.scheduler is not None or not changed:
+            return
+        self._sequence += 1
+        way = self.way
+        self.visualisation_feed.publish(
+            self._sequence,
+            ((position, way[position].is_empty()) for position in changed),
+            locks=((self._locks_indexes[position], way[position].is_closed, way[position].is_pass_one,
+                    way[position].is_empty()) for position in changed.intersection(self._locks_indexes)),
+            pads=((self._pads_indexes[position], way[position].is_picking_from)
+                  for position in changed.intersection(self._pads_indexes)),
+            diverters=((self._diverters_indexes[position], way[position].direction)
+                       for position in changed.intersection(self._diverters_indexes)),
+            is_full=len(changed) == len(way),
+        )
 
     def quit(self):
         with self._lock:
             self._quit = True
-        self._conv_thread.join(self.sim_speed_delay)
+        if self._conv_thread is not None:
+            self._conv_thread.join(self.sim_speed_delay)
 
     def reset(self):
         with self._lock:
-            self.palettes.clear()
-            for element in self.way:
-                element.palette = None
-                if isinstance(element, Lock):
-                    element.is_closed = True
-                    element.is_pass_one = False
+            self.way.reset()
 
 def print_way(way: Way):
     """ Simple visualiser for debug purpose """
@@ -242,13 +531,10 @@ def print_way(way: Way):
 def simple_visualizer(conveyor: Conveyor):
     def vis_loop():
         while True:
-            try:
-                way = conveyor.visualisation_queue.get(block=False)
-                print_way(way)
-            except queue.Empty:
-                pass
-            finally:
-                time.sleep(0.1)
+            if conveyor.visualisation_feed.get() is not None:
+                with conveyor._lock:
+                    print_way(conveyor.way)
+            time.sleep(0.1)
     return threading.Thread(target=vis_loop)
 
 
@@ -0,0 +1,193 @@
+import time
+import socket
+from unittest import TestCase
+
+from conveyor.config import locks_rpi_config
+import conveyor.simulation.config as sim_conf
+from conveyor.simulation.simulation import Conveyor, Way
+from conveyor.simulation.listener import SocketServerListener
+from conveyor.simulation.topology import Topology, Segment
+from conveyor.test_mock.gpio_mock import GPIOMock, ListenerSocketClient, ListenerSessionClient, ListenerSession
+
+
+class TestListener(TestCase):
+
+    def setUp(self):
+        self.conveyor = Conveyor(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len)
+        self.listener = SocketServerListener(locks_rpi_config, self.conveyor, port=0)
+        self.listener.start()
+        self.host, self.port = self.listener.server.server_address
+
+    def tearDown(self):
+        self.listener.stop()
+        self.conveyor.quit()
+
+    def test_one_shot_client(self):
+        gpio = GPIOMock(ListenerSocketClient(self.host, self.port))
+        gpio.output(18, 1)
+        self.assertFalse(self.conveyor.way.locks[0].is_closed, "Lock has not been opened")
+        self.assertEqual(gpio.input(4), 0, "Lock is_busy value is incorrect")
+
+    def test_session_client(self):
+        client = ListenerSessionClient(self.host, self.port, pool_size=1)
+        gpio = GPIOMock(client)
+        self.conveyor._add_palette(sim_conf.locks_coords_list[1])
+        gpio.output(23, 1)
+        self.assertFalse(self.conveyor.way.locks[1].is_closed, "Lock has not been opened")
+        self.assertEqual(gpio.input(17), 1, "Lock is_busy value is incorrect")
+        self.assertEqual(len(self.listener._connections), 1, "Session has not been reused")
+        gpio.cleanup()
+
+    def test_session_pipelining(self):
+        client = ListenerSessionClient(self.host, self.port, pool_size=1)
+        responses = client.send_requests([b'OUTPUT 18 1', b'INPUT 4', b'UNKNOWN 1', b'OUTPUT 18 0'])
+        self.assertEqual(responses[:2], ['OK', '0'], "Pipelined responses are incorrect")
+        self.assertTrue(responses[2].startswith('NOT OK'), "Unknown command has been accepted")
+        self.assertTrue(self.conveyor.way.locks[0].is_closed, "Lock has not been closed")
+        client.close()
+
+    def test_batch_commands(self):
+        client = ListenerSessionClient(self.host, self.port, pool_size=1)
+        gpio = GPIOMock(client)
+        self.conveyor._add_palette(sim_conf.locks_coords_list[2])
+        gpio.output([18, 23, 24], [1, 1, 0])
+        is_closed = [lock.is_closed for lock in self.conveyor.way.locks]
+        self.assertEqual(is_closed, [False, False, True, True], "Locks states are incorrect")
+        self.assertEqual(gpio.input_many([4, 17, 27, 22]), [0, 0, 1, 0], "Locks is_busy values are incorrect")
+        self.assertTrue(client.send_request(b'OUTPUTS 18:1 99:1').startswith('NOT OK'), "Unknown port accepted")
+        gpio.cleanup()
+
+
+class TestListenerSession(TestCase):
+
+    def test_closed_by_listener(self):
+        with socket.create_server(('localhost', 0)) as server:
+            session = ListenerSession(*server.getsockname()[:2], timeout=5)
+            self.addCleanup(session.close)
+            connection, _ = server.accept()
+            connection.close()
+            session._reader_thread.join(1)
+            started = time.monotonic()
+            with self.assertRaises(ConnectionError):
+                session.send_requests([b'INPUT 4'])
+            self.assertLess(time.monotonic() - started, 1, "Request has waited for the timeout")
+
+
+class TestTopologyListener(TestCase):
+
+    def setUp(self):
+        topology = Topology([
+            Segment('main', 10, ('main', 'side'), locks=(2,), pads=(5,)),
+            Segment('side', 10, 'main', locks=(3,), pads=(6,)),
+        ])
+        self.conveyor = Conveyor(topology=topology)
+        self.listener = SocketServerListener(
+            [('lock main', 4, 18), ('lock side', 17, 23)], self.conveyor, port=0,
+            pads_conf=[('pad main', 27, 24), ('pad side', 22, 25)], diverters_conf=[('transfer', 12)],
+        )
+        self.listener.start()
+        self.host, self.port = self.listener.server.server_address
+
+    def tearDown(self):
+        self.listener.stop()
+        self.conveyor.quit()
+
+    def test_pads_and_diverters(self):
+        client = ListenerSessionClient(self.host, self.port, pool_size=1)
+        gpio = GPIOMock(client)
+        self.conveyor.place_to_conveyor(1)
+        gpio.output([23, 25, 12], [1, 1, 1])
+        self.assertFalse(self.conveyor.way.locks[1].is_closed, "Lock has not been opened")
+        self.assertTrue(self.conveyor.way.deploy_pads[1].is_picking_from, "Palette has not been taken")
+        self.assertEqual(self.conveyor.way.diverters[0].direction, 1, "Diverter has not been switched")
+        self.assertEqual(gpio.input_many([4, 17, 27, 22]), [0, 0, 0, 1], "Elements is_busy values are incorrect")
+        self.assertTrue(client.send_request(b'OUTPUTS 18:1 12:2').startswith('NOT OK'), "Unknown direction accepted")
+        self.assertTrue(self.conveyor.way.locks[0].is_closed, "Outputs have been set partially")
+        gpio.cleanup()
+
+
+class TestWay(TestCase):
+
+    def test_merge(self):
+        topology = Topology([
+            Segment('a', 3, 'c'),
+            Segment('b', 3, 'c'),
+            Segment('c', 5, ('a', 'b'), pads=(2,)),
+        ])
+        way = Way(topology=topology)
+        merge_position = topology.position('c')
+        # the palette added first goes first, the other one follows it
+        way.add_palette(topology.position('b', 2))
+        way.add_palette(topology.position('a', 2))
+        way.tick()
+        self.assertEqual(way.positions(), [merge_position, topology.position('a', 2)], "Merge is incorrect")
+        way.tick()
+        self.assertEqual(way.positions(), [merge_position + 1, merge_position], "Merge is incorrect")
+
+    def test_blocked_palettes_sleep(self):
+        way = Way(sim_conf.locks_coords_list, sim_conf.conv_len, sim_conf.deploy_coord)
+        lock_position = sim_conf.locks_coords_list[1]
+        for position in [lock_position, lock_position - 1, lock_position - 3]:
+            way.add_palette(position)
+        way.tick()
+        way.tick()
+        self.assertEqual(way._movable, set(), "Blocked palettes are movable")
+        version = way.version
+        way.tick()
+        self.assertEqual(way.version, version, "Blocked line has been changed")
+
+        way.locks[1].is_closed = False
+        way.tick()
+        self.assertEqual(way.positions(), [lock_position + 1, lock_position, lock_position - 1],
+                         "Palettes have not been woken by the lock")
+
+    def test_visualisation_of_changes(self):
+        conveyor = Conveyor(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len)
+        self.addCleanup(conveyor.quit)
+        delta = conveyor.visualisation_feed.get()
+        self.assertTrue(delta.is_full, "First delta is not full")
+        self.assertEqual(len(delta.cells), sim_conf.conv_len + 1, "First delta is incorrect")
+
+        lock_position = sim_conf.locks_coords_list[0]
+        conveyor._add_palette(lock_position)
+        conveyor._one_loop_tick()
+        conveyor._one_loop_tick()
+        delta = conveyor.visualisation_feed.get()
+        self.assertEqual(delta.sequence, 2, "Unchanged way has been visualised")
+        self.assertFalse(delta.is_full, "Delta is incorrect")
+        self.assertEqual(delta.cells, ((lock_position, False),), "Cells delta is incorrect")
+        self.assertEqual(delta.locks, ((0, True, False, False),), "Locks delta is incorrect")
+        self.assertEqual(delta.pads, (), "Unchanged deploy pad is in the delta")
+        self.assertIsNone(conveyor.visualisation_feed.get(), "Delta has been read twice")
+
+    def test_visualisation_of_pads_and_diverters(self):
+        conveyor = Conveyor(topology=Topology([
+            Segment('main', 10, ('main', 'side'), locks=(2,), pads=(5,)),
+            Segment('side', 10, 'main', pads=(6,)),
+        ]))
+        self.addCleanup(conveyor.quit)
+        delta = conveyor.visualisation_feed.get()
+        self.assertEqual(delta.pads, ((0, False), (1, False)), "First delta is incorrect")
+        self.assertEqual(delta.diverters, ((0, 0),), "First delta is incorrect")
+
+        conveyor.set_outputs({}, pads_picking_from={1: True}, diverters_directions={0: 1})
+        conveyor._one_loop_tick()
+        delta = conveyor.visualisation_feed.get()
+        self.assertEqual(delta.pads, ((1, True),), "Pads delta is incorrect")
+        self.assertEqual(delta.diverters, ((0, 1),), "Diverters delta is incorrect")
+
+    def test_visualisation_feed_is_bounded(self):
+        conveyor = Conveyor(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len)
+        self.addCleanup(conveyor.quit)
+        conveyor.lock_open(0)
+        conveyor._add_palette(sim_conf.locks_coords_list[0])
+        for _ in range(10):
+            conveyor._one_loop_tick()
+        delta = conveyor.visualisation_feed.get()
+        # the palette has stopped at the next closed lock, the rest of the ticks have changed nothing
+        self.assertEqual(delta.sequence, 1 + sim_conf.locks_coords_list[1], "Sequence of the latest delta is incorrect")
+        self.assertTrue(delta.is_full, "Unread first delta has been lost")
+        self.assertEqual([position for position, is_empty in delta.cells if not is_empty],
+                         [sim_conf.locks_coords_list[1]], "Merged cells are incorrect")
+        self.assertEqual(delta.locks[1], (1, True, False, False), "Merged locks are incorrect")
+        self.assertIsNone(conveyor.visualisation_feed.get(), "Feed is not latest wins")
@@ -0,0 +1,68 @@
+from collections import namedtuple
+
+# linear piece of the line: length cells, next is the name of the segment its last cell goes to,
+# or the tuple of names for the diverter (the last cell switches between them, the first is the default);
+# locks and pads are the offsets of the locks and of the deploy pads in the segment
+Segment = namedtuple('Segment', 'name, length, next, locks, pads', defaults=((), ()))
+
+
+class Topology:
+    def __init__(self, segments: [Segment]):
+        """
+        Graph of the assembly line: the segments, joined end to start
+
+        Positions of the cells are the segments cells one by one in the given order. Several segments going
+        to the same one make the merge at its first cell: the palette added earlier goes first, as everywhere
+        on the line. Segment with several next ones ends with the diverter. Locks and deploy pads are numbered
+        in the order of the segments and of their offsets
+        """
+        self.segments = segments
+        self.starts = {}  # segment name -> position of its first cell
+        position = 0
+        for segment in segments:
+            if segment.name in self.starts:
+                raise ValueError(f'Segment {segment.name} is defined twice')
+            if segment.length < 1:
+                raise ValueError(f'Segment {segment.name} is empty')
+            self.starts[segment.name] = position
+            position += segment.length
+        self.cells_count = position
+
+        # next positions of each cell, several ones for the diverters
+        self.next_positions: [(int,)] = []
+        self.locks: [int] = []
+        self.pads: [int] = []
+        self.diverters: [int] = []
+        for segment in segments:
+            start = self.starts[segment.name]
+            next_names = segment.next if isinstance(segment.next, tuple) else (segment.next,)
+            for name in next_names:
+                if name not in self.starts:
+                    raise ValueError(f'Segment {segment.name} goes to the unknown segment {name}')
+            self.next_positions.extend((position + 1,) for position in range(start, start + segment.length - 1))
+            self.next_positions.append(tuple(self.starts[name] for name in next_names))
+            for offset in (*segment.locks, *segment.pads):
+                if not 0 <= offset < segment.length:
+                    raise ValueError(f'Offset {offset} is out of the segment {segment.name}')
+            self.locks.extend(start + offset for offset in segment.locks)
+            self.pads.extend(start + offset for offset in segment.pads)
+            if len(next_names) > 1:
+                self.diverters.append(start + segment.length - 1)
+
+        elements = [*self.locks, *self.pads, *self.diverters]
+        if len(set(elements)) != len(elements):
+            raise ValueError('Locks, deploy pads and diverters must be on the different cells')
+        if not self.pads:
+            raise ValueError('There is no deploy pad')
+
+    @classmethod
+    def ring(cls, locks_coords: [int], conv_len: int, deploy_position: int):
+        """ One closed line, as the default conveyor """
+        return cls([Segment('ring', conv_len + 1, 'ring', tuple(locks_coords), (deploy_position,))])
+
+    def __len__(self):
+        return self.cells_count
+
+    def position(self, segment_name, offset=0):
+        """ Position of the cell in the segment """
+        return self.starts[segment_name] + offset
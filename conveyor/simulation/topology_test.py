@@ -0,0 +1,34 @@
+from unittest import TestCase
+
+from conveyor.simulation.topology import Topology, Segment
+
+
+class TestTopology(TestCase):
+
+    def test_ring(self):
+        topology = Topology.ring([0, 7], 9, 4)
+        self.assertEqual(len(topology), 10, "Cells count is incorrect")
+        self.assertEqual(topology.next_positions[9], (0,), "Ring is not closed")
+        self.assertEqual((topology.locks, topology.pads, topology.diverters), ([0, 7], [4], []),
+                         "Elements positions are incorrect")
+
+    def test_segments(self):
+        topology = Topology([
+            Segment('main', 5, ('main', 'side'), locks=(1,), pads=(3,)),
+            Segment('side', 4, 'main', locks=(0, 2)),
+        ])
+        self.assertEqual(topology.position('side', 2), 7, "Position is incorrect")
+        self.assertEqual(topology.next_positions[4], (0, 5), "Diverter is incorrect")
+        self.assertEqual(topology.next_positions[8], (0,), "Merge is incorrect")
+        self.assertEqual((topology.locks, topology.pads, topology.diverters), ([1, 5, 7], [3], [4]),
+                         "Elements positions are incorrect")
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            Topology([Segment('main', 5, 'side', pads=(3,))])
+        with self.assertRaises(ValueError):
+            Topology([Segment('main', 5, 'main', locks=(3,), pads=(3,))])
+        with self.assertRaises(ValueError):
+            Topology([Segment('main', 5, 'main', pads=(5,))])
+        with self.assertRaises(ValueError):
+            Topology([Segment('main', 5, 'main')])
@@ -1,26 +1,31 @@
+import re
 import queue
 import tkinter as tk
 
 from conveyor.config import locks_rpi_config
 
 import conveyor.simulation.config as sim_conf
-from conveyor.simulation.simulation import Way, Conveyor
+from conveyor.simulation.simulation import Way, Conveyor, VisualisationFeed, WayDelta
 from conveyor.simulation.listener import SocketServerListener, Listener
 
 
+PALETTE = '[*]'
+NO_PALETTE = '   '
+
+
 def prepare_formated_ascii(way: Way):
     """ Template engine for template in the config """
-    palette = '[*]'
-    no_palette = '   '
+    return sim_conf.template_for_format.format(*(NO_PALETTE if element.is_empty() else PALETTE for element in way))
 
-    format_list = []
-    for element in way:
-        if element.is_empty():
-            element_ascii = no_palette
-        else:
-            element_ascii = palette
-        format_list.append(element_ascii)
-    return sim_conf.template_for_format.format(*format_list)
+
+def template_cells_coords(cells_count):
+    """ tk.Text coordinates of the cells in the template: the cells are formatted with their positions and found """
+    ascii_template = sim_conf.template_for_format.format(*(f'{position:03d}' for position in range(cells_count)))
+    coords = [None] * cells_count
+    for line_index, line in enumerate(ascii_template.split('\n'), 1):
+        for match in re.finditer(r'\d{3}', line):
+            coords[int(match.group())] = f'{line_index}.{match.start()}'
+    return coords
 
 
 def print_formatted_way(way: Way):
@@ -38,6 +43,7 @@ class TkVisualiser:
         self.listener.fetch_conveyor(conveyor)
 
         self.root = self.init_root()
+        self.cells_coords = template_cells_coords(len(self.conveyor.way))
 
         visualiser_frame = tk.Frame(self.root, relief=tk.SUNKEN, borderwidth=1)
 
@@ -72,11 +78,11 @@ class TkVisualiser:
         listener_frame.pack(side=tk.RIGHT, fill=tk.BOTH)
         self.root.after(50, self._listener_logger)
 
-        self._visualisation_loop(self.conveyor.visualisation_queue)
+        self._visualisation_loop(self.conveyor.visualisation_feed)
         self.conveyor.start_assembly_line()
 
     def _add_conveyor_open_and_close_callbacks(self):
-        """ Hack for adding callbacks to conveyor.lock_open / conveyor.lock_close methods """
+        """ Hack for adding callbacks to conveyor.lock_open / conveyor.lock_close / conveyor.set_outputs methods """
         old_open_foo = self.conveyor.lock_open
         old_close_foo = self.conveyor.lock_close
 
@@ -92,8 +98,17 @@ class TkVisualiser:
             callback()
             old_close_foo(lock_index)
 
+        old_set_outputs_foo = self.conveyor.set_outputs
+
+        def set_outputs_with_cb(locks_open, *args, **kwargs):
+            for lock_index, is_open in locks_open.items():
+                text, colour = ('Opened', 'green') if is_open else ('Closed', 'red')
+                self.locks_statuses_labels[lock_index][0].config(text=text, bg=colour)
+            old_set_outputs_foo(locks_open, *args, **kwargs)
+
         self.conveyor.lock_open = lock_open_with_cb
         self.conveyor.lock_close = lock_close_with_cb
+        self.conveyor.set_outputs = set_outputs_with_cb
 
     def init_root(self):
         root = tk.Tk()
@@ -257,50 +272,58 @@ class TkVisualiser:
 
         return listener_frame, listener_text_widget
 
-    def _visualisation_loop(self, visualisation_queue: queue.Queue):
-        try:
-            way = visualisation_queue.get(block=False)
-            self.tk_draw(way)
-        except queue.Empty:
-            pass
-        finally:
-            self.root.after(50, self._visualisation_loop, visualisation_queue)
+    def _visualisation_loop(self, visualisation_feed: VisualisationFeed):
+        delta = visualisation_feed.get()
+        if delta is not None:
+            self.tk_draw(delta)
+        self.root.after(50, self._visualisation_loop, visualisation_feed)
 
-    def tk_draw(self, way: Way):
+    def tk_draw(self, delta: WayDelta):
         """
         Visualisation callback
 
-        Redraws tk.Text widget.
-        Makes decisions based on assembly line elements states
+        Updates tk.Text widget by the delta: only the changed cells are replaced and only the tags
+        of the changed locks and the deploy pad are recoloured. Full delta redraws the whole template.
         """
-        self.text.delete('0.1', tk.END)
-        self.text.insert('0.1', prepare_formated_ascii(way))
+        if delta.is_full:
+            self._tk_draw_template(delta)
+        else:
+            for position, is_empty in delta.cells:
+                coord = self.cells_coords[position]
+                self.text.delete(coord, f'{coord}+{len(PALETTE)}c')
+                self.text.insert(coord, NO_PALETTE if is_empty else PALETTE)
 
-        for lock_i, lock in enumerate(way.locks):
+        for lock_i, is_closed, _, is_empty in delta.locks:
             # coloring the is_open flag
-            lock_status_coords = sim_conf.locks_is_open_symbols[lock_i]
-            lock_is_open_tag_name = f'lock_is_open_{lock_i}'
-            self.text.tag_add(lock_is_open_tag_name, *lock_status_coords[0])
-            self.text.tag_add(lock_is_open_tag_name, *lock_status_coords[1])
-
-            colour = 'red' if lock.is_closed else 'green'
-            self.text.tag_config(lock_is_open_tag_name, foreground=colour)
+            colour = 'red' if is_closed else 'green'
+            self.text.tag_config(f'lock_is_open_{lock_i}', foreground=colour)
 
             # coloring the not is_empty flag
-            lock_status_coords = sim_conf.locks_is_empty_symbols[lock_i]
-            lock_is_empty_tag_name = f'lock_is_empty_{lock_i}'
-            for symb_coord in lock_status_coords:
-                self.text.tag_add(lock_is_empty_tag_name, symb_coord)
-            text, colour = ('Empty', 'white') if lock.is_empty() else ('Loaded', 'orange')
+            text, colour = ('Empty', 'white') if is_empty else ('Loaded', 'orange')
             self.locks_statuses_labels[lock_i][1].config(text=text, bg=colour)
-            self.text.tag_config(lock_is_empty_tag_name, foreground=colour)
-
-        # coloring deploy pad element
-        deploy_pad_tag_name = 'deploy_pad_is_picking_from'
-        self.text.tag_add(deploy_pad_tag_name, *sim_conf.deploy_pad_symbols[0])
-        self.text.tag_add(deploy_pad_tag_name, *sim_conf.deploy_pad_symbols[1])
-        colour = 'purple' if way.deploy_pad.is_picking_from else 'white'
-        self.text.tag_config(deploy_pad_tag_name, foreground=colour)
+            self.text.tag_config(f'lock_is_empty_{lock_i}', foreground=colour)
+
+        # coloring deploy pad element, the template has the first one only
+        for pad_index, is_picking_from in delta.pads:
+            if pad_index == 0:
+                colour = 'purple' if is_picking_from else 'white'
+                self.text.tag_config('deploy_pad_is_picking_from', foreground=colour)
+
+    def _tk_draw_template(self, delta: WayDelta):
+        """ Renders the whole template, the tags are set again: their text is replaced """
+        self.text.delete('0.1', tk.END)
+        self.text.insert('0.1', sim_conf.template_for_format.format(
+            *(NO_PALETTE if is_empty else PALETTE for _, is_empty in delta.cells)))
+
+        for lock_i, _, _, _ in delta.locks:
+            lock_status_coords = sim_conf.locks_is_open_symbols[lock_i]
+            self.text.tag_add(f'lock_is_open_{lock_i}', *lock_status_coords[0])
+            self.text.tag_add(f'lock_is_open_{lock_i}', *lock_status_coords[1])
+            for symb_coord in sim_conf.locks_is_empty_symbols[lock_i]:
+                self.text.tag_add(f'lock_is_empty_{lock_i}', symb_coord)
+
+        self.text.tag_add('deploy_pad_is_picking_from', *sim_conf.deploy_pad_symbols[0])
+        self.text.tag_add('deploy_pad_is_picking_from', *sim_conf.deploy_pad_symbols[1])
 
     def start(self):
         self.conveyor.start_assembly_line()
@@ -0,0 +1,161 @@
+"""
+Load test of the conveyor web API against the simulation backend
+
+Runs the simulation conveyor with its listener, the web API on top of it (GPIO is the listener-session mock),
+and many concurrent keep-alive clients: most of them poll /status, some of them call /locks/pass_one with "wait".
+The asyncio app (uvicorn) is compared with the flask app in one sync worker, like uwsgi runs it.
+
+    python -m conveyor.test_mock.asgi_load_benchmark [clients] [duration, s] [asgi|wsgi|both]
+"""
+import sys
+import json
+import time
+import asyncio
+import logging
+import threading
+import statistics
+from collections import defaultdict
+from unittest.mock import patch, MagicMock
+
+from conveyor.config import locks_rpi_config
+import conveyor.simulation.config as sim_conf
+from conveyor.simulation.simulation import Conveyor as SimulationConveyor
+from conveyor.simulation.listener import SocketServerListener
+from conveyor.test_mock.gpio_mock import GPIOMock, ListenerSessionClient
+
+api_host = '127.0.0.1'
+asgi_port, wsgi_port = 5081, 5082
+# one of pass_one_every clients releases the cars, the others poll the status
+pass_one_every = 10
+status_url = '/api/v1/conveyor/status'
+pass_one_url = '/api/v1/conveyor/locks/pass_one'
+
+simulation = SimulationConveyor(sim_conf.locks_coords_list, sim_conf.deploy_coord, sim_conf.conv_len)
+listener = SocketServerListener(locks_rpi_config, simulation, port=0)
+listener.start()
+
+MockRPi = MagicMock()
+MockRPi.GPIO = GPIOMock(ListenerSessionClient(*listener.server.server_address))
+modules = {
+    "RPi": MockRPi,
+    "RPi.GPIO": MockRPi.GPIO,
+}
+
+with patch.dict("sys.modules", modules):
+    from conveyor.conveyor_web_api import app as wsgi_app
+    from conveyor.conveyor_web_common import cv
+    from conveyor.conveyor_asgi_api import app as asgi_app
+
+
+def start_asgi_server():
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(asgi_app, host=api_host, port=asgi_port, log_level='warning'))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+
+    def stop():
+        server.should_exit = True
+    return stop
+
+
+def start_wsgi_server():
+    from werkzeug.serving import make_server
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    # one sync worker: requests are served one by one
+    server = make_server(api_host, wsgi_port, wsgi_app, threaded=False)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.shutdown
+
+
+async def _http_request(reader, writer, method, url, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    writer.write(
+        f'{method} {url} HTTP/1.1\r\nHost: {api_host}\r\nContent-Type: application/json\r\n'
+        f'Content-Length: {len(body)}\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('Connection has been closed by the server')
+    http_version, status_code = status_line.split()[:2]
+    # HTTP/1.0 servers (like the non-threaded werkzeug one) close the connection after each response
+    keep_alive = http_version == b'HTTP/1.1'
+    content_length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b''):
+            break
+        name, _, value = header.decode().partition(':')
+        if name.lower() == 'content-length':
+            content_length = int(value)
+        elif name.lower() == 'connection':
+            keep_alive = value.strip().lower() == 'keep-alive'
+    await reader.readexactly(content_length)
+    return int(status_code), keep_alive
+
+
+async def _client(port, client_number, deadline, latencies, errors):
+    if client_number % pass_one_every:
+        method, url, payload = 'GET', status_url, None
+    else:
+        lock_id = cv.locks[client_number // pass_one_every % len(cv.locks)].id
+        method, url, payload = 'POST', pass_one_url, {"ids": [lock_id], "wait": True}
+    writer = None
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            if writer is None:
+                reader, writer = await asyncio.open_connection(api_host, port)
+            status_code, keep_alive = await _http_request(reader, writer, method, url, payload)
+            latencies[url].append(time.perf_counter() - start)
+            if status_code != 200:
+                errors[url] += 1
+            if not keep_alive:
+                writer.close()
+                writer = None
+    except (ConnectionError, asyncio.IncompleteReadError):
+        errors[url] += 1
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+async def run(port, clients, duration):
+    """ Runs the clients for duration seconds, returns latencies by url, errors by url and the elapsed time """
+    latencies, errors = defaultdict(list), defaultdict(int)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _client(port, client_number, start + duration, latencies, errors) for client_number in range(clients)
+    ))
+    return latencies, errors, time.perf_counter() - start
+
+
+def report(name, latencies, errors, elapsed):
+    total = sum(len(url_latencies) for url_latencies in latencies.values())
+    print(f'{name}: {total / elapsed:7.1f} req/s, {sum(errors.values())} errors')
+    for url, url_latencies in sorted(latencies.items()):
+        url_latencies = sorted(latency * 1000 for latency in url_latencies)
+        percentile = lambda p: url_latencies[min(len(url_latencies) - 1, int(len(url_latencies) * p))]
+        print(f'    {url:>36}: {len(url_latencies):6} req, mean {statistics.mean(url_latencies):7.2f} ms, '
+              f'p50 {percentile(0.5):7.2f} ms, p95 {percentile(0.95):7.2f} ms, max {url_latencies[-1]:7.2f} ms')
+
+
+if __name__ == '__main__':
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    targets = sys.argv[3] if len(sys.argv) > 3 else 'both'
+
+    print(f'{clients} clients (1 of {pass_one_every} calls pass_one with "wait"), {duration} s')
+    if targets in ('wsgi', 'both'):
+        stop_server = start_wsgi_server()
+        report('flask, 1 sync worker', *asyncio.run(run(wsgi_port, clients, duration)))
+        stop_server()
+    if targets in ('asgi', 'both'):
+        stop_server = start_asgi_server()
+        report('asgi, 1 process', *asyncio.run(run(asgi_port, clients, duration)))
+        stop_server()
+
+    cv.cleanup()
+    listener.stop()
+    simulation.quit()
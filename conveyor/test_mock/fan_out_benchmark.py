@@ -0,0 +1,119 @@
+"""
+Micro-benchmark of the locks fan-out in the conveyor web API
+
+Compares request latency of /locks/open + /locks/close with the old ThreadPool-per-request fan-out (before)
+and with the conveyor shared executor (after), at the fixed request rate.
+GPIO is replaced by the quiet stub with the small write latency, like the simulation listener has.
+
+    python -m conveyor.test_mock.fan_out_benchmark [rate, req/s] [duration, s]
+"""
+import sys
+import time
+import statistics
+from multiprocessing.pool import ThreadPool
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+
+
+class QuietGPIOStub:
+    BOARD = BCM = OUT = IN = HIGH = 1
+    LOW = 0
+    write_latency = 0.0005
+
+    @staticmethod
+    def setmode(mode):
+        pass
+
+    @staticmethod
+    def setwarnings(flag):
+        pass
+
+    @staticmethod
+    def setup(port, mode):
+        pass
+
+    @classmethod
+    def output(cls, port, value):
+        time.sleep(cls.write_latency)
+
+    @classmethod
+    def input(cls, port):
+        time.sleep(cls.write_latency)
+        return 0
+
+
+MockRPi = MagicMock()
+MockRPi.GPIO = QuietGPIOStub
+modules = {
+    "RPi": MockRPi,
+    "RPi.GPIO": MockRPi.GPIO,
+}
+
+with patch.dict("sys.modules", modules):
+    from flask import jsonify, request, make_response
+
+    from conveyor.conveyor_web_api import app
+    from conveyor.conveyor_web_common import cv, validate_lock_id_or_name
+
+
+def _thread_pool_fan_out(method, locks):
+    """ The fan-out as it was: new ThreadPool per request """
+    p = ThreadPool(len(cv.locks))
+    p.map(method, tuple(locks))
+    p.close()
+    p.join()
+
+
+@app.route('/benchmark/thread_pool/<action>', methods=['POST'])
+def thread_pool_locks_action(action):
+    error, locks = validate_lock_id_or_name(request.json)
+    method = cv.lock_open if action == 'open' else cv.lock_close
+    _thread_pool_fan_out(method, locks)
+    return make_response(jsonify({"status": 200, "body": "done"}), 200)
+
+
+def run(urls, rate, duration):
+    """ Sends requests to urls in turn at the fixed rate, returns latencies of the requests """
+    client = app.test_client()
+    payload = {"ids": [lock.id for lock in cv.locks]}
+
+    def send(url):
+        start = time.perf_counter()
+        response = client.post(url, json=payload)
+        assert response.status_code == 200, response.json
+        return time.perf_counter() - start
+
+    requests_count = int(rate * duration)
+    interval = 1 / rate
+    with ThreadPoolExecutor(max_workers=32) as senders:
+        results = []
+        start = time.perf_counter()
+        for i in range(requests_count):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            results.append(senders.submit(send, urls[i % len(urls)]))
+        latencies = [result.result() for result in results]
+        achieved_rate = requests_count / (time.perf_counter() - start)
+    return latencies, achieved_rate
+
+
+def report(name, latencies, achieved_rate):
+    latencies = sorted(latency * 1000 for latency in latencies)
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+    print(f'{name:>12}: {achieved_rate:6.1f} req/s, '
+          f'mean {statistics.mean(latencies):6.2f} ms, p50 {percentile(0.5):6.2f} ms, '
+          f'p95 {percentile(0.95):6.2f} ms, p99 {percentile(0.99):6.2f} ms, max {latencies[-1]:6.2f} ms')
+
+
+if __name__ == '__main__':
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 150
+    duration = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    before = run(['/benchmark/thread_pool/open', '/benchmark/thread_pool/close'], rate, duration)
+    after = run(['/api/v1/conveyor/locks/open', '/api/v1/conveyor/locks/close'], rate, duration)
+
+    print(f'{len(cv.locks)} locks, {rate} req/s, {duration} s')
+    report('before', *before)
+    report('after', *after)
+    cv.cleanup()
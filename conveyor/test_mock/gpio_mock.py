@@ -1,4 +1,6 @@
 import socket
+import itertools
+import threading
 
 
 class ListenerProtocolClient:
@@ -6,10 +8,17 @@ class ListenerProtocolClient:
     def send_request(self, data):
         raise NotImplemented
 
+    def send_requests(self, data_list):
+        """ Sends several requests, returns responses in the same order """
+        return [self.send_request(data) for data in data_list]
+
+    def close(self):
+        pass
+
 
 class ListenerSocketClient(ListenerProtocolClient):
     def __init__(self, host='localhost', port=42024):
-        """ Simulation listener client based on sockets """
+        """ Simulation listener client based on sockets. One-shot mode: new connection per request """
         self.host = host
         self.port = port
 
@@ -24,6 +33,130 @@ class ListenerSocketClient(ListenerProtocolClient):
             return received
 
 
+class ListenerSession:
+    def __init__(self, host, port, timeout=5):
+        """
+        One long-lived connection to the simulation listener
+
+        Requests are framed by lines and tagged by request id: ``#<id> <command>``,
+        so several of them may be in flight at once (pipelining). Responses are dispatched
+        to the waiters by the reader thread.
+        """
+        self.timeout = timeout
+        self._sock = socket.create_connection((host, port), timeout)
+        self._sock.settimeout(None)
+        self._sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rfile = self._sock.makefile('rb')
+        self._write_lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._pending = {}  # request id -> [threading.Event, response]
+        self._request_ids = itertools.count(1)
+        self.is_alive = True
+        self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+        self._reader_thread.start()
+
+    def _reader(self):
+        try:
+            for line in self._rfile:
+                request_id, _, response = line.rstrip(b'\r\n').partition(b' ')
+                with self._pending_lock:
+                    waiter = self._pending.pop(request_id, None)
+                if waiter is not None:
+                    waiter[1] = str(response, 'utf-8')
+                    waiter[0].set()
+        except (OSError, ValueError):
+            pass
+        finally:
+            self._rfile.close()
+            # wake up everybody who is still waiting, they will get ConnectionError
+            with self._pending_lock:
+                self.is_alive = False
+                waiters, self._pending = list(self._pending.values()), {}
+            for event, _ in waiters:
+                event.set()
+
+    def send_requests(self, data_list):
+        """ Pipelines all the requests by one write, then waits for all the responses """
+        request_ids = []
+        waiters = []
+        frames = []
+        with self._pending_lock:
+            # nobody answers after the reader has stopped, so the requests must not wait for the timeout
+            if not self.is_alive:
+                raise ConnectionError('Listener session has been closed')
+            for data in data_list:
+                request_id = b'#%d' % next(self._request_ids)
+                waiter = [threading.Event(), None]
+                self._pending[request_id] = waiter
+                request_ids.append(request_id)
+                waiters.append(waiter)
+                frames.append(b'%s %s\n' % (request_id, data))
+        try:
+            with self._write_lock:
+                self._sock.sendall(b''.join(frames))
+        except OSError as e:
+            self.close()
+            raise ConnectionError(f'Listener session is broken: {e}') from e
+
+        responses = []
+        for event, _ in waiters:
+            if not event.wait(self.timeout):
+                with self._pending_lock:
+                    for request_id in request_ids:
+                        self._pending.pop(request_id, None)
+                raise TimeoutError('Listener response timeout has been reached')
+        for _, response in waiters:
+            if response is None:
+                raise ConnectionError('Listener session has been closed')
+            responses.append(response)
+        return responses
+
+    def close(self):
+        self.is_alive = False
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+
+
+class ListenerSessionClient(ListenerProtocolClient):
+    def __init__(self, host='localhost', port=42024, pool_size=2, timeout=5):
+        """
+        Simulation listener client based on the pool of long-lived sessions
+
+        Sessions are opened lazily and reopened if broken. Requests are spread over the pool round-robin
+        """
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._sessions = [None] * pool_size
+        self._sessions_lock = threading.Lock()
+        self._next_session_index = itertools.cycle(range(pool_size))
+
+    def _get_session(self):
+        with self._sessions_lock:
+            index = next(self._next_session_index)
+            session = self._sessions[index]
+            if session is None or not session.is_alive:
+                session = ListenerSession(self.host, self.port, self.timeout)
+                self._sessions[index] = session
+            return session
+
+    def send_request(self, data):
+        return self.send_requests([data])[0]
+
+    def send_requests(self, data_list):
+        return self._get_session().send_requests(data_list)
+
+    def close(self):
+        with self._sessions_lock:
+            for session in self._sessions:
+                if session is not None:
+                    session.close()
+            self._sessions = [None] * len(self._sessions)
+
+
 class GPIOMock:
     BOARD = 1
     OUT = 1
@@ -39,6 +172,10 @@ class GPIOMock:
         Works based on simulation protocol client, sends requests with data like:
             - OUTPUT <out_port(int)> <value(0|1)>
             - INPUT <in_port(int)>
+            - OUTPUTS <out_port(int)>:<value(0|1)> [...]
+            - INPUTS <in_port(int)> [...]
+
+        Like the RPI lib, output() takes lists of channels and values too, they are sent by one OUTPUTS request
         """
         self.client = listener_client
 
@@ -55,19 +192,35 @@ class GPIOMock:
         pass
 
     def output(self, out_port, value):
+        if isinstance(out_port, (list, tuple)):
+            values = value if isinstance(value, (list, tuple)) else [value] * len(out_port)
+            self.output_many(zip(out_port, values))
+            return
         command = 'OUTPUT'
         data = self._prepare_command(command, out_port, value)
         self.client.send_request(data)
 
+    def output_many(self, ports_values):
+        """ Writes several ports atomically by one request. Takes (port, value) pairs """
+        command = 'OUTPUTS'
+        data = self._prepare_command(command, *(f'{port}:{value}' for port, value in ports_values))
+        self.client.send_request(data)
+
     def input(self, in_port):
         command = 'INPUT'
         data = self._prepare_command(command, in_port)
         port_input = self.client.send_request(data)
         return int(port_input)
 
-    @staticmethod
-    def cleanup():
-        pass
+    def input_many(self, in_ports):
+        """ Reads several ports by one request, values are captured at one moment """
+        command = 'INPUTS'
+        data = self._prepare_command(command, *in_ports)
+        ports_input = self.client.send_request(data)
+        return [int(port_input) for port_input in ports_input.split()]
+
+    def cleanup(self):
+        self.client.close()
 
     @staticmethod
     def setwarnings(flag):
@@ -1,13 +1,13 @@
 from unittest.mock import patch, MagicMock
 
-from conveyor.test_mock.gpio_mock import GPIOMock, ListenerSocketClient
+from conveyor.test_mock.gpio_mock import GPIOMock, ListenerSessionClient
 
 mock_host, mock_port = 'localhost', 42024
 mock_based_api_host, mock_based_api_port = '127.0.0.1', 5000
 
 MockRPi = MagicMock()
-# fetching simulation-mock
-MockRPi.GPIO = GPIOMock(ListenerSocketClient(mock_host, mock_port))
+# fetching simulation-mock, through the pool of long-lived listener sessions
+MockRPi.GPIO = GPIOMock(ListenerSessionClient(mock_host, mock_port))
 modules = {
     "RPi": MockRPi,
     "RPi.GPIO": MockRPi.GPIO,
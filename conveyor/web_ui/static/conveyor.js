@@ -28,10 +28,40 @@ function status_update(json_resp) {
     })
 }
 
+// true while the push stream is alive, poller is paused then
+let streaming = false;
+
+function start_stream() {
+    if (!window.EventSource) {
+        return;
+    }
+    let event_source = new EventSource(conveyor_api_ip + 'stream');
+    event_source.onopen = function() {
+        streaming = true;
+    };
+    // EventSource reconnects by itself with Last-Event-ID, poller works meanwhile
+    event_source.onerror = function() {
+        streaming = false;
+    };
+    let handler = function(event) {
+        let state = JSON.parse(event.data);
+        let locks_state = Object.keys(state)
+            .filter(key => key.startsWith('lock/') && state[key] !== null)
+            .map(key => state[key]);
+        status_update({'body': {'locks_state': locks_state}});
+    };
+    event_source.addEventListener('state', handler);
+    event_source.addEventListener('delta', handler);
+}
+
 async function get_status() {
     let xhr = new XMLHttpRequest();
 
     while (true) {
+        if (streaming) {
+            await sleep(500);
+            continue;
+        }
 
         let get_status_api_url = conveyor_api_ip + 'status';
         xhr.open('POST', get_status_api_url, true);
@@ -84,4 +114,5 @@ conveyor.addEventListener('click', (event) => {
     }
 });
 
+start_stream();
 get_status();
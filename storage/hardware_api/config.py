@@ -16,3 +16,32 @@ serial_kwargs = dict(
     stopbits=serial.STOPBITS_ONE,
     timeout=0
 )
+# framed request/response protocol with the controller (ACK and DONE answers), instead of the status pins polling
+serial_framed = False
+# in-memory hw api of storage_test_api instead of the serial one, to debug the web apps without the controller
+test_hw_api = False
+
+# ASRS rack size, cells are numbered from 1
+asrs_sides = 2
+asrs_rows = 5
+asrs_columns = 5
+# cell at the ASRS center position of the gantry, for the cells travel time. The middle of the rack if None
+asrs_center_row = None
+asrs_center_column = None
+
+# estimated time of the waypoints for the task planner, seconds by (location name, asrs method name),
+# e.g. ('HOME_CENTER', 'home_center_move'): 4.0. Unknown ones are learned from the executed waypoints
+waypoint_costs = {}
+
+# write-ahead log of the task queue and the location, the storage is restored from it on the start
+journal_file = 'storage_journal.jsonl'
+
+# logging of the storage application, see logging_config.configure_logging()
+log_level = 'DEBUG'
+log_file = 'ASRS.log'
+# JSON record per line in the log file
+log_json = False
+# the log file is rotated by size, or by time if log_rotate_when is set ('midnight', 'H', ...)
+log_max_bytes = 10 * 1024 * 1024
+log_backup_count = 5
+log_rotate_when = None
@@ -0,0 +1,110 @@
+from collections import namedtuple
+
+Cell = namedtuple('Cell', 'side, row, column')
+
+
+class Inventory:
+    def __init__(self, sides, rows, columns):
+        """
+        Occupied cells of the ASRS and the pallets in them
+
+        Occupancy is a bitmap (int, bit per cell), so free/occupied queries and the counts are O(1) whatever
+        the rack size is. Pallet ids are optional: pallet from the conveyor is unknown till it's named
+        """
+        self.sides, self.rows, self.columns = sides, rows, columns
+        self.size = sides * rows * columns
+        self._occupied = 0
+        self._pallets = {}  # cell index -> pallet id
+        self._cells_by_pallet = {}  # pallet id -> cell index
+        self._nearest_orders = {}  # (row, column) -> cell indexes from the nearest one
+        # pallet the gantry holds, picked from the cell
+        self.carried = None
+
+    def _index(self, side, row, column):
+        if not (1 <= side <= self.sides and 1 <= row <= self.rows and 1 <= column <= self.columns):
+            raise ValueError(f'There is no cell side: {side}, row: {row}, column: {column}')
+        return ((side - 1) * self.rows + row - 1) * self.columns + column - 1
+
+    def _cell(self, index):
+        side_row, column = divmod(index, self.columns)
+        side, row = divmod(side_row, self.rows)
+        return Cell(side + 1, row + 1, column + 1)
+
+    def is_occupied(self, side, row, column):
+        return bool(self._occupied >> self._index(side, row, column) & 1)
+
+    def is_free(self, side, row, column):
+        return not self.is_occupied(side, row, column)
+
+    @property
+    def occupied_count(self):
+        return self._occupied.bit_count()
+
+    @property
+    def free_count(self):
+        return self.size - self.occupied_count
+
+    def _set_pallet(self, index, pallet):
+        previous = self._pallets.pop(index, None)
+        if previous is not None:
+            del self._cells_by_pallet[previous]
+        if pallet is not None:
+            if pallet in self._cells_by_pallet:
+                raise ValueError(f'Pallet {pallet!r} is in {self._cell(self._cells_by_pallet[pallet])} already')
+            self._pallets[index] = pallet
+            self._cells_by_pallet[pallet] = index
+
+    def set_cell(self, side, row, column, occupied, pallet=None):
+        """ Sets the cell as is, e.g. on the stocktaking. pallet is for the occupied cell only """
+        index = self._index(side, row, column)
+        if occupied:
+            self._set_pallet(index, pallet)
+            self._occupied |= 1 << index
+        else:
+            self._set_pallet(index, None)
+            self._occupied &= ~(1 << index)
+
+    def pick(self, side, row, column):
+        """ Item has been picked from the cell: it's free, the pallet is carried """
+        index = self._index(side, row, column)
+        self.carried = self._pallets.get(index)
+        self.set_cell(side, row, column, False)
+        return self.carried
+
+    def place(self, side, row, column):
+        """ Carried item has been placed to the cell """
+        self.set_cell(side, row, column, True, self.carried)
+        self.carried = None
+
+    def pallet(self, side, row, column):
+        return self._pallets.get(self._index(side, row, column))
+
+    def find(self, pallet):
+        """ Cell of the pallet, None if it's not in the ASRS """
+        index = self._cells_by_pallet.get(pallet)
+        return None if index is None else self._cell(index)
+
+    def _nearest_order(self, row, column):
+        order = self._nearest_orders.get((row, column))
+        if order is None:
+            # gantry moves by rows and columns, the side is the same for it
+            order = self._nearest_orders[(row, column)] = sorted(
+                range(self.size), key=lambda index: (abs(self._cell(index).row - row) +
+                                                     abs(self._cell(index).column - column), index)
+            )
+        return order
+
+    def nearest_free(self, row=None, column=None, side=None):
+        """ The nearest free cell to (row, column), the center of the rack by default. None if ASRS is full """
+        row = (self.rows + 1) // 2 if row is None else row
+        column = (self.columns + 1) // 2 if column is None else column
+        free = ~self._occupied
+        for index in self._nearest_order(row, column):
+            if free >> index & 1 and (side is None or self._cell(index).side == side):
+                return self._cell(index)
+        return None
+
+    def cells(self):
+        """ Occupied cells with the pallets: [(cell, pallet)] """
+        return [(self._cell(index), self._pallets.get(index))
+                for index in range(self.size) if self._occupied >> index & 1]
@@ -0,0 +1,36 @@
+from unittest import TestCase
+
+from storage.hardware_api.inventory import Inventory, Cell
+
+
+class TestInventory(TestCase):
+
+    def setUp(self):
+        self.inventory = Inventory(2, 5, 5)
+
+    def test_occupancy(self):
+        self.inventory.set_cell(2, 5, 5, True, 'P1')
+        self.assertTrue(self.inventory.is_occupied(2, 5, 5), "Cell must be occupied")
+        self.assertTrue(self.inventory.is_free(1, 5, 5), "Cell of the other side must be free")
+        self.assertEqual(self.inventory.free_count, 49, "Free cells count is incorrect")
+        with self.assertRaises(ValueError, msg="Cell out of the rack has been accepted"):
+            self.inventory.is_free(3, 1, 1)
+
+    def test_pick_place(self):
+        self.inventory.set_cell(1, 1, 1, True, 'P1')
+        self.assertEqual(self.inventory.pick(1, 1, 1), 'P1', "Picked pallet is incorrect")
+        self.inventory.place(2, 3, 4)
+        self.assertEqual(self.inventory.find('P1'), Cell(2, 3, 4), "Pallet has not been moved")
+        self.assertTrue(self.inventory.is_free(1, 1, 1), "Picked cell must be free")
+        self.assertIsNone(self.inventory.carried, "Placed pallet is still carried")
+        with self.assertRaises(ValueError, msg="Pallet has been put to two cells"):
+            self.inventory.set_cell(1, 1, 1, True, 'P1')
+
+    def test_nearest_free(self):
+        self.assertEqual(self.inventory.nearest_free(), Cell(1, 3, 3), "Center of the rack must be the nearest")
+        for side in [1, 2]:
+            self.inventory.set_cell(side, 3, 3, True)
+        self.assertEqual(self.inventory.nearest_free(3, 3, side=2), Cell(2, 2, 3), "Nearest cell is incorrect")
+        for side, row, column in [(side, row, column) for side in [1, 2] for row in range(1, 6) for column in range(1, 6)]:
+            self.inventory.set_cell(side, row, column, True)
+        self.assertIsNone(self.inventory.nearest_free(), "Full ASRS has a free cell")
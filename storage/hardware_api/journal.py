@@ -0,0 +1,223 @@
+import os
+import json
+import logging
+import threading
+
+
+class JournalState:
+    def __init__(self):
+        """
+        State of the storage, as the journal records tell it
+
+        Records are applied idempotently, so a record applied twice (after the compaction) doesn't change anything
+        """
+        self.location = None  # name of the last reached location
+        self.in_transit = None  # name of the location gantry has been moving to, None if it has reached it
+        self.tasks = {}  # pending tasks: id -> enqueue record
+        self.current_task = None  # enqueue record of the started, not completed task
+        self.last_id = 0
+        self.cells = {}  # occupied cells: (side, row, column) -> pallet id or None
+        self.carried = None  # pallet the gantry holds
+
+    def apply(self, record):
+        op = record['op']
+        if op == 'snapshot':
+            self.location = record['location']
+            self.in_transit = record['in_transit']
+            self.tasks = {task['id']: task for task in record['tasks']}
+            self.current_task = record['current_task']
+            self.last_id = record['last_id']
+            self.cells = {tuple(cell): pallet for *cell, pallet in record.get('cells', [])}
+            self.carried = record.get('carried')
+        elif op == 'enqueue':
+            self.tasks[record['id']] = record
+            self.last_id = max(self.last_id, record['id'])
+        elif op == 'enqueue_many':
+            # the batch is one record, so it's durable all or nothing
+            for task in record['tasks']:
+                self.apply({**task, 'op': 'enqueue'})
+        elif op == 'reorder':
+            if record['id'] in self.tasks:
+                self.tasks[record['id']] = {**self.tasks[record['id']], **record, 'op': 'enqueue'}
+        elif op == 'cancel':
+            self.tasks.pop(record['id'], None)
+        elif op == 'start':
+            if record['id'] in self.tasks:
+                self.current_task = self.tasks.pop(record['id'])
+        elif op == 'requeue':
+            # the started task is pending again, e.g. after the hw error
+            if self.current_task is not None and self.current_task['id'] == record['id']:
+                self.tasks[record['id']] = self.current_task
+                self.current_task = None
+        elif op == 'complete':
+            self.tasks.pop(record['id'], None)
+            if self.current_task is not None and self.current_task['id'] == record['id']:
+                self.current_task = None
+        elif op == 'move':
+            self.in_transit = record['to']
+        elif op == 'location':
+            self.location = record['location']
+            self.in_transit = None
+        elif op == 'cell':
+            if record['occupied']:
+                self.cells[tuple(record['cell'])] = record['pallet']
+            else:
+                self.cells.pop(tuple(record['cell']), None)
+            self.carried = record['carried']
+
+    def snapshot_record(self):
+        return {'op': 'snapshot', 'location': self.location, 'in_transit': self.in_transit,
+                'tasks': list(self.tasks.values()), 'current_task': self.current_task, 'last_id': self.last_id,
+                'cells': [[*cell, pallet] for cell, pallet in self.cells.items()], 'carried': self.carried}
+
+
+class Journal:
+    # records are written and fsynced in batches, not often than this (unless somebody waits for a record)
+    fsync_interval = 0.05
+    # the journal is compacted to one snapshot record after this number of records (and on closing)
+    compact_every = 1000
+
+    def __init__(self, path):
+        """
+        Append-only write-ahead log of the storage: JSON record per line
+
+        Records: enqueue (enqueue_many for the batch), reorder, cancel, start, complete of the tasks, move (gantry starts moving to the location),
+        location (it has reached the location) and cell (inventory change). append() is cheap, the writer thread writes and fsyncs
+        the records in batches. Waiting for the record (wait=True) makes it durable before returning,
+        the waiters share one fsync. On opening the journal is replayed to state and compacted.
+        If the records can't be written, the journal is failed: the records are not durable, so append()
+        and sync() raise, and the storage doesn't take the tasks it can't journal
+        """
+        self.path = path
+        self.logger = logging.getLogger(f'{type(self).__name__}')
+        self.state = JournalState()
+        self._condition = threading.Condition()
+        self._buffer = []
+        self._appended = 0  # number of the last appended record
+        self._durable = 0  # number of the last fsynced record
+        self._is_waited = False
+        self._closed = False
+        self._error = None  # OSError of the writing, the journal is failed
+        self._records_count = 0
+
+        self._replay()
+        self._file = None
+        self._compact()
+        self._writer_thread = threading.Thread(target=self._writer, daemon=True)
+        self._writer_thread.start()
+
+    def _replay(self):
+        if not os.path.exists(self.path):
+            self.logger.debug('There is no journal %r, starting from scratch', self.path)
+            return
+        records_count = 0
+        with open(self.path, encoding='utf8') as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last record may be written partially, if power has been cut
+                    self.logger.warning('Broken journal record is skipped: %r', line)
+                    continue
+                self.state.apply(record)
+                records_count += 1
+        self.logger.debug('Journal %r has been replayed: %s records', self.path, records_count)
+
+    def _compact(self):
+        """ Replaces the journal by one snapshot record. It's called by the writer thread only (and on opening) """
+        with self._condition:
+            snapshot = json.dumps(self.state.snapshot_record())
+            # the buffered records are applied to the state already, the snapshot makes them durable
+            self._buffer = []
+            record_number = self._appended
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w', encoding='utf8') as temp_file:
+            temp_file.write(snapshot + '\n')
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if self._file is not None:
+            self._file.close()
+        os.replace(temp_path, self.path)
+        self._fsync_directory()
+        self._file = open(self.path, 'a', encoding='utf8')
+        self._records_count = 0
+        with self._condition:
+            self._durable = record_number
+            self._condition.notify_all()
+
+    def _fsync_directory(self):
+        directory_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(directory_fd)
+        finally:
+            os.close(directory_fd)
+
+    def append(self, record, wait=False) -> int:
+        """ Adds the record, returns its number for sync(). With wait it returns when the record is on the disk """
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('Journal is closed')
+            self._check_error()
+            self.state.apply(record)
+            self._buffer.append(json.dumps(record))
+            if len(self._buffer) == 1:
+                # the writer sleeps till there is something to write
+                self._condition.notify_all()
+            self._appended += 1
+            record_number = self._appended
+        if wait:
+            self.sync(record_number)
+        return record_number
+
+    def sync(self, record_number):
+        """ Waits till the record is on the disk """
+        with self._condition:
+            if self._durable < record_number:
+                self._is_waited = True
+                self._condition.notify_all()
+                self._condition.wait_for(lambda: self._durable >= record_number or self._error is not None)
+            if self._durable < record_number:
+                self._check_error()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError(f'Journal has failed: {self._error}') from self._error
+
+    def _writer(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._buffer or self._is_waited or self._closed)
+                # the first record waits for the rest of the batch, unless somebody waits for it
+                self._condition.wait_for(lambda: self._is_waited or self._closed, self.fsync_interval)
+                lines, self._buffer = self._buffer, []
+                record_number = self._appended
+                self._is_waited = False
+                closed = self._closed
+            try:
+                if lines:
+                    self._file.write('\n'.join(lines) + '\n')
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    self._records_count += len(lines)
+                with self._condition:
+                    self._durable = record_number
+                    self._condition.notify_all()
+                if self._records_count >= self.compact_every or closed and self._records_count:
+                    self._compact()
+            except OSError as e:
+                self.logger.exception('Journal records have not been written, the journal has failed')
+                with self._condition:
+                    self._error = e
+                    self._condition.notify_all()
+                self._file.close()
+                return
+            if closed:
+                self._file.close()
+                return
+
+    def close(self):
+        """ Writes the rest of the records and closes the journal """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._writer_thread.join()
@@ -0,0 +1,121 @@
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from storage.hardware_api.journal import Journal
+
+
+class TestJournal(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _enqueue(self, journal, task_id, location='HOME'):
+        journal.append({'op': 'enqueue', 'id': task_id, 'task': [location], 'priority': 0, 'deadline_at': None})
+
+    def test_replay(self):
+        journal = Journal(self.path)
+        for task_id in [1, 2, 3]:
+            self._enqueue(journal, task_id)
+        journal.append({'op': 'start', 'id': 1})
+        journal.append({'op': 'move', 'to': 'HOME_CENTER'})
+        journal.append({'op': 'location', 'location': 'HOME_CENTER'})
+        journal.append({'op': 'complete', 'id': 1})
+        journal.append({'op': 'cancel', 'id': 2})
+        journal.append({'op': 'start', 'id': 3})
+        journal.append({'op': 'move', 'to': 'HOME'}, wait=True)
+        # power cut: no close()
+
+        state = Journal(self.path).state
+        self.assertEqual(state.location, 'HOME_CENTER', "Location is incorrect")
+        self.assertEqual(state.in_transit, 'HOME', "Interrupted move has not been restored")
+        self.assertEqual(state.current_task['id'], 3, "Interrupted task has not been restored")
+        self.assertEqual(state.tasks, {}, "Pending tasks are incorrect")
+        self.assertEqual(state.last_id, 3, "Last id is incorrect")
+
+    def test_broken_record(self):
+        journal = Journal(self.path)
+        self._enqueue(journal, 1)
+        journal.close()
+        with open(self.path, 'a', encoding='utf8') as journal_file:
+            journal_file.write('{"op": "enq')
+
+        state = Journal(self.path).state
+        self.assertEqual(list(state.tasks), [1], "Records before the broken one have not been restored")
+
+    def test_compaction(self):
+        journal = Journal(self.path)
+        journal.compact_every = 10
+        for task_id in range(1, 101):
+            self._enqueue(journal, task_id)
+            journal.append({'op': 'complete', 'id': task_id})
+        self._enqueue(journal, 101, 'ASRS')
+        journal.close()
+
+        with open(self.path, encoding='utf8') as journal_file:
+            self.assertLess(len(journal_file.readlines()), 20, "Journal has not been compacted")
+        state = Journal(self.path).state
+        self.assertEqual(list(state.tasks), [101], "Compacted journal is incorrect")
+        self.assertEqual(state.tasks[101]['task'], ['ASRS'], "Compacted task is incorrect")
+
+    def test_compaction_of_buffered_records(self):
+        with patch.object(Journal, 'fsync_interval', 10):
+            journal = Journal(self.path)
+            for task_id in [1, 2]:
+                self._enqueue(journal, task_id)
+            journal._compact()
+            journal.sync(2)
+            with open(self.path, encoding='utf8') as journal_file:
+                self.assertEqual(len(journal_file.readlines()), 1, "Records of the snapshot have been appended")
+            journal.close()
+        self.assertEqual(list(Journal(self.path).state.tasks), [1, 2], "Compacted journal is incorrect")
+
+    def test_inventory(self):
+        journal = Journal(self.path)
+        journal.append({'op': 'cell', 'cell': [1, 2, 3], 'occupied': True, 'pallet': 'P1', 'carried': None})
+        journal.append({'op': 'cell', 'cell': [1, 2, 3], 'occupied': False, 'pallet': None, 'carried': 'P1'})
+        journal.append({'op': 'cell', 'cell': [2, 1, 1], 'occupied': True, 'pallet': 'P1', 'carried': None})
+        journal.close()
+
+        state = Journal(self.path).state
+        self.assertEqual(state.cells, {(2, 1, 1): 'P1'}, "Inventory has not been restored")
+        self.assertIsNone(state.carried, "Carried pallet is incorrect")
+
+    def test_write_error(self):
+        class BrokenFile:
+            def __init__(self, journal_file):
+                self.journal_file = journal_file
+
+            def write(self, data):
+                raise OSError('No space left on device')
+
+            def close(self):
+                self.journal_file.close()
+
+        journal = Journal(self.path)
+        journal._file = BrokenFile(journal._file)
+        with self.assertRaises(RuntimeError):
+            self._enqueue(journal, 1)
+            journal.sync(1)
+        with self.assertRaises(RuntimeError):
+            self._enqueue(journal, 2)
+        journal.close()
+        self.assertEqual(Journal(self.path).state.tasks, {}, "Not written records are durable")
+
+    def test_batch(self):
+        journal = Journal(self.path)
+        journal.append({'op': 'enqueue_many', 'tasks': [
+            {'id': task_id, 'task': ['ASRS'], 'priority': 0, 'deadline_at': None} for task_id in [1, 2]
+        ]})
+        journal.append({'op': 'reorder', 'id': 2, 'priority': 5}, wait=True)
+        # power cut: no close()
+
+        state = Journal(self.path).state
+        self.assertEqual(list(state.tasks), [1, 2], "Batch has not been restored")
+        self.assertEqual(state.tasks[2]['priority'], 5, "Batch task has not been reordered")
+        self.assertEqual(state.last_id, 2, "Last id is incorrect")
@@ -0,0 +1,82 @@
+import copy
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+
+from storage.hardware_api import config
+
+LOG_FORMAT = '%(asctime)s - %(name)s.%(funcName)s - %(levelname)s - %(message)s'
+
+_listener = None
+
+
+@atexit.register
+def _stop_listener():
+    """ The rest of the queued records are written """
+    if _listener is not None:
+        _listener.stop()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        """ Only the message is formatted here (args may change later), the rest is done by the listener thread """
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """ Record per line: time, level, logger, function, thread, message and exception if any """
+
+    def format(self, record):
+        entry = {'time': self.formatTime(record), 'level': record.levelname, 'logger': record.name,
+                 'function': record.funcName, 'thread': record.threadName, 'message': record.getMessage()}
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=config.log_level, log_file=config.log_file, json_lines=config.log_json,
+                      max_bytes=config.log_max_bytes, backup_count=config.log_backup_count,
+                      rotate_when=config.log_rotate_when, stream=True):
+    """
+    Configures the root logger for the application: records go to the queue, the handlers are run by the listener
+    thread, so the executor doesn't wait for the SD card writes
+
+    The log file is rotated by time if rotate_when is set ('midnight', 'H', ... as TimedRotatingFileHandler takes),
+    by size otherwise. With json_lines it's a JSON record per line, the stream is the plain text anyway.
+    Calling it again replaces the previous configuration. Returns the listener, it's stopped at exit
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        _listener.stop()
+        # the file of the previous configuration is not held open
+        for handler in _listener.handlers:
+            handler.close()
+        for handler in [handler for handler in root.handlers if isinstance(handler, logging.handlers.QueueHandler)]:
+            root.removeHandler(handler)
+
+    handlers = []
+    if log_file:
+        if rotate_when:
+            file_handler = logging.handlers.TimedRotatingFileHandler(log_file, when=rotate_when,
+                                                                     backupCount=backup_count, encoding='utf8')
+        else:
+            file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes,
+                                                                backupCount=backup_count, encoding='utf8')
+        file_handler.setFormatter(JsonLinesFormatter() if json_lines else logging.Formatter(LOG_FORMAT))
+        handlers.append(file_handler)
+    if stream:
+        stream_handler = logging.StreamHandler()
+        stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        handlers.append(stream_handler)
+
+    log_queue = queue.SimpleQueue()
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
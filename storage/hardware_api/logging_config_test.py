@@ -0,0 +1,42 @@
+import os
+import json
+import logging
+import tempfile
+from unittest import TestCase
+
+from storage.hardware_api import logging_config
+
+
+class TestLoggingConfig(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'ASRS.log')
+        self.root_handlers, self.root_level = logging.getLogger().handlers[:], logging.getLogger().level
+
+    def tearDown(self):
+        logging_config._listener = None
+        root = logging.getLogger()
+        root.handlers[:] = self.root_handlers
+        root.setLevel(self.root_level)
+        self.directory.cleanup()
+
+    def test_json_lines(self):
+        listener = logging_config.configure_logging('DEBUG', self.path, json_lines=True, stream=False)
+        logging.getLogger('executor').debug('Command %s is executed in %.3f s', 'home_move', 1.5)
+        try:
+            raise RuntimeError('Some problems')
+        except RuntimeError as e:
+            logging.getLogger('executor').exception(e)
+        listener.stop()
+        with open(self.path, encoding='utf8') as log_file:
+            record, error_record = [json.loads(line) for line in log_file]
+        self.assertEqual(record['message'], 'Command home_move is executed in 1.500 s', "Message is incorrect")
+        self.assertEqual((record['logger'], record['level']), ('executor', 'DEBUG'), "Record fields are incorrect")
+        self.assertIn('RuntimeError: Some problems', error_record['exception'], "Exception has not been logged")
+
+    def test_reconfiguring(self):
+        listener = logging_config.configure_logging('DEBUG', self.path, stream=False)
+        new_listener = logging_config.configure_logging('DEBUG', f'{self.path}.new', stream=False)
+        new_listener.stop()
+        self.assertIsNone(listener.handlers[0].stream, "File of the previous configuration has not been closed")
@@ -0,0 +1,164 @@
+import logging
+
+
+class TravelCostModel:
+    """
+    Estimated time of the waypoints, by (location name, asrs method name)
+
+    Starts from the default costs (seconds) and learns the measured ones: each executed waypoint
+    is blended into the estimate with the weight alpha
+    """
+    default_cost = 5.0
+    alpha = 0.3
+
+    def __init__(self, costs=None):
+        self.costs = dict(costs or {})
+
+    @staticmethod
+    def _key(location, method_name):
+        return location.name, method_name
+
+    def waypoint_cost(self, waypoint):
+        return self.costs.get(self._key(waypoint.location, waypoint.asrs_method.__name__), self.default_cost)
+
+    def plan_cost(self, waypoints):
+        return sum(self.waypoint_cost(waypoint) for waypoint in waypoints)
+
+    def observe(self, location, method_name, seconds):
+        """ Measured time of the waypoint: the command and waiting till it's done """
+        key = self._key(location, method_name)
+        if key in self.costs:
+            self.costs[key] += self.alpha * (seconds - self.costs[key])
+        else:
+            self.costs[key] = seconds
+
+    @classmethod
+    def from_timings(cls, timings, costs=None):
+        """ Cost model learned from the executor waypoint timings """
+        cost_model = cls(costs)
+        for timing in timings:
+            cost_model.observe(timing.location, timing.method, timing.command + timing.wait_after)
+        return cost_model
+
+
+class TaskPlanner:
+    def __init__(self, cost_model: TravelCostModel, generate_waypoints, pure_move_locations,
+                 asrs_location, pick_location, place_location):
+        """
+        Looks ahead over the pending storage tasks and plans them together
+
+        Task is (destination, *args) tuple as it's queued. generate_waypoints(from_location, task) is the way of one task.
+        Pure moves are the moves between pure_move_locations: they don't pick or place anything, so only the last
+        location of them matters. Relocation is pick_location task followed by place_location one: it starts and ends
+        at asrs_location with the empty gripper. Runs of pure moves and relocations are independent of the order,
+        so they are coalesced: relocations at first (in the queued order, cells may be shared), then one pure move
+        to the final location of the run. Other tasks (conveyor ones, single picks and places) keep their places
+        """
+        self.cost_model = cost_model
+        self.generate_waypoints = generate_waypoints
+        self.pure_move_locations = frozenset(pure_move_locations)
+        self.asrs_location = asrs_location
+        self.pick_location = pick_location
+        self.place_location = place_location
+        self.logger = logging.getLogger(f'{type(self).__name__}')
+
+    @staticmethod
+    def _is_same_waypoint(waypoint, other):
+        return (other is not None and waypoint.location is other.location
+                and waypoint.asrs_method.__name__ == other.asrs_method.__name__
+                and tuple(waypoint.method_args) == tuple(other.method_args))
+
+    def _is_redundant(self, waypoint, last_waypoint):
+        return waypoint.location in self.pure_move_locations and self._is_same_waypoint(waypoint, last_waypoint)
+
+    def remove_redundant_waypoints(self, last_waypoint, waypoints):
+        """
+        Drops the pure moves repeating the previous waypoint, like back-to-back asrs_center_move
+
+        Returns the waypoints as is, if there is nothing to drop (it's the usual case, routes have no repeats inside)
+        """
+        previous_waypoint = last_waypoint
+        for waypoint in waypoints:
+            if self._is_redundant(waypoint, previous_waypoint):
+                break
+            previous_waypoint = waypoint
+        else:
+            return waypoints
+
+        result = []
+        for waypoint in waypoints:
+            if self._is_redundant(waypoint, last_waypoint):
+                continue
+            result.append(waypoint)
+            last_waypoint = waypoint
+        return tuple(result)
+
+    def tasks_cost(self, location, tasks, last_waypoint=None):
+        """ Estimated time of the tasks executed one by one from the location """
+        cost = 0
+        for task in tasks:
+            waypoints = self.remove_redundant_waypoints(last_waypoint, self.generate_waypoints(location, task))
+            cost += self.cost_model.plan_cost(waypoints)
+            if waypoints:
+                last_waypoint = waypoints[-1]
+            location = self._task_end_location(task)
+        return cost
+
+    def _task_end_location(self, task):
+        destination = task[0]
+        if destination in (self.pick_location, self.place_location):
+            return self.asrs_location
+        return destination
+
+    def _coalesce_run(self, run):
+        relocations = [task for task in run if task[0] in (self.pick_location, self.place_location)]
+        end_location = self._task_end_location(run[-1])
+        if relocations and end_location is self._task_end_location(relocations[-1]):
+            return relocations
+        last_move = next(task for task in reversed(run) if task[0] is end_location)
+        return relocations + [last_move]
+
+    def _coalesce(self, location, tasks):
+        planned = []
+        run = []
+        index = 0
+        while index < len(tasks):
+            task = tasks[index]
+            next_task = tasks[index + 1] if index + 1 < len(tasks) else None
+            is_independent = location in self.pure_move_locations
+            if is_independent and task[0] is self.pick_location and next_task is not None \
+                    and next_task[0] is self.place_location:
+                run.extend((task, next_task))
+                index += 2
+                location = self.asrs_location
+                continue
+            if is_independent and task[0] in self.pure_move_locations:
+                run.append(task)
+            else:
+                if run:
+                    planned.extend(self._coalesce_run(run))
+                    run = []
+                planned.append(task)
+            location = self._task_end_location(task)
+            index += 1
+        if run:
+            planned.extend(self._coalesce_run(run))
+        return planned
+
+    def plan(self, location, tasks, last_waypoint=None):
+        """
+        Planned tasks: the subset of the tasks in the new order
+
+        The queued order is kept, if the planned one isn't cheaper by the cost model
+        """
+        tasks = list(tasks)
+        planned = self._coalesce(location, tasks)
+        if planned == tasks:
+            return tasks
+        queued_cost = self.tasks_cost(location, tasks, last_waypoint)
+        planned_cost = self.tasks_cost(location, planned, last_waypoint)
+        if planned_cost >= queued_cost:
+            return tasks
+        self.logger.debug('Tasks have been planned: %s -> %s, estimated %.1f s -> %.1f s',
+                          len(tasks), len(planned), queued_cost, planned_cost)
+        return planned
@@ -0,0 +1,86 @@
+import enum
+from collections import namedtuple
+from unittest import TestCase
+
+from storage.hardware_api.planner import TaskPlanner, TravelCostModel
+
+
+class Location(enum.Enum):
+    HOME = 0
+    HOME_CENTER = 1
+    ASRS = 2
+    PRE_CONVEYOR = 3
+    CONVEYOR = 4
+    ASRS_PICK = 5
+    ASRS_PLACE = 6
+
+
+Waypoint = namedtuple('Waypoint', 'location, asrs_method, method_args')
+Timing = namedtuple('Timing', 'location, method, command, wait_after')
+
+
+def move():
+    pass
+
+
+def pick():
+    pass
+
+
+def place():
+    pass
+
+
+def generate_waypoints(from_location, task):
+    """ Simplified chain HOME - HOME_CENTER - ASRS - PRE_CONVEYOR - CONVEYOR """
+    destination, *args = task
+    to_location = Location.ASRS if destination in (Location.ASRS_PICK, Location.ASRS_PLACE) else destination
+    step = 1 if to_location.value >= from_location.value else -1
+    waypoints = [Waypoint(Location(value), move, ())
+                 for value in range(from_location.value, to_location.value + step, step)]
+    if destination is not to_location:
+        waypoints += [Waypoint(destination, pick if destination is Location.ASRS_PICK else place, tuple(args)),
+                      Waypoint(Location.ASRS, move, ())]
+    return waypoints
+
+
+class TestTaskPlanner(TestCase):
+
+    def setUp(self):
+        self.planner = TaskPlanner(
+            TravelCostModel(), generate_waypoints,
+            pure_move_locations=[Location.HOME, Location.HOME_CENTER, Location.ASRS], asrs_location=Location.ASRS,
+            pick_location=Location.ASRS_PICK, place_location=Location.ASRS_PLACE
+        )
+
+    def test_remove_redundant_waypoints(self):
+        center = Waypoint(Location.ASRS, move, ())
+        waypoints = (center, Waypoint(Location.PRE_CONVEYOR, move, ()), Waypoint(Location.PRE_CONVEYOR, move, ()))
+        self.assertEqual(self.planner.remove_redundant_waypoints(center, waypoints), waypoints[1:],
+                         "Only the repeated pure move must be removed")
+        self.assertIs(self.planner.remove_redundant_waypoints(None, waypoints), waypoints,
+                      "Waypoints without repeats must be returned as is")
+
+    def test_pure_moves_coalescing(self):
+        tasks = [(Location.ASRS,), (Location.HOME,), (Location.HOME_CENTER,)]
+        self.assertEqual(self.planner.plan(Location.HOME, tasks), [(Location.HOME_CENTER,)],
+                         "Pure moves have not been coalesced")
+
+    def test_relocations_reordering(self):
+        relocation_1 = [(Location.ASRS_PICK, 1, 1, 1), (Location.ASRS_PLACE, 1, 2, 1)]
+        relocation_2 = [(Location.ASRS_PICK, 2, 1, 1), (Location.ASRS_PLACE, 2, 2, 2)]
+        tasks = [(Location.HOME,), *relocation_1, (Location.HOME,), *relocation_2, (Location.HOME,)]
+        self.assertEqual(self.planner.plan(Location.ASRS, tasks), [*relocation_1, *relocation_2, (Location.HOME,)],
+                         "Relocations must be done before the final move")
+
+    def test_conveyor_tasks_order(self):
+        tasks = [(Location.ASRS_PICK, 1, 1, 1), (Location.CONVEYOR,), (Location.ASRS_PICK, 1, 1, 2), (Location.CONVEYOR,)]
+        self.assertEqual(self.planner.plan(Location.ASRS, tasks), tasks, "Conveyor tasks must keep the order")
+
+    def test_cost_model(self):
+        cost_model = TravelCostModel.from_timings([Timing(Location.HOME, 'move', 0.5, 1.5),
+                                                   Timing(Location.HOME, 'move', 0.5, 3.5)])
+        self.assertAlmostEqual(cost_model.waypoint_cost(Waypoint(Location.HOME, move, ())), 2.6,
+                               msg="Measured cost is incorrect")
+        self.assertEqual(cost_model.waypoint_cost(Waypoint(Location.ASRS, move, ())), cost_model.default_cost,
+                         "Unknown waypoint must have the default cost")
@@ -0,0 +1,106 @@
+"""
+Micro-benchmark of the storage task planning: waypoints of the task from the current location
+
+Compares the old way generation (slicing the waypoints list, building namedtuples and formatting the debug logs
+on each task) with the precomputed routes table, with debug logging off. Hardware API is the serial mock.
+
+    python -m storage.hardware_api.planning_benchmark [tasks count]
+"""
+import sys
+import time
+import random
+import logging
+from unittest.mock import patch, MagicMock
+
+from storage.hardware_api.storage_test_api import GPIOMock, make_st_hw_api
+
+MockRPi = MagicMock()
+MockRPi.GPIO = GPIOMock()
+modules = {
+    "RPi": MockRPi,
+    "RPi.GPIO": MockRPi.GPIO
+}
+
+with patch.dict("sys.modules", modules):
+    from storage.hardware_api.storage_api import StorageCommandExecutorThread, StorageLocation
+
+
+def legacy_way_methods_list(executor, from_location, to_location):
+    """ _generate_way_methods_list as it was """
+    executor._executor_logger.debug(f'Creating waypoints list'
+                                    f'from {from_location.name!r} to {to_location.name!r}')
+
+    if from_location is to_location:
+        executor._executor_logger.debug('Already at needed position')
+        way_methods_list = []
+    elif to_location.value > from_location.value:
+        executor._executor_logger.debug('Will move in positive direction')
+        way_methods_list = executor.waypoints_list[from_location.value:to_location.value + 1]
+        way_methods_list = [executor.waypoint_nt(w.location, w.asrs_method_positive, ()) for w in way_methods_list]
+    else:
+        executor._executor_logger.debug('Will move in negative direction')
+        way_methods_list = reversed(executor.waypoints_list[to_location.value:from_location.value + 1])
+        way_methods_list = [executor.waypoint_nt(w.location, w.asrs_method_negative, ()) for w in way_methods_list]
+
+    executor._executor_logger.debug(f'Waypoints list: '
+                                    f'{" -> ".join(str(waypoint.location) for waypoint in way_methods_list)}')
+    return way_methods_list
+
+
+def legacy_pick_place_waypoints(executor, from_location, to_location, args):
+    """ _generate_pick_place_waypoints as it was """
+    executor._executor_logger.debug(f'Generating waypoints list for {to_location} in {args}')
+    way_methods_list = legacy_way_methods_list(executor, from_location, StorageLocation.ASRS)
+
+    asrs_methods_map = {StorageLocation.ASRS_PICK: executor.st_api.asrs_pick,
+                        StorageLocation.ASRS_PLACE: executor.st_api.asrs_place}
+
+    asrs_method = asrs_methods_map[to_location]
+    way_methods_list.append(executor.waypoint_nt(to_location, asrs_method, args))
+    way_methods_list.append(executor.waypoint_nt(StorageLocation.ASRS, executor.st_api.asrs_center_move, ()))
+
+    executor._executor_logger.debug(f'Waypoints list: '
+                                    f'{" -> ".join(str(waypoint.location) for waypoint in way_methods_list)}')
+    return way_methods_list
+
+
+def legacy_plan(executor, location, task):
+    destination, *destination_args = task
+    if destination in [StorageLocation.ASRS_PLACE, StorageLocation.ASRS_PICK]:
+        return legacy_pick_place_waypoints(executor, location, destination, destination_args)
+    return legacy_way_methods_list(executor, location, destination)
+
+
+def routes_table_plan(executor, location, task):
+    return executor.planner.remove_redundant_waypoints(None, executor._generate_task_waypoints(location, task))
+
+
+def random_tasks(executor, count):
+    moves = [(waypoint.location,) for waypoint in executor.waypoints_list]
+    cells = [(location, side, row, column)
+             for location in [StorageLocation.ASRS_PICK, StorageLocation.ASRS_PLACE]
+             for side in range(1, executor.SIDES + 1)
+             for row in range(1, executor.ROWS + 1)
+             for column in range(1, executor.COLUMNS + 1)]
+    return [random.choice(moves) if random.random() < 0.5 else random.choice(cells) for _ in range(count)]
+
+
+def run(executor, plan, tasks):
+    """ Plans the tasks one by one from the end location of the previous one, returns tasks/s """
+    location = StorageLocation.HOME
+    start = time.perf_counter()
+    for task in tasks:
+        waypoints = plan(executor, location, task)
+        if waypoints:
+            location = waypoints[-1].location
+    return len(tasks) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    tasks_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    logging.getLogger().setLevel(logging.INFO)
+
+    executor = StorageCommandExecutorThread(make_st_hw_api())
+    tasks = random_tasks(executor, tasks_count)
+    for name, plan in [('old', legacy_plan), ('routes table', routes_table_plan)]:
+        print(f'{name:>12}: {run(executor, plan, tasks):10.0f} tasks/s')
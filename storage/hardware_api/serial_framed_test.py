@@ -0,0 +1,65 @@
+import queue
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from storage.hardware_api.storage_test_api import GPIOMock
+
+MockGPIO = GPIOMock()
+MockGPIO.input = lambda port: 0
+
+with patch.dict("sys.modules", {"RPi": MagicMock(GPIO=MockGPIO), "RPi.GPIO": MockGPIO}):
+    from storage.hardware_api.storage_api import StorageHWAPIBySerialFramed, StorageHWStatus
+
+
+class ControllerSerial:
+    """ Serial port of the controller, which answers ACK and DONE (or ERR for the blocked cell) at once """
+    timeout = 0
+    in_waiting = 0
+
+    def __init__(self, **kwargs):
+        self.answers = queue.Queue()
+
+    def write(self, data):
+        seq, command = data.decode().strip().split(' ', 1)
+        self.answers.put(f'ACK {seq}\r\n'.encode())
+        self.answers.put((f'ERR {seq} blocked\r\n' if command.endswith('2 5 5') else f'DONE {seq}\r\n').encode())
+
+    def read(self, size):
+        try:
+            answer = self.answers.get(timeout=self.timeout)
+        except queue.Empty:
+            return b''
+        return answer
+
+    def close(self):
+        pass
+
+
+class TestStorageHWAPIBySerialFramed(TestCase):
+
+    def setUp(self):
+        with patch('serial.Serial', ControllerSerial):
+            self.st_api = StorageHWAPIBySerialFramed()
+
+    def tearDown(self):
+        self.st_api.close()
+
+    def _wait_idle(self):
+        for _ in range(100):
+            if self.st_api.get_status() is not StorageHWStatus.BUSY:
+                return self.st_api.get_status()
+            self.st_api.wait_status_change(0.05)
+        return self.st_api.get_status()
+
+    def test_completion(self):
+        self.st_api.asrs_pick(1, 2, 3)
+        self.assertIs(self._wait_idle(), StorageHWStatus.IDLE, "Command has not been completed")
+        metrics = self.st_api.latency_metrics()
+        self.assertEqual(metrics['PICK']['count'], 1, "Command latency has not been recorded")
+        self.assertLessEqual(metrics['PICK']['mean_ack'], metrics['PICK']['mean_done'], "ACK must go before DONE")
+
+    def test_error(self):
+        self.st_api.asrs_place(2, 5, 5)
+        self.assertIs(self._wait_idle(), StorageHWStatus.ERROR, "Command error has not been reported")
+        self.st_api.reset_error()
+        self.assertIs(self.st_api.get_status(), StorageHWStatus.IDLE, "Error has not been reset")
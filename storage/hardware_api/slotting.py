@@ -0,0 +1,109 @@
+import math
+import threading
+from collections import Counter
+
+from storage.hardware_api.inventory import Inventory, Cell
+
+
+class CellTravelModel:
+    """
+    Estimated time of the pick or place of the cell, from ASRS center position and back
+
+    Gantry moves by rows and columns at once, so the travel is the slower axis of them. Center cell is where
+    the gripper is at ASRS center position, the middle of the rack by default
+    """
+    row_time = 1.0  # seconds per row
+    column_time = 0.6  # seconds per column
+    handling_time = 4.0  # pick or place itself
+
+    def __init__(self, rows, columns, center_row=None, center_column=None, **times):
+        self.center_row = (rows + 1) / 2 if center_row is None else center_row
+        self.center_column = (columns + 1) / 2 if center_column is None else center_column
+        for name, seconds in times.items():
+            setattr(self, name, seconds)
+
+    def travel_time(self, cell: Cell):
+        return max(abs(cell.row - self.center_row) * self.row_time,
+                   abs(cell.column - self.center_column) * self.column_time)
+
+    def cycle_time(self, cell: Cell):
+        """ ASRS center -> cell -> ASRS center with the pick or place """
+        return 2 * self.travel_time(cell) + self.handling_time
+
+
+class SlotAssigner:
+    # ABC: the most requested types making up this share of the picks are A, then B, the rest are C
+    a_share = 0.8
+    b_share = 0.95
+    # share of the fastest cells of the zones A and B, the rest is C
+    a_zone_share = 0.2
+    b_zone_share = 0.5
+
+    def __init__(self, inventory: Inventory, travel_model: CellTravelModel):
+        """
+        Chooses the cell to place to: the fast one for the often picked pallet type
+
+        Cells are split into the zones by the cycle time, pallet types into the classes by the picks count
+        (ABC analysis), A class is placed to the fastest free cell of A zone and so on. If the zone is full,
+        the next slower zone is tried, then the faster ones. Pallet type of the chosen cell is kept to count its picks,
+        the cell is not chosen again till it's picked or released. Without the type the fastest free cell is chosen
+        """
+        self.inventory = inventory
+        self.travel_model = travel_model
+        cells = [Cell(side, row, column)
+                 for side in range(1, inventory.sides + 1)
+                 for row in range(1, inventory.rows + 1)
+                 for column in range(1, inventory.columns + 1)]
+        self.cells_by_time = sorted(cells, key=lambda cell: (travel_model.cycle_time(cell), cell))
+        a_size = math.ceil(len(cells) * self.a_zone_share)
+        b_size = math.ceil(len(cells) * self.b_zone_share)
+        self.zones = {'A': self.cells_by_time[:a_size],
+                      'B': self.cells_by_time[a_size:b_size],
+                      'C': self.cells_by_time[b_size:]}
+        self.picks = Counter()  # pallet type -> picks count
+        self._cell_types = {}  # cell -> pallet type
+        # cells are chosen by the web api threads and picked by the executor one
+        self._lock = threading.RLock()
+
+    def pallet_class(self, pallet_type):
+        """ 'A', 'B' or 'C' by the picks of the type so far. Unknown type is 'C' """
+        with self._lock:
+            if pallet_type is None or pallet_type not in self.picks:
+                return 'C'
+            count = self.picks[pallet_type]
+            # picks share of the more requested types
+            share = sum(picks for picks in self.picks.values() if picks > count) / sum(self.picks.values())
+        if share < self.a_share:
+            return 'A'
+        return 'B' if share < self.b_share else 'C'
+
+    def choose_cell(self, pallet_type=None, reserved=()):
+        """
+        Free cell for the pallet type, not in the reserved ones (targets of the queued places) and not chosen before.
+        None if full
+        """
+        with self._lock:
+            if pallet_type is None:
+                zones = [self.cells_by_time]
+            else:
+                order = {'A': 'ABC', 'B': 'BCA', 'C': 'CBA'}[self.pallet_class(pallet_type)]
+                zones = [self.zones[zone] for zone in order]
+            for zone in zones:
+                for cell in zone:
+                    if cell not in reserved and cell not in self._cell_types and self.inventory.is_free(*cell):
+                        self._cell_types[cell] = pallet_type
+                        return cell
+            return None
+
+    def picked(self, cell: Cell):
+        """ Counts the pick of the pallet type in the cell """
+        with self._lock:
+            pallet_type = self._cell_types.pop(cell, None)
+            if pallet_type is not None:
+                self.picks[pallet_type] += 1
+            return pallet_type
+
+    def released(self, cell: Cell):
+        """ Forgets the chosen cell: the place to it is cancelled or failed, or the cell is freed by hand """
+        with self._lock:
+            self._cell_types.pop(cell, None)
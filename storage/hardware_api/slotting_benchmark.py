@@ -0,0 +1,73 @@
+"""
+Simulation benchmark of the cell assignment for the placed pallets: random free cell vs the slot assigner
+
+Synthetic order stream: the rack is filled with the pallets of the types evenly, the types are requested
+by Zipf law. Each order picks the fastest pallet of the type, and the replenishment places a new one
+of the same type, so the stock of the types stays even. Cycle time of the pick or place is
+by CellTravelModel (ASRS center -> cell -> ASRS center), no hardware is involved.
+
+    python -m storage.hardware_api.slotting_benchmark [orders count] [sides rows columns]
+"""
+import sys
+import random
+
+from storage.hardware_api.inventory import Inventory
+from storage.hardware_api.slotting import SlotAssigner, CellTravelModel
+
+TYPES_COUNT = 20
+FILL_SHARE = 0.7
+
+
+def demand_weights(types_count, exponent=1.2):
+    return [1 / rank ** exponent for rank in range(1, types_count + 1)]
+
+
+def random_cell(inventory, assigner, rng, pallet_type):
+    free = [cell for cell in assigner.cells_by_time if inventory.is_free(*cell)]
+    return rng.choice(free) if free else None
+
+
+def optimized_cell(inventory, assigner, rng, pallet_type):
+    return assigner.choose_cell(pallet_type)
+
+
+def run(choose_cell, sides, rows, columns, orders_count, seed=1):
+    """ Returns mean cycle time of the pick and the place, seconds """
+    rng = random.Random(seed)
+    types = list(range(TYPES_COUNT))
+    weights = demand_weights(TYPES_COUNT)
+    inventory = Inventory(sides, rows, columns)
+    travel_model = CellTravelModel(rows, columns)
+    assigner = SlotAssigner(inventory, travel_model)
+    cells_by_type = {pallet_type: [] for pallet_type in types}
+
+    def place(pallet_type):
+        cell = choose_cell(inventory, assigner, rng, pallet_type)
+        if cell is None:
+            return None
+        inventory.set_cell(*cell, True)
+        cells_by_type[pallet_type].append(cell)
+        return travel_model.cycle_time(cell)
+
+    for index in range(int(inventory.size * FILL_SHARE)):
+        place(types[index % TYPES_COUNT])
+
+    total_time, operations = 0.0, 0
+    for _ in range(orders_count):
+        pallet_type = rng.choices(types, weights)[0]
+        if not cells_by_type[pallet_type]:
+            continue
+        cell = min(cells_by_type[pallet_type], key=travel_model.cycle_time)
+        cells_by_type[pallet_type].remove(cell)
+        inventory.pick(*cell)
+        assigner.picked(cell)
+        total_time += travel_model.cycle_time(cell) + place(pallet_type)
+        operations += 2
+    return total_time / operations
+
+
+if __name__ == '__main__':
+    orders_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    sides, rows, columns = (int(arg) for arg in sys.argv[2:5]) if len(sys.argv) > 4 else (2, 5, 5)
+    for name, choose_cell in [('random', random_cell), ('optimized', optimized_cell)]:
+        print(f'{name:>9}: {run(choose_cell, sides, rows, columns, orders_count):.3f} s per pick or place')
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from storage.hardware_api.inventory import Inventory, Cell
+from storage.hardware_api.slotting import SlotAssigner, CellTravelModel
+
+
+class TestSlotAssigner(TestCase):
+
+    def setUp(self):
+        self.inventory = Inventory(1, 5, 5)
+        self.assigner = SlotAssigner(self.inventory, CellTravelModel(5, 5, center_row=1, center_column=1))
+
+    def _pick(self, pallet_type, count):
+        for _ in range(count):
+            cell = self.assigner.choose_cell(pallet_type)
+            self.inventory.set_cell(*cell, True)
+            self.inventory.pick(*cell)
+            self.assigner.picked(cell)
+
+    def test_travel_model(self):
+        travel_model = CellTravelModel(5, 5, center_row=1, center_column=1, row_time=1.0, column_time=0.5)
+        self.assertEqual(travel_model.travel_time(Cell(1, 3, 5)), 2.0, "Travel must be by the slower axis")
+
+    def test_fastest_free_cell(self):
+        self.assertEqual(self.assigner.choose_cell(), Cell(1, 1, 1), "Center cell is the fastest")
+        self.inventory.set_cell(1, 1, 1, True)
+        self.assertEqual(self.assigner.choose_cell(reserved={Cell(1, 1, 2)}), Cell(1, 2, 1),
+                         "Reserved cell has been chosen")
+
+    def test_abc_classes(self):
+        self._pick('often', 90)
+        self._pick('rarely', 5)
+        self._pick('once', 1)
+        self.assertEqual([self.assigner.pallet_class(pallet_type) for pallet_type in ['often', 'rarely', 'once', 'new']],
+                         ['A', 'B', 'C', 'C'], "ABC classes are incorrect")
+        a_cell, c_cell = self.assigner.choose_cell('often'), self.assigner.choose_cell('new')
+        self.assertIn(a_cell, self.assigner.zones['A'], "A class must be placed to A zone")
+        self.assertIn(c_cell, self.assigner.zones['C'], "C class must be placed to C zone")
+
+    def test_chosen_cell(self):
+        cell = self.assigner.choose_cell('often')
+        self.assertNotEqual(self.assigner.choose_cell('often'), cell, "Chosen cell has been chosen again")
+        self.assigner.released(cell)
+        self.assertEqual(self.assigner.choose_cell('rarely'), cell, "Released cell has not been chosen")
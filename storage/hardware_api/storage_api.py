@@ -1,45 +1,28 @@
-import os
 import time
+import itertools
 import enum
-import json
 import serial
 import logging
 import threading
-from queue import Queue
-from collections import namedtuple
+from collections import namedtuple, deque, OrderedDict
 from abc import ABC, abstractmethod
 
 import RPi.GPIO as GPIO
 
 from storage.hardware_api import config
+from storage.hardware_api.journal import Journal
+from storage.hardware_api.inventory import Inventory, Cell
+from storage.hardware_api.slotting import SlotAssigner, CellTravelModel
+from storage.hardware_api.planner import TaskPlanner, TravelCostModel
+from storage.hardware_api.task_queue import TaskQueue, QueuedTask
 
 # TODO: create state like LOADED_AT_PICK_SIDE LOADED_AT_PLACE_SIDE, methods and asserts of this states
-# TODO: think about executor queue backup
-# TODO: think about queued tasks removing, or smth like this
 # TODO: think about executor timeout exception
-# TODO: improve logging
 
 # configuring GPIO
 GPIO.setmode(GPIO.BCM)
 GPIO.setwarnings(False)
 
-# configuring logging
-logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
-
-fh = logging.FileHandler('ASRS.log')
-fh.setLevel(logging.DEBUG)
-
-ch = logging.StreamHandler()
-ch.setLevel(logging.DEBUG)
-
-formatter = logging.Formatter('%(asctime)s - %(name)s.%(funcName)s - %(levelname)s - %(message)s')
-fh.setFormatter(formatter)
-ch.setFormatter(formatter)
-
-logger.addHandler(fh)
-logger.addHandler(ch)
-
 
 class StorageLocation(enum.Enum):
     HOME = 0
@@ -65,17 +48,24 @@ class StorageStatus(enum.Enum):
     BUSY = 3
 
 
+class StorageHWError(RuntimeError):
+    """ Hw has reported the error or E_STOP: gantry has stopped somewhere, so the storage needs to be calibrated """
+
+
 class ASRS:
     """ Class for ASRS config storing """
-    ROWS = 5
-    COLUMNS = 5
-    SIDES = 2
+    ROWS = config.asrs_rows
+    COLUMNS = config.asrs_columns
+    SIDES = config.asrs_sides
     # TODO: make it as properties for logging
     location = StorageLocation.HOME
     status = StorageStatus.IDLE
 
 
 class StorageHWAPI(ABC):
+    # status is exact: hw reports the command completion, so BUSY starts with the command and IDLE needs no settling
+    reports_completion = False
+
     @abstractmethod
     def home_move(self):
         ...
@@ -120,6 +110,24 @@ class StorageHWAPI(ABC):
     def status(self):
         return self.get_status()
 
+    def wait_status_change(self, timeout):
+        """
+        Blocks till the status changes or timeout
+
+        Returns False at once if the api can't detect status changes, so caller has to poll the status
+        """
+        return False
+
+    def reset_error(self):
+        """ Forgets the hw error and the commands in progress, e.g. after the calibration """
+
+    def close(self):
+        """ Releases the connection with the hw, the api is not used after it """
+
+    def latency_metrics(self):
+        """ Round-trip latencies of the commands by command name, empty if the api doesn't measure them """
+        return {}
+
 
 class StorageHWAPIBySerial(StorageHWAPI):
     """
@@ -141,13 +149,40 @@ class StorageHWAPIBySerial(StorageHWAPI):
         self.logger.debug('Opening serial connection with ASRS')
         self.ser = serial.Serial(**self.serial_config)
         [GPIO.setup(port, GPIO.IN) for port in self.GPIO_STATUS_PORTS]
+        self._status_changed = threading.Event()
+        self._status_edge_detection = self._enable_status_edge_detection()
 
     def __repr__(self):
         return f'{type(self).__name__}()'
 
     def __del__(self):
+        self.close()
+
+    def close(self):
         self.ser.close()
 
+    def _enable_status_edge_detection(self):
+        """ Status pins edges wake up the status waiters. Returns False if GPIO lib can't detect edges """
+        try:
+            for port in self.GPIO_STATUS_PORTS:
+                # no bouncetime: it swallows the edges, executor waits for the settled status itself
+                GPIO.add_event_detect(port, GPIO.BOTH, callback=self._on_status_edge)
+        except (AttributeError, RuntimeError) as e:
+            self.logger.debug('Status pins edge detection is unavailable, status will be polled: %r', e)
+            return False
+        return True
+
+    def _on_status_edge(self, port):
+        self._status_changed.set()
+
+    def wait_status_change(self, timeout):
+        if not self._status_edge_detection:
+            return False
+        self._status_changed.wait(timeout)
+        # the status is read after this, so the edges till this moment are not lost
+        self._status_changed.clear()
+        return True
+
     def _prepare_command(self, command: str):
         """ Close the ASRS command with separator """
         command = f'{command}{self.COMMAND_SEPARATOR}'.encode(self.COMMAND_ENCODING)
@@ -155,7 +190,7 @@ class StorageHWAPIBySerial(StorageHWAPI):
 
     def _prepare_and_send_command(self, command):
         """ Send command to ASRS """
-        self.logger.debug(f'Sending command to ASRS: {command!r}')
+        self.logger.debug('Sending command to ASRS: %r', command)
         command = self._prepare_command(command)
         self.ser.write(command)
 
@@ -206,24 +241,231 @@ class StorageHWAPIBySerial(StorageHWAPI):
         }
         status = gpio_status_map.get(gpio_status, StorageHWStatus.ERROR)
 
-        self.logger.debug(f'Current status: {status!r}')
+        self.logger.debug('Current status: %r', status)
         return status
 
 
+# sent is time.monotonic(), ack_latency and done_latency are seconds since it
+CommandLatency = namedtuple('CommandLatency', 'command, sent, ack_latency, done_latency')
+
+
+class StorageHWAPIBySerialFramed(StorageHWAPIBySerial):
+    """
+    Hardware API over Serial with the framed request/response protocol
+
+    Command is sent as '<seq> <command>', the controller answers 'ACK <seq>' when it's taken,
+    'DONE <seq>' when it's executed and 'ERR <seq> <text>' if it's failed. Answers are read by the reader thread,
+    so the status is known at once without polling the pins (they are still checked for E_STOP).
+    Round-trip latencies of the commands are kept for the metrics
+    """
+    reports_completion = True
+    # serial read timeout of the reader thread, it checks the stop flag this often
+    read_timeout = 0.05
+    # command not acknowledged in this time is an error
+    ack_timeout = 1.0
+    latencies_size = 256
+
+    def __init__(self):
+        super().__init__()
+        self.ser.timeout = self.read_timeout
+        self._sequence = itertools.count(1)
+        self._lock = threading.Lock()
+        self._pending = {}  # seq -> [command, sent, ack]
+        self._error = None
+        self.latencies = deque(maxlen=self.latencies_size)
+        self._reader_stopped = False
+        self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+        self._reader_thread.start()
+
+    def close(self):
+        """ Stops the reader thread: it holds the api, so __del__ is not called till then """
+        self._reader_stopped = True
+        if self._reader_thread is not threading.current_thread():
+            self._reader_thread.join()
+        super().close()
+
+    def wait_status_change(self, timeout):
+        self._status_changed.wait(timeout)
+        self._status_changed.clear()
+        return True
+
+    def _prepare_and_send_command(self, command):
+        seq = next(self._sequence)
+        self.logger.debug('Sending command %s to ASRS: %r', seq, command)
+        with self._lock:
+            self._pending[seq] = [command, time.monotonic(), None]
+        self.ser.write(self._prepare_command(f'{seq} {command}'))
+
+    def _reader(self):
+        buffer = bytearray()
+        while not self._reader_stopped:
+            try:
+                data = self.ser.read(self.ser.in_waiting or 1)
+            except (serial.SerialException, OSError) as e:
+                self.logger.error('Serial read has failed: %r', e)
+                time.sleep(self.read_timeout)
+                continue
+            buffer += data
+            while b'\n' in buffer:
+                frame, _, buffer = buffer.partition(b'\n')
+                frame = frame.decode(self.COMMAND_ENCODING, errors='replace').strip()
+                if frame:
+                    self._on_frame(frame)
+
+    def _on_frame(self, frame):
+        now = time.monotonic()
+        kind, _, rest = frame.partition(' ')
+        seq, _, text = rest.partition(' ')
+        with self._lock:
+            pending = self._pending.get(int(seq)) if seq.isdigit() else None
+            if pending is None:
+                self.logger.warning('Unexpected answer of ASRS: %r', frame)
+                return
+            command, sent, ack = pending
+            if kind == 'ACK':
+                pending[2] = now
+            elif kind == 'DONE':
+                del self._pending[int(seq)]
+                self.latencies.append(CommandLatency(command, sent, (ack or now) - sent, now - sent))
+            elif kind == 'ERR':
+                del self._pending[int(seq)]
+                self._error = f'{command!r}: {text}'
+            else:
+                self.logger.warning('Unknown answer of ASRS: %r', frame)
+                return
+        self.logger.debug('ASRS answer: %r', frame)
+        self._status_changed.set()
+
+    def get_status(self):
+        if super().get_status() is StorageHWStatus.E_STOP:
+            return StorageHWStatus.E_STOP
+        now = time.monotonic()
+        with self._lock:
+            if self._error is None:
+                for command, sent, ack in self._pending.values():
+                    if ack is None and now - sent > self.ack_timeout:
+                        self._error = f'{command!r} has not been acknowledged in {self.ack_timeout} s'
+            if self._error is not None:
+                self.logger.error('ASRS error: %s', self._error)
+                return StorageHWStatus.ERROR
+            return StorageHWStatus.BUSY if self._pending else StorageHWStatus.IDLE
+
+    def reset_error(self):
+        with self._lock:
+            self._error = None
+            self._pending.clear()
+
+    def latency_metrics(self):
+        """ Mean, p95 and max of ACK and DONE round-trip latencies by command name (PICK, PLACE) """
+        latencies_by_command = {}
+        for latency in list(self.latencies):
+            latencies_by_command.setdefault(latency.command.split()[0], []).append(latency)
+        metrics = {}
+        for command, latencies in latencies_by_command.items():
+            metrics[command] = {'count': len(latencies)}
+            for name in ['ack', 'done']:
+                values = sorted(getattr(latency, f'{name}_latency') for latency in latencies)
+                metrics[command][f'mean_{name}'] = sum(values) / len(values)
+                metrics[command][f'p95_{name}'] = values[min(len(values) - 1, int(len(values) * 0.95))]
+                metrics[command][f'max_{name}'] = values[-1]
+        return metrics
+
+
+WaypointTiming = namedtuple('WaypointTiming', 'location, method, started, wait_before, command, wait_after')
+
+
 class StorageCommandExecutorThread(ASRS):
     idle_wait_timeout = 30
-
-    def __init__(self, storage_hw_api: StorageHWAPI):
+    # status must stay IDLE this long to be trusted: status pins bounce on the transitions
+    idle_settle_time = 0.05
+    # hw raises BUSY in this time after the command. IDLE before it means the command is not taken yet
+    busy_start_timeout = 0.5
+    # status polling, if hw api can't detect status changes: starts fast, backs off while hw is BUSY
+    status_poll_min_interval = 0.01
+    status_poll_max_interval = 0.2
+    status_poll_backoff = 1.5
+    # waypoints timings kept for the metrics
+    waypoint_timings_size = 256
+    # finished tasks results and batches kept for the status queries
+    results_size = 1024
+    # executor waiting for the calibration checks the stop this often
+    stop_check_interval = 0.1
+
+    def __init__(self, storage_hw_api: StorageHWAPI, journal: Journal = None):
         self.st_api = storage_hw_api
         self._executor_logger = logging.getLogger(f'{type(self).__name__}(executor_thread)')
         self._executor_logger.debug('Initializing the executor thread')
+        self._state_subscribers = []
+        self._location = ASRS.location
+        self._status = ASRS.status
+        self._current_task = None
+        self._current_task_id = None
+        self.waypoint_timings = deque(maxlen=self.waypoint_timings_size)
+        # since when hw is known as settled IDLE, None after the command
+        self._hw_idle_since = None
+        # the last executed waypoint, None if it's unknown (at start, after the errors)
+        self._last_waypoint = None
         self._init_waypoints_stuff()
-        self._task_queue = Queue()
+        self._task_queue = TaskQueue(last_id=0 if journal is None else journal.state.last_id)
+        # results of the finished tasks and the batches for the status queries, the latest results_size of them
+        self._task_results = OrderedDict()
+        self._batches = OrderedDict()
+        self._batch_ids = itertools.count(1)
+        self._results_lock = threading.Lock()
+        self.inventory = Inventory(self.SIDES, self.ROWS, self.COLUMNS)
+        self.slot_assigner = SlotAssigner(self.inventory, CellTravelModel(
+            self.ROWS, self.COLUMNS, config.asrs_center_row, config.asrs_center_column
+        ))
+        # the cell is chosen and the place to it is queued at once, so the next choice sees it
+        self._place_lock = threading.Lock()
+        # journal records of the task must go in the order of the task events: enqueue, start, complete
+        self.journal = journal
+        self._journal_lock = threading.Lock()
+        # tasks are not executed till the location is known
+        self._calibrated = threading.Event()
+        self._calibrated.set()
+        if self.journal is not None:
+            self._restore_from_journal()
+        self.planner = TaskPlanner(
+            TravelCostModel(config.waypoint_costs), self._generate_task_waypoints,
+            pure_move_locations=[StorageLocation.HOME, StorageLocation.HOME_CENTER, StorageLocation.ASRS],
+            asrs_location=StorageLocation.ASRS,
+            pick_location=StorageLocation.ASRS_PICK, place_location=StorageLocation.ASRS_PLACE
+        )
         self._executor_thread = threading.Thread(target=self._executor)
         self._executor_thread.daemon = True
         self._executor_stopped = False
         self._executor_thread.start()
-        self._current_task = None
+
+    def subscribe(self, callback):
+        """ callback() is called on each change of location, status, queue or current task. It must be short """
+        self._state_subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self._state_subscribers.remove(callback)
+
+    def _on_state_change(self):
+        for callback in list(self._state_subscribers):
+            callback()
+
+    @property
+    def location(self):
+        return self._location
+
+    @location.setter
+    def location(self, location):
+        self._location = location
+        self._journal_append({'op': 'location', 'location': location.name})
+        self._on_state_change()
+
+    @property
+    def status(self):
+        return self._status
+
+    @status.setter
+    def status(self, status):
+        self._status = status
+        self._on_state_change()
 
     def _init_waypoints_stuff(self):
         raw_waypoint_nt = namedtuple('RawWaypoint', 'location, asrs_method_positive, asrs_method_negative')
@@ -236,126 +478,433 @@ class StorageCommandExecutorThread(ASRS):
             raw_waypoint_nt(StorageLocation.PRE_CONVEYOR, self.st_api.pre_conv_place, self.st_api.pre_conv_pick),
             raw_waypoint_nt(StorageLocation.CONVEYOR, self.st_api.conv_place, self.st_api.conv_pick)
         ]
+        self._init_routes_table()
 
-    def _generate_way_methods_list(self, from_location: StorageLocation, to_location: StorageLocation) -> list:
-        """ Generates the way methods list from one location to another """
-        # think about the reasons to rewrite it with collections.OrderedDict
-        self._executor_logger.debug(f'Creating waypoints list'
-                                    f'from {from_location.name!r} to {to_location.name!r}')
-
+    def _build_way(self, from_location: StorageLocation, to_location: StorageLocation) -> tuple:
+        """ The way from one location to another by the waypoints chain """
         if from_location is to_location:
-            self._executor_logger.debug('Already at needed position')
-            way_methods_list = []
+            return ()
         elif to_location.value > from_location.value:
-            self._executor_logger.debug('Will move in positive direction')
-            way_methods_list = self.waypoints_list[from_location.value:to_location.value + 1]
-            way_methods_list = [self.waypoint_nt(w.location, w.asrs_method_positive, ()) for w in way_methods_list]
+            return tuple(self.waypoint_nt(w.location, w.asrs_method_positive, ())
+                         for w in self.waypoints_list[from_location.value:to_location.value + 1])
         else:
-            self._executor_logger.debug('Will move in negative direction')
-            way_methods_list = reversed(self.waypoints_list[to_location.value:from_location.value + 1])
-            way_methods_list = [self.waypoint_nt(w.location, w.asrs_method_negative, ()) for w in way_methods_list]
-
-        self._executor_logger.debug(f'Waypoints list: '
-                                    f'{" -> ".join(str(waypoint.location) for waypoint in way_methods_list)}')
-        return way_methods_list
-
-    def _generate_pick_place_waypoints(self, from_location: StorageLocation, to_location: StorageLocation, args):
-        self._executor_logger.debug(f'Generating waypoints list for {to_location} in {args}')
-        way_methods_list = self._generate_way_methods_list(from_location, StorageLocation.ASRS)
-
-        asrs_methods_map = {StorageLocation.ASRS_PICK: self.st_api.asrs_pick,
-                            StorageLocation.ASRS_PLACE: self.st_api.asrs_place}
+            return tuple(self.waypoint_nt(w.location, w.asrs_method_negative, ())
+                         for w in reversed(self.waypoints_list[to_location.value:from_location.value + 1]))
 
-        asrs_method = asrs_methods_map[to_location]
-        pick_place_waypoint = self.waypoint_nt(to_location, asrs_method, args)
-        way_methods_list.append(pick_place_waypoint)
+    def _init_routes_table(self):
+        """
+        All-pairs routes {from location: {task: waypoints tuple}}, task is (destination, *args) as it's queued
 
+        Pick and place routes are built for each cell, so planning of a task is a lookup without allocations
+        """
         asrs_center_waypoint = self.waypoint_nt(StorageLocation.ASRS, self.st_api.asrs_center_move, ())
-        way_methods_list.append(asrs_center_waypoint)
-
-        self._executor_logger.debug(f'Waypoints list: '
-                                    f'{" -> ".join(str(waypoint.location) for waypoint in way_methods_list)}')
+        cell_waypoints = [
+            self.waypoint_nt(location, asrs_method, (side, row, column))
+            for location, asrs_method in [(StorageLocation.ASRS_PICK, self.st_api.asrs_pick),
+                                          (StorageLocation.ASRS_PLACE, self.st_api.asrs_place)]
+            for side in range(1, self.SIDES + 1)
+            for row in range(1, self.ROWS + 1)
+            for column in range(1, self.COLUMNS + 1)
+        ]
 
-        return way_methods_list
+        self._routes = {}
+        for from_location in StorageLocation:
+            routes = self._routes[from_location] = {}
+            for waypoint in self.waypoints_list:
+                routes[(waypoint.location,)] = self._build_way(from_location, waypoint.location)
+            way_to_asrs = routes[(StorageLocation.ASRS,)]
+            for cell_waypoint in cell_waypoints:
+                routes[(cell_waypoint.location, *cell_waypoint.method_args)] = \
+                    way_to_asrs + (cell_waypoint, asrs_center_waypoint)
 
-    def move_to_location(self, location: StorageLocation, *args):
-        """ Move from current position to the destination """
-        self._executor_logger.debug(f'Put the destination in the queue: {location} '
-                                    f'with args: {args}')
-        self._task_queue.put((location, *args))
-        self._executor_logger.debug(f'Queue: {self._task_queue.queue}')
+    def _generate_way_methods_list(self, from_location: StorageLocation, to_location: StorageLocation) -> tuple:
+        """ The way methods from one location to another """
+        return self._routes[from_location][(to_location,)]
 
-    def _run_asrs_method_and_wait_till_execution(self, asrs_method, *args):
-        self._executor_logger.debug(f'Got some asrs_method to execute: {asrs_method.__code__.co_name} '
-                                    f'with args: {args}')
+    def _generate_pick_place_waypoints(self, from_location: StorageLocation, to_location: StorageLocation, args):
+        """ The way methods to the ASRS cell, picking or placing there and returning to the ASRS center """
+        return self._routes[from_location][(to_location, *args)]
+
+    def _generate_task_waypoints(self, from_location: StorageLocation, task) -> tuple:
+        try:
+            return self._routes[from_location][task]
+        except KeyError:
+            raise ValueError(f'There is no route from {from_location} for the task {task}') from None
+
+    def _journal_append(self, record, wait=False):
+        if self.journal is not None:
+            return self.journal.append(record, wait)
+
+    def _journal_sync(self, record_number):
+        if self.journal is not None:
+            self.journal.sync(record_number)
+
+    def _restore_from_journal(self):
+        """ Restores the location and the pending tasks. Executor thread is not started yet """
+        state = self.journal.state
+        if state.location is not None:
+            self._location = StorageLocation[state.location]
+        if state.in_transit is not None:
+            # power has been cut during the move: gantry is somewhere between these locations
+            self._executor_logger.warning('Storage has been stopped moving from %s to %s, it needs to be calibrated',
+                                          state.location, state.in_transit)
+            self._status = StorageStatus.NEED_TO_CALIBRATE
+            self._calibrated.clear()
+        if state.current_task is not None:
+            # it's done partially, the item may be picked already, so it's not repeated
+            self._executor_logger.warning('Task %s has been interrupted, it is not restored', state.current_task)
+            self.journal.append({'op': 'complete', 'id': state.current_task['id'], 'interrupted': True})
+        now, now_at = time.monotonic(), time.time()
+        for record in sorted(state.tasks.values(), key=lambda record: record['id']):
+            destination, *args = record['task']
+            deadline = None if record['deadline_at'] is None else record['deadline_at'] - now_at
+            self._task_queue.put((StorageLocation[destination], *args), record['priority'], deadline,
+                                 task_id=record['id'])
+        for cell, pallet in state.cells.items():
+            self.inventory.set_cell(*cell, True, pallet)
+        self.inventory.carried = state.carried
+        self._executor_logger.debug('Restored from the journal: location %s, status %s, %s tasks',
+                                    self._location, self._status, len(state.tasks))
+
+    def set_inventory_cell(self, side, row, column, occupied, pallet=None):
+        """ Sets the cell as is, e.g. on the stocktaking or when the placed pallet from the conveyor gets its id """
+        self.inventory.set_cell(side, row, column, occupied, pallet)
+        if not occupied:
+            self.slot_assigner.released(Cell(side, row, column))
+        self._journal_inventory_cell(side, row, column, wait=True)
+        self._on_state_change()
+
+    def _journal_inventory_cell(self, side, row, column, wait=False):
+        self._journal_append({'op': 'cell', 'cell': [side, row, column],
+                              'occupied': self.inventory.is_occupied(side, row, column),
+                              'pallet': self.inventory.pallet(side, row, column),
+                              'carried': self.inventory.carried}, wait)
+
+    def _check_inventory(self, task):
+        """ Placing to the occupied cell must not reach the hw. Cell may be taken after the task is queued """
+        destination, *cell = task
+        if destination is StorageLocation.ASRS_PLACE and self.inventory.is_occupied(*cell):
+            raise RuntimeError(f'Cell {cell} is occupied, task {task} is skipped')
+        if destination is StorageLocation.ASRS_PICK and self.inventory.is_free(*cell):
+            # inventory may be not stocktaken yet
+            self._executor_logger.warning('Picking from the cell %s, which is free by the inventory', cell)
+
+    def _update_inventory(self, waypoint):
+        if waypoint.location is StorageLocation.ASRS_PICK:
+            self.inventory.pick(*waypoint.method_args)
+            self.slot_assigner.picked(Cell(*waypoint.method_args))
+        elif waypoint.location is StorageLocation.ASRS_PLACE:
+            self.inventory.place(*waypoint.method_args)
+        else:
+            return
+        self._journal_inventory_cell(*waypoint.method_args)
+
+    def calibrate(self, location: StorageLocation):
+        """ Sets the actual location (e.g. after the manual check) and resumes the tasks execution """
+        self._executor_logger.debug('Calibrated at %s', location)
+        self.st_api.reset_error()
+        self._location = location
+        self._journal_append({'op': 'location', 'location': location.name}, wait=True)
+        self.status = StorageStatus.IDLE
+        self._calibrated.set()
+
+    def _plan_queue(self):
+        """ Coalesces and reorders the pending tasks of the same urgency by the planner, right in the queue """
+        location, last_waypoint = self.location, self._last_waypoint
+        task_ids = {queued_task.id for queued_task in self._task_queue.tasks()}
+        if self._task_queue.replan(lambda tasks: self.planner.plan(location, tasks, last_waypoint)):
+            self._executor_logger.debug('Queue has been planned: %s', self._task_queue.tasks())
+            # coalesced tasks are done by the others
+            for task_id in task_ids - {queued_task.id for queued_task in self._task_queue.tasks()}:
+                self._journal_append({'op': 'complete', 'id': task_id})
+                self._set_task_result(task_id, 'done')
+            self._on_state_change()
+
+    def move_to_location(self, location: StorageLocation, *args, priority=QueuedTask.DEFAULT_PRIORITY, deadline=None):
+        """
+        Move from current position to the destination. Returns id of the queued task
+
+        Greater priority is executed earlier, deadline is seconds from now, till which the task has to be started
+        """
+        self._executor_logger.debug('Put the destination in the queue: %s with args: %s, priority: %s, deadline: %s',
+                                    location, args, priority, deadline)
+        return self.move_to_locations([((location, *args), priority, deadline)])[0]
+
+    def move_to_locations(self, tasks) -> list:
+        """ Queues [(task, priority, deadline)] at once, task is (location, *args). Returns ids of the tasks """
+        if not tasks:
+            return []
+        with self._journal_lock:
+            task_ids = self._task_queue.put_many(tasks)
+            # one record for all of them: the batch is restored after the crash as a whole or not at all
+            record_number = self._journal_append({'op': 'enqueue_many', 'tasks': [
+                {'id': task_id, 'task': [location.name, *args], 'priority': priority,
+                 'deadline_at': None if deadline is None else time.time() + deadline}
+                for task_id, ((location, *args), priority, deadline) in zip(task_ids, tasks)
+            ]})
+        # tasks are on the disk before the client knows about them
+        self._journal_sync(record_number)
+        self._on_state_change()
+        return task_ids
+
+    def submit_batch(self, tasks):
+        """ Queues [(task, priority, deadline)] at once, for the batch_status(). Returns batch id and ids of the tasks """
+        task_ids = self.move_to_locations(tasks)
+        with self._results_lock:
+            batch_id = next(self._batch_ids)
+            self._batches[batch_id] = task_ids
+            if len(self._batches) > self.results_size:
+                self._batches.popitem(last=False)
+        return batch_id, task_ids
+
+    def _set_task_result(self, task_id, result):
+        with self._results_lock:
+            self._task_results[task_id] = result
+            if len(self._task_results) > self.results_size:
+                self._task_results.popitem(last=False)
+
+    def task_status(self, task_id):
+        """ 'queued', 'running', 'done', 'failed', 'cancelled' or None if the task is unknown (or forgotten) """
+        with self._results_lock:
+            if task_id in self._task_results:
+                return self._task_results[task_id]
+        if task_id == self._current_task_id:
+            return 'running'
+        if any(queued_task.id == task_id for queued_task in self._task_queue.tasks()):
+            return 'queued'
+        return None
+
+    def batch_status(self, batch_id):
+        """ [(task id, task status)] of the batch, None if the batch is unknown """
+        with self._results_lock:
+            task_ids = self._batches.get(batch_id)
+        if task_ids is None:
+            return None
+        return [(task_id, self.task_status(task_id)) for task_id in task_ids]
+
+    def cancel_task(self, task_id):
+        """ Removes the pending task from the queue. Returns False if it's not in the queue (done or executing) """
+        tasks = [queued_task.task for queued_task in self._task_queue.tasks() if queued_task.id == task_id]
+        is_cancelled = self._task_queue.cancel(task_id)
+        if is_cancelled:
+            self._journal_append({'op': 'cancel', 'id': task_id}, wait=True)
+            self._set_task_result(task_id, 'cancelled')
+            self._release_place_cell(tasks[0])
+            self._executor_logger.debug('Task %s has been cancelled', task_id)
+            self._on_state_change()
+        return is_cancelled
+
+    def reorder_task(self, task_id, priority=None, deadline=None):
+        """ Changes priority and (or) deadline of the pending task. Returns False if it's not in the queue """
+        is_reordered = self._task_queue.reorder(task_id, priority, deadline)
+        if is_reordered:
+            record = {'op': 'reorder', 'id': task_id}
+            if priority is not None:
+                record['priority'] = priority
+            if deadline is not None:
+                record['deadline_at'] = time.time() + deadline
+            self._journal_append(record, wait=True)
+            self._executor_logger.debug('Task %s has got priority: %s, deadline: %s', task_id, priority, deadline)
+            self._on_state_change()
+        return is_reordered
+
+    def _run_asrs_method_and_wait_till_execution(self, location, asrs_method, *args):
+        self._executor_logger.debug('Got some asrs_method to execute: %s with args: %s',
+                                    asrs_method.__code__.co_name, args)
+        started = time.time()
+        start_time = time.monotonic()
         self._wait_till_idle()
-        self._executor_logger.debug(f'Executing {asrs_method.__code__.co_name} with args {args}')
+        command_time = time.monotonic()
+        self._executor_logger.debug('Executing %s with args %s', asrs_method.__code__.co_name, args)
+        self._hw_idle_since = None
+        # gantry leaves the location: if it's not reached, location is unknown after the restart
+        self._journal_append({'op': 'move', 'to': location.name}, wait=True)
         asrs_method(*args)  # *method_args
-        self._wait_till_idle()
-        self._executor_logger.debug(f'Command {asrs_method.__code__.co_name} is executed')
-
-    def _wait_till_idle(self):
+        wait_after_time = time.monotonic()
+        self._wait_till_idle(expect_busy=True)
+        end_time = time.monotonic()
+        timing = WaypointTiming(location, asrs_method.__name__, started,
+                                command_time - start_time, wait_after_time - command_time, end_time - wait_after_time)
+        self.waypoint_timings.append(timing)
+        self.planner.cost_model.observe(location, timing.method, timing.command + timing.wait_after)
+        self._executor_logger.debug('Command %s is executed in %.3f s',
+                                    asrs_method.__code__.co_name, end_time - start_time)
+
+    def _wait_till_idle(self, expect_busy=False):
+        """
+        Waits till the hw status is IDLE for idle_settle_time
+
+        With expect_busy (right after the command) IDLE is not trusted till hw has raised BUSY,
+        or busy_start_timeout has passed (the command is done at once).
+        Status changes are awaited by the hw api (status pins edges) if it can, otherwise status is polled
+        """
         self._executor_logger.debug('Waiting till IDLE hw state')
-        time.sleep(0.5)
-        if self.st_api.status is StorageHWStatus.IDLE:
-            self._executor_logger.debug('Current state is IDLE already')
-            return
+        start_time = time.monotonic()
+        poll_interval = self.status_poll_min_interval
+        # exact status is BUSY right after the command and IDLE when it's done
+        busy_seen = not expect_busy or self.st_api.reports_completion
+        settle_time = 0 if self.st_api.reports_completion else self.idle_settle_time
+        # IDLE settled after the previous command is still trusted, if it's IDLE now
+        idle_since = self._hw_idle_since
+        while True:
+            now = time.monotonic()
+            if now - start_time > self.idle_wait_timeout:
+                raise TimeoutError("timeout has been reached")
 
-        waiting_start_time = time.time()
-        while time.time() - waiting_start_time < self.idle_wait_timeout:
             status = self.st_api.status
-            if status is StorageHWStatus.IDLE:
-                self._executor_logger.debug('Current state is IDLE, stops waiting')
-                return
-            elif status is StorageHWStatus.BUSY:
-                self._executor_logger.debug('Current state is BUSY, going to sleep')
-                time.sleep(0.5)
+            if status is StorageHWStatus.BUSY:
+                busy_seen = True
+                idle_since = None
+                # nothing to do till the status changes
+                timeout = self.status_poll_max_interval
+            elif status is StorageHWStatus.IDLE:
+                if idle_since is None:
+                    idle_since = now
+                idle_deadline = idle_since + settle_time
+                if not busy_seen:
+                    idle_deadline = max(idle_deadline, start_time + self.busy_start_timeout)
+                if now >= idle_deadline:
+                    self._hw_idle_since = idle_since
+                    self._executor_logger.debug('Current state is IDLE, waited %.3f s', now - start_time)
+                    return
+                timeout = idle_deadline - now
             else:
-                raise RuntimeError(f"Some problems. Error: {status}")
-
-        raise TimeoutError("timeout has been reached")
+                raise StorageHWError(f"Some problems. Error: {status}")
+
+            if not self.st_api.wait_status_change(timeout):
+                time.sleep(min(timeout, poll_interval))
+                poll_interval = min(poll_interval * self.status_poll_backoff, self.status_poll_max_interval)
+
+    def waypoint_metrics(self):
+        """ Mean and max timings of the recent waypoints by location: waiting before, command, waiting after """
+        timings_by_location = {}
+        for timing in list(self.waypoint_timings):
+            timings_by_location.setdefault(timing.location, []).append(timing)
+
+        metrics = {}
+        for location, timings in timings_by_location.items():
+            totals = [timing.wait_before + timing.command + timing.wait_after for timing in timings]
+            metrics[location.name] = {
+                'count': len(timings),
+                'mean_wait_before': sum(timing.wait_before for timing in timings) / len(timings),
+                'mean_wait_after': sum(timing.wait_after for timing in timings) / len(timings),
+                'mean_total': sum(totals) / len(timings),
+                'max_total': max(totals),
+            }
+        return metrics
 
     def _executor(self):
         self._executor_logger.debug("Executor thread initialized")
         while True:
             # i can't find another way to stabilize executor thread
             try:
-                if self._executor_stopped and self._task_queue.empty():
+                # tasks waiting for the calibration are not executed, they stay in the journal
+                if self._executor_stopped and (self._task_queue.empty() or not self._calibrated.is_set()):
                     self._executor_logger.debug('It\'s time to STOP')
                     break
 
+                if not self._calibrated.wait(self.stop_check_interval):
+                    continue
                 current_location = self.location
-                destination, *destination_args = self._task_queue.get()
+                self._plan_queue()
+                queued_task = self._task_queue.get()
+                if queued_task is None:
+                    # queue has been closed by stop()
+                    continue
+                destination, *destination_args = task = queued_task.task
+                # the task is out of the queue, so it's the current one at once: task_status() never loses it
                 self._current_task = [destination, *destination_args]
-
-                self._executor_logger.debug(f'Need to move from {current_location} to {destination}')
-
-                if destination in [StorageLocation.ASRS_PLACE, StorageLocation.ASRS_PICK]:
-                    way_methods_list = self._generate_pick_place_waypoints(current_location,
-                                                                           destination,
-                                                                           destination_args)
-                else:
-                    way_methods_list = self._generate_way_methods_list(current_location, destination)
+                self._current_task_id = queued_task.id
+                with self._journal_lock:
+                    self._journal_append({'op': 'start', 'id': queued_task.id})
+                self._on_state_change()
+
+                self._check_inventory(task)
+                way_methods_list = self._generate_task_waypoints(current_location, task)
+                way_methods_list = self.planner.remove_redundant_waypoints(self._last_waypoint, way_methods_list)
+                if self._executor_logger.isEnabledFor(logging.DEBUG):
+                    waypoints = " -> ".join(str(waypoint.location) for waypoint in way_methods_list)
+                    self._executor_logger.debug('Need to move from %s to %s, waypoints: %s',
+                                                current_location, destination, waypoints)
 
                 if way_methods_list:
-                    self._executor_logger.debug(f'Calling the methods from way_methods_list one by one')
+                    self._executor_logger.debug('Calling the methods from way_methods_list one by one')
                     self.status = StorageStatus.BUSY
-                    for location, asrs_method, method_args in way_methods_list:
-                        self._run_asrs_method_and_wait_till_execution(asrs_method, *method_args)
-                        self.location = location
+                    for waypoint in way_methods_list:
+                        self._last_waypoint = None
+                        self._run_asrs_method_and_wait_till_execution(waypoint.location, waypoint.asrs_method,
+                                                                      *waypoint.method_args)
+                        self._update_inventory(waypoint)
+                        self.location = waypoint.location
+                        self._last_waypoint = waypoint
                     self.status = StorageStatus.IDLE
                 else:
                     self.location = destination
-                self._executor_logger.debug(f'And we are here: {self.location}')
+                self._executor_logger.debug('And we are here: %s', self.location)
+                self._journal_append({'op': 'complete', 'id': queued_task.id})
+                self._set_task_result(queued_task.id, 'done')
                 self._current_task = None
+                self._current_task_id = None
+                self._on_state_change()
+            except StorageHWError as e:
+                self._executor_logger.exception(e)
+                self._requeue_current_task(queued_task)
             except Exception as e:
                 self._executor_logger.exception(e)
+                self._fail_current_task()
+
+    def _requeue_current_task(self, queued_task):
+        """
+        The task is put back to the queue, which waits for the calibration after the hw error
+
+        The next tasks would fail on the same error, so nothing is executed till the location is known again
+        """
+        self._calibrated.clear()
+        if self._current_task_id is not None:
+            try:
+                self._journal_append({'op': 'requeue', 'id': queued_task.id})
+            except RuntimeError:
+                self._executor_logger.exception('Requeue of the task %s has not been journaled', queued_task.id)
+            deadline = None if queued_task.deadline is None else queued_task.deadline - time.monotonic()
+            self._task_queue.put(queued_task.task, queued_task.priority, deadline, task_id=queued_task.id)
+            self._current_task = None
+            self._current_task_id = None
+        self._last_waypoint = None
+        self.status = StorageStatus.NEED_TO_CALIBRATE
+
+    def _fail_current_task(self):
+        """ The task is finished as failed: it's not interrupted one for the journal, the storage is not BUSY by it """
+        task_id = self._current_task_id
+        if task_id is None:
+            return
+        try:
+            self._journal_append({'op': 'complete', 'id': task_id, 'failed': True})
+        except RuntimeError:
+            self._executor_logger.exception('Failure of the task %s has not been journaled', task_id)
+        self._set_task_result(task_id, 'failed')
+        self._release_place_cell(self._current_task)
+        self._current_task = None
+        self._current_task_id = None
+        # where the gantry has stopped is known by the location, but the way there is not
+        self._last_waypoint = None
+        if self._status is StorageStatus.BUSY:
+            self._status = StorageStatus.IDLE
+        self._on_state_change()
+
+    def _release_place_cell(self, task):
+        """ Cell of the place task, which is not going to be done, may be chosen by the slot assigner again """
+        destination, *cell = task
+        if destination is StorageLocation.ASRS_PLACE:
+            self.slot_assigner.released(Cell(*cell))
 
     def stop(self):
         """ Blocking method, waits for all queue terminating """
         self._executor_logger.debug('Get command to wait for completion al queue and to stop executor')
         self._executor_stopped = True
+        self._task_queue.close()
         self._executor_thread.join()
+        if self.journal is not None:
+            self.journal.close()
 
     @property
     def queue(self):
@@ -365,20 +914,20 @@ class StorageCommandExecutorThread(ASRS):
     def current_task(self):
         return self._current_task
 
+    @property
+    def current_task_id(self):
+        return self._current_task_id
+
 
 class Storage(StorageCommandExecutorThread, ASRS):
     """ High level class, that realises communication with ASRS """
     DEBUG = True
-    backup_file = 'storage_backup.json'
 
-    def __init__(self, storage_hw_api: StorageHWAPI):
+    def __init__(self, storage_hw_api: StorageHWAPI, journal_file=None):
+        """ With journal_file the queue and the location are journaled and restored from it on the start """
         self.st_api = storage_hw_api
-        super().__init__(self.st_api)
+        super().__init__(self.st_api, None if journal_file is None else Journal(journal_file))
         self.logger = logging.getLogger(f'{type(self).__name__}')
-        self.location = StorageLocation.HOME
-        self.status = StorageStatus.IDLE
-        if not self.DEBUG:
-            self._load_state_and_location()
 
     def __repr__(self):
         return f'{type(self).__name__}()'
@@ -386,26 +935,6 @@ class Storage(StorageCommandExecutorThread, ASRS):
     def __del__(self):
         if not self.DEBUG:
             self.return_to_home()
-            self._save_state_and_location()
-
-    def _load_state_and_location(self):
-        self.logger.debug('Loading saved state')
-        if os.path.exists(self.backup_file):
-            self.logger.debug('State backup file found')
-            with open(self.backup_file, 'w', encoding='utf8') as backup_file:
-                backup = json.load(backup_file)
-            self.location = StorageLocation(backup['location'])
-            self.status = StorageStatus(backup['status'])
-        else:
-            self.logger.debug('There are no state backup file')
-
-    def _save_state_and_location(self):
-        self.logger.debug('Saving current state')
-        backup = {'location': self.location.value,
-                  'status': self.status.status}
-
-        with open(self.backup_file, encoding='utf8') as backup_file:
-            json.dump(backup, backup_file, indent='\t')
 
     def _validate_side_row_column(self, side, row, column):
         if not 1 <= side <= self.SIDES:
@@ -416,7 +945,7 @@ class Storage(StorageCommandExecutorThread, ASRS):
             raise AttributeError(f'Number of sides must be in range of [1; {self.COLUMNS}], got {column}')
 
     def return_to_home(self):
-        self.logger.debug(f'Returning to home')
+        self.logger.debug('Returning to home')
         self.move_to_location(StorageLocation.HOME)
 
     def move_to_idle_position(self):
@@ -425,13 +954,32 @@ class Storage(StorageCommandExecutorThread, ASRS):
 
     def pick_from_asrs(self, side, row, column):
         self._validate_side_row_column(side, row, column)
-        self.logger.debug(f'Picking up the item. side: {side}, row: {row}, column: {column}')
+        self.logger.debug('Picking up the item. side: %s, row: %s, column: %s', side, row, column)
         self.move_to_location(StorageLocation.ASRS_PICK, side, row, column)
 
-    def place_to_asrs(self, side, row, column):
-        self._validate_side_row_column(side, row, column)
-        self.logger.debug(f'Placing down the item. side: {side}, row: {row}, column: {column}')
-        self.move_to_location(StorageLocation.ASRS_PLACE, side, row, column)
+    def _queued_place_cells(self):
+        tasks = [queued_task.task for queued_task in self.queue.tasks()]
+        if self.current_task:
+            tasks.append(tuple(self.current_task))
+        return {Cell(*args) for destination, *args in tasks if destination is StorageLocation.ASRS_PLACE}
+
+    def place_to_asrs(self, side=None, row=None, column=None, pallet_type=None) -> Cell:
+        """
+        Places the item to the cell. Without the cell it's chosen by the slot assigner: the fastest free one
+        for the often picked pallet_type. Returns the cell
+        """
+        with self._place_lock:
+            if side is None and row is None and column is None:
+                cell = self.slot_assigner.choose_cell(pallet_type, reserved=self._queued_place_cells())
+                if cell is None:
+                    raise AttributeError('There are no free cells')
+                side, row, column = cell
+            self._validate_side_row_column(side, row, column)
+            if self.inventory.is_occupied(side, row, column):
+                raise AttributeError(f'Cell side: {side}, row: {row}, column: {column} is occupied')
+            self.logger.debug('Placing down the item. side: %s, row: %s, column: %s', side, row, column)
+            self.move_to_location(StorageLocation.ASRS_PLACE, side, row, column)
+        return Cell(side, row, column)
 
     def move_to_conveyor_pick_place_position(self):
         self.logger.debug('Moving to conveyor pick&place position')
@@ -459,4 +1007,7 @@ def demo(storage: Storage):
 
 
 if __name__ == '__main__':
+    from storage.hardware_api.logging_config import configure_logging
+
+    configure_logging()
     s = Storage(StorageHWAPIBySerial())
@@ -0,0 +1,154 @@
+import os
+import time
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from storage.hardware_api.journal import Journal
+from storage.hardware_api.storage_test_api import GPIOMock
+
+MockGPIO = GPIOMock()
+
+with patch.dict("sys.modules", {"RPi": MagicMock(GPIO=MockGPIO), "RPi.GPIO": MockGPIO}):
+    from storage.hardware_api.storage_api import (
+        Storage, StorageHWAPI, StorageHWStatus, StorageLocation, StorageStatus
+    )
+
+
+class InstantHWAPI(StorageHWAPI):
+    """ Hw api, which does each command at once and reports it """
+    reports_completion = True
+
+    def __init__(self):
+        self.commands = []
+
+    def _command(self, name, *args):
+        self.commands.append((name, *args))
+
+    def home_move(self):
+        self._command('home_move')
+
+    def home_center_move(self):
+        self._command('home_center_move')
+
+    def asrs_place(self, side, row, column):
+        self._command('asrs_place', side, row, column)
+
+    def asrs_pick(self, side, row, column):
+        self._command('asrs_pick', side, row, column)
+
+    def asrs_center_move(self):
+        self._command('asrs_center_move')
+
+    def pre_conv_place(self):
+        self._command('pre_conv_place')
+
+    def pre_conv_pick(self):
+        self._command('pre_conv_pick')
+
+    def conv_place(self):
+        self._command('conv_place')
+
+    def conv_pick(self):
+        self._command('conv_pick')
+
+    def get_status(self):
+        return StorageHWStatus.IDLE
+
+
+class TestStorageJournal(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'journal.jsonl')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _storage(self):
+        storage = Storage(InstantHWAPI(), journal_file=self.path)
+        self.addCleanup(self._stop, storage)
+        return storage
+
+    def _stop(self, storage):
+        stop_thread = threading.Thread(target=storage.stop, daemon=True)
+        stop_thread.start()
+        stop_thread.join(5)
+        self.assertFalse(stop_thread.is_alive(), "Storage has not been stopped")
+
+    def _wait_done(self, storage, task_id):
+        for _ in range(100):
+            if storage.task_status(task_id) not in ('queued', 'running'):
+                break
+            time.sleep(0.01)
+        return storage.task_status(task_id)
+
+    def test_stop_in_transit(self):
+        journal = Journal(self.path)
+        journal.append({'op': 'enqueue', 'id': 1, 'task': ['ASRS'], 'priority': 0, 'deadline_at': None})
+        journal.append({'op': 'move', 'to': 'HOME_CENTER'})
+        journal.close()
+
+        storage = self._storage()
+        self.assertIs(storage.status, StorageStatus.NEED_TO_CALIBRATE, "Interrupted move has not been restored")
+        self._stop(storage)
+        self.assertEqual(storage.st_api.commands, [], "Task has been executed without the calibration")
+        self.assertEqual(list(Journal(self.path).state.tasks), [1], "Pending task has been lost")
+
+    def test_ids_after_restart(self):
+        storage = self._storage()
+        task_ids = storage.move_to_locations([((StorageLocation.ASRS,), 0, None), ((StorageLocation.HOME,), 0, None)])
+        self.assertEqual(self._wait_done(storage, task_ids[-1]), 'done', "Tasks have not been done")
+        self._stop(storage)
+
+        storage = self._storage()
+        self.assertGreater(storage.move_to_location(StorageLocation.ASRS), max(task_ids), "Task id has been reused")
+
+    def test_failed_task(self):
+        storage = self._storage()
+        storage.set_inventory_cell(1, 1, 1, True)
+        task_id = storage.move_to_location(StorageLocation.ASRS_PLACE, 1, 1, 1)
+        self.assertEqual(self._wait_done(storage, task_id), 'failed', "Place to the occupied cell has not failed")
+        self.assertIsNone(storage.current_task_id, "Failed task is still current")
+        self.assertIs(storage.status, StorageStatus.IDLE, "Status is incorrect")
+        self._stop(storage)
+
+        state = Journal(self.path).state
+        self.assertIsNone(state.current_task, "Failed task is interrupted for the journal")
+        self.assertEqual(state.tasks, {}, "Failed task is pending for the journal")
+
+    def test_auto_place(self):
+        journal = Journal(self.path)
+        journal.append({'op': 'move', 'to': 'HOME_CENTER'})
+        journal.close()
+
+        # the queue waits for the calibration, so the places stay queued
+        storage = self._storage()
+        with ThreadPoolExecutor(8) as executor:
+            cells = list(executor.map(lambda _: storage.place_to_asrs(pallet_type='box'), range(8)))
+        self.assertEqual(len(set(cells)), len(cells), "Cell has been chosen for two places")
+
+        storage.cancel_task(next(queued_task.id for queued_task in storage.queue.tasks()
+                                 if tuple(queued_task.task[1:]) == cells[0]))
+        self.assertEqual(storage.place_to_asrs(pallet_type='box'), cells[0], "Cell of the cancelled place is lost")
+
+    def test_hw_error(self):
+        storage = self._storage()
+        with patch.object(InstantHWAPI, 'get_status', lambda api: StorageHWStatus.ERROR):
+            task_id = storage.move_to_location(StorageLocation.ASRS)
+            for _ in range(100):
+                if storage.status is StorageStatus.NEED_TO_CALIBRATE:
+                    break
+                time.sleep(0.01)
+            self.assertIs(storage.status, StorageStatus.NEED_TO_CALIBRATE, "Hw error has not paused the storage")
+            second_id = storage.move_to_location(StorageLocation.HOME)
+            time.sleep(0.05)
+            self.assertEqual([storage.task_status(task_id), storage.task_status(second_id)], ['queued', 'queued'],
+                             "Tasks have not waited for the calibration")
+        self.assertEqual(list(Journal(self.path).state.tasks), [task_id, second_id], "Task has not been requeued")
+
+        storage.calibrate(StorageLocation.HOME)
+        self.assertEqual(self._wait_done(storage, second_id), 'done', "Tasks have not been resumed")
+        self.assertEqual(storage.task_status(task_id), 'done', "Requeued task has not been done")
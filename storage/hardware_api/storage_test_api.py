@@ -33,23 +33,37 @@ modules = {
     "RPi.GPIO": MockRPi.GPIO
 }
 
-with patch.dict("sys.modules", modules), patch('serial.Serial') as patched_serial:
-    from storage.hardware_api.storage_api import StorageHWAPIBySerial, StorageHWStatus
+def make_st_hw_api():
+    """
+    Serial hw api, which writes the commands to the buffer (ser) and reports 3 BUSY statuses after each of them
 
-    patched_serial.return_value = BytesIO()
-    st_hw_api = StorageHWAPIBySerial()
+    storage_api is imported here, not at the module import: if it's loaded already, the api is of the same module,
+    otherwise its status isn't the StorageHWStatus the Storage compares it with
+    """
+    with patch.dict("sys.modules", modules), patch('serial.Serial') as patched_serial:
+        from storage.hardware_api.storage_api import StorageHWAPIBySerial, StorageHWStatus
 
-    st_hw_api._status_call_count = 0
+        patched_serial.return_value = BytesIO()
+        st_hw_api = StorageHWAPIBySerial()
+
+    st_hw_api._busy_statuses_left = 0
+    send_command = st_hw_api._prepare_and_send_command
+
+    def _prepare_and_send_command(self, command):
+        send_command(command)
+        self._busy_statuses_left = 3
 
     def get_status(self):
-        if self._status_call_count == 3:
-            status = StorageHWStatus.IDLE
-            self._status_call_count = 0
-        else:
+        # IDLE stays till the next command, as the executor waits for it to settle
+        if self._busy_statuses_left:
             status = StorageHWStatus.BUSY
-            self._status_call_count += 1
-        self.logger.debug(f'Current status: {status!r}, {self._status_call_count}')
+            self._busy_statuses_left -= 1
+        else:
+            status = StorageHWStatus.IDLE
+        self.logger.debug('Current status: %r, %s', status, self._busy_statuses_left)
         return status
 
-    # patching the bound method
+    # patching the bound methods
+    st_hw_api._prepare_and_send_command = types.MethodType(_prepare_and_send_command, st_hw_api)
     st_hw_api.get_status = types.MethodType(get_status, st_hw_api)
+    return st_hw_api
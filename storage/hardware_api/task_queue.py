@@ -0,0 +1,168 @@
+import time
+import math
+import itertools
+import threading
+
+
+class QueuedTask:
+    DEFAULT_PRIORITY = 0
+
+    def __init__(self, task_id, task, priority=DEFAULT_PRIORITY, deadline=None, submitted=None, sequence=0):
+        """
+        Task of the queue: task is (destination, *args) tuple, as it's executed
+
+        Greater priority is executed earlier. deadline is time.monotonic() time, till which task has to be started
+        """
+        self.id = task_id
+        self.task = task
+        self.priority = priority
+        self.deadline = None
+        self.deadline_at = None
+        self.set_deadline(deadline)
+        self.submitted = time.monotonic() if submitted is None else submitted
+        self.sequence = sequence
+
+    def set_deadline(self, deadline):
+        """ deadline is time.monotonic() time, deadline_at is the same as time.time() for the clients """
+        self.deadline = deadline
+        self.deadline_at = None if deadline is None else time.time() + deadline - time.monotonic()
+
+    def __repr__(self):
+        return f'{type(self).__name__}(id={self.id}, task={self.task}, priority={self.priority})'
+
+
+class TaskQueue:
+    # starvation protection: waiting task gains one priority level per aging_time seconds
+    aging_time = 60
+    # tasks with deadline sooner than this go before all the others, the earliest deadline first
+    deadline_slack = 10
+
+    def __init__(self, last_id=0):
+        """
+        Priority and deadline aware queue of the storage tasks, with ids, cancelling and reordering
+
+        Order is evaluated on each get(), so the aging and the deadlines are taken into account at the moment.
+        Queue is short (tens of tasks), so it's a list scan, not a heap: priorities change with the time anyway.
+        New ids go after last_id: the ids given before the restart are not reused
+        """
+        self._tasks = []
+        self._last_id = last_id
+        self._sequence = itertools.count()
+        self.mutex = threading.Lock()
+        self._not_empty = threading.Condition(self.mutex)
+        self._closed = False
+
+    def _order_key(self, queued_task: QueuedTask, now):
+        is_due = queued_task.deadline is not None and queued_task.deadline - now <= self.deadline_slack
+        level = math.floor(queued_task.priority + (now - queued_task.submitted) / self.aging_time)
+        deadline = queued_task.deadline if queued_task.deadline is not None else math.inf
+        return not is_due, -level, deadline, queued_task.sequence
+
+    def _ordered(self):
+        now = time.monotonic()
+        return sorted(self._tasks, key=lambda queued_task: self._order_key(queued_task, now))
+
+    def put(self, task, priority=QueuedTask.DEFAULT_PRIORITY, deadline=None, task_id=None) -> int:
+        """
+        Adds the task, deadline is in seconds from now. Returns id of the task
+
+        task_id is given for the tasks restored from the journal, the new ids go after it
+        """
+        with self.mutex:
+            return self._put(task, priority, deadline, task_id)
+
+    def _put(self, task, priority, deadline, task_id=None):
+        if task_id is None:
+            task_id = self._last_id + 1
+        self._last_id = max(self._last_id, task_id)
+        queued_task = QueuedTask(task_id, task, priority,
+                                 None if deadline is None else time.monotonic() + deadline,
+                                 sequence=next(self._sequence))
+        self._tasks.append(queued_task)
+        self._not_empty.notify()
+        return queued_task.id
+
+    def put_many(self, tasks) -> list:
+        """ Adds [(task, priority, deadline)] at once: getters see all of them or none. Returns ids of the tasks """
+        with self.mutex:
+            return [self._put(task, priority, deadline) for task, priority, deadline in tasks]
+
+    def get(self, timeout=None):
+        """ Takes the most urgent task. Blocks till there is one, returns None on timeout or if queue is closed """
+        with self.mutex:
+            if not self._not_empty.wait_for(lambda: self._tasks or self._closed, timeout) or not self._tasks:
+                return None
+            queued_task = self._ordered()[0]
+            self._tasks.remove(queued_task)
+            return queued_task
+
+    def close(self):
+        """ Wakes up the getters of the empty queue, they get None """
+        with self.mutex:
+            self._closed = True
+            self._not_empty.notify_all()
+
+    def cancel(self, task_id) -> bool:
+        """ Removes the pending task. Returns False if there is no such task in the queue """
+        with self.mutex:
+            for queued_task in self._tasks:
+                if queued_task.id == task_id:
+                    self._tasks.remove(queued_task)
+                    return True
+            return False
+
+    def reorder(self, task_id, priority=None, deadline=None) -> bool:
+        """ Changes priority and (or) deadline (seconds from now) of the pending task. False if there is no such task """
+        with self.mutex:
+            for queued_task in self._tasks:
+                if queued_task.id == task_id:
+                    if priority is not None:
+                        queued_task.priority = priority
+                        # it's a new priority, so waiting with the previous one doesn't count
+                        queued_task.submitted = time.monotonic()
+                    if deadline is not None:
+                        queued_task.set_deadline(time.monotonic() + deadline)
+                    return True
+            return False
+
+    def tasks(self):
+        """ Pending tasks in the order of execution at the moment """
+        with self.mutex:
+            return self._ordered()
+
+    def replan(self, plan):
+        """
+        Replaces the head of the queue (tasks going one by one with the same urgency and deadline) by plan(tasks) result
+
+        plan gets the task tuples and returns some of them in the new order. Dropped tasks are removed from the queue
+        Returns True if the queue has been changed
+        """
+        with self.mutex:
+            ordered = self._ordered()
+            if len(ordered) < 2:
+                return False
+            now = time.monotonic()
+            head_key = self._order_key(ordered[0], now)[:3]
+            head = [queued_task for queued_task in ordered if self._order_key(queued_task, now)[:3] == head_key]
+            tasks = [queued_task.task for queued_task in head]
+            planned = plan(tasks)
+            if [id(task) for task in planned] == [id(task) for task in tasks]:
+                return False
+
+            queued_tasks = {id(queued_task.task): queued_task for queued_task in head}
+            sequences = sorted(queued_task.sequence for queued_task in head)
+            planned_queued_tasks = [queued_tasks[id(task)] for task in planned]
+            for queued_task, sequence in zip(planned_queued_tasks, sequences):
+                queued_task.sequence = sequence
+            dropped = [queued_task for queued_task in head if queued_task not in planned_queued_tasks]
+            for queued_task in dropped:
+                self._tasks.remove(queued_task)
+            return True
+
+    def empty(self):
+        with self.mutex:
+            return not self._tasks
+
+    def __len__(self):
+        with self.mutex:
+            return len(self._tasks)
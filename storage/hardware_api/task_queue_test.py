@@ -0,0 +1,73 @@
+import time
+import threading
+from unittest import TestCase
+
+from storage.hardware_api.task_queue import TaskQueue
+
+
+class TestTaskQueue(TestCase):
+
+    def setUp(self):
+        self.queue = TaskQueue()
+
+    def _get_tasks(self):
+        tasks = []
+        while not self.queue.empty():
+            tasks.append(self.queue.get().task)
+        return tasks
+
+    def test_fifo_by_default(self):
+        for task in [('a',), ('b',), ('c',)]:
+            self.queue.put(task)
+        self.assertEqual(self._get_tasks(), [('a',), ('b',), ('c',)], "Tasks of the same priority must be FIFO")
+
+    def test_priority(self):
+        self.queue.put(('shelving',))
+        self.queue.put(('urgent',), priority=10)
+        self.assertEqual(self._get_tasks(), [('urgent',), ('shelving',)], "Urgent task has not been executed first")
+
+    def test_deadline(self):
+        self.queue.put(('urgent',), priority=10)
+        self.queue.put(('due',), deadline=1)
+        self.queue.put(('later',), deadline=1000)
+        self.assertEqual(self._get_tasks(), [('due',), ('urgent',), ('later',)], "Due task must go first")
+
+    def test_aging(self):
+        self.queue.aging_time = 0.05
+        self.queue.put(('old',))
+        time.sleep(0.12)
+        self.queue.put(('new',), priority=1)
+        self.assertEqual(self._get_tasks(), [('old',), ('new',)], "Waiting task has not gained priority")
+
+    def test_cancel_and_reorder(self):
+        first_id = self.queue.put(('first',))
+        second_id = self.queue.put(('second',))
+        third_id = self.queue.put(('third',))
+        self.assertTrue(self.queue.cancel(second_id), "Task has not been cancelled")
+        self.assertFalse(self.queue.cancel(second_id), "Task has been cancelled twice")
+        self.assertTrue(self.queue.reorder(third_id, priority=5), "Task has not been reordered")
+        self.assertEqual([queued_task.id for queued_task in self.queue.tasks()], [third_id, first_id],
+                         "Queue order is incorrect")
+
+    def test_replan(self):
+        tasks = [('a',), ('b',), ('c',)]
+        for task in tasks:
+            self.queue.put(task)
+        self.queue.put(('unimportant',), priority=-1)
+        self.assertTrue(self.queue.replan(lambda head: [head[2], head[0]]), "Queue has not been replanned")
+        self.assertFalse(self.queue.replan(lambda head: head), "Unchanged plan has changed the queue")
+        self.assertEqual(self._get_tasks(), [('c',), ('a',), ('unimportant',)], "Only the head must be replanned")
+
+    def test_close(self):
+        threading.Timer(0.05, self.queue.close).start()
+        self.assertIsNone(self.queue.get(timeout=1), "Getter of the closed queue has not been woken up")
+
+    def test_restored_ids(self):
+        self.assertEqual(self.queue.put(('restored',), task_id=7), 7, "Restored task id has been changed")
+        self.assertEqual(self.queue.put(('new',)), 8, "New id must go after the restored ones")
+
+    def test_put_many(self):
+        self.queue.put(('single',))
+        task_ids = self.queue.put_many([(('first',), 0, None), (('urgent',), 5, None)])
+        self.assertEqual(task_ids, [2, 3], "Ids of the tasks are incorrect")
+        self.assertEqual(self._get_tasks(), [('urgent',), ('single',), ('first',)], "Queue order is incorrect")
@@ -18,7 +18,7 @@ with patch('serial.Serial') as patched_serial:
 
     def get_status(self):
         status = random.choice([StorageHWStatus.IDLE, StorageHWStatus.BUSY])
-        self.logger.debug(f'Current status: {status!r}')
+        self.logger.debug('Current status: %r', status)
         return status
 
     # patching the bound method
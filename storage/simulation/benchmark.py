@@ -0,0 +1,195 @@
+"""
+End-to-end benchmark of the storage with the simulated ASRS controller
+
+Storage runs as is: the hw api talks to ASRSSimulator over the pty serial port, the status pins are SimulatedGPIO.
+Synthetic order stream: the rack is filled by the share, orders arrive by Poisson process (all at once with rate 0),
+each order is queued at once and is a retrieval (cell -> conveyor), a storage (conveyor -> free cell)
+or a relocation (cell -> free cell). Reports throughput, latency percentiles of the tasks (queued -> done)
+and the queue depth over time. Times are simulated seconds: the wall clock multiplied by the speed,
+the executor settle and poll intervals are divided by the speed as well.
+
+    python -m storage.simulation.benchmark [orders count] [rate, orders/s] [speed] [--framed]
+"""
+import sys
+import time
+import random
+import logging
+import threading
+from unittest.mock import patch, MagicMock
+
+from storage.simulation.simulation import ASRSSimulator, SimulatedGPIO
+from storage.simulation.listener import PtyListener
+
+FILL_SHARE = 0.5
+# shares of the retrievals, storages and relocations in the order stream
+ORDER_WEIGHTS = {'retrieval': 0.4, 'storage': 0.4, 'relocation': 0.2}
+# queue depth and the finished tasks are sampled this often, wall clock seconds
+SAMPLE_INTERVAL = 0.01
+TIMELINE_ROWS = 20
+TIMELINE_WIDTH = 60
+
+GPIO = SimulatedGPIO()
+
+with patch.dict("sys.modules", {"RPi": MagicMock(GPIO=GPIO), "RPi.GPIO": GPIO}):
+    from storage.hardware_api.storage_api import (
+        Storage, StorageLocation, StorageHWAPIBySerial, StorageHWAPIBySerialFramed
+    )
+
+
+def order_stream(orders_count, sides, rows, columns, seed=1):
+    """ Returns the initially occupied cells and the orders: lists of (location, *args) tasks """
+    rng = random.Random(seed)
+    cells = [(side, row, column)
+             for side in range(1, sides + 1) for row in range(1, rows + 1) for column in range(1, columns + 1)]
+    occupied = set(rng.sample(cells, int(len(cells) * FILL_SHARE)))
+    initial = sorted(occupied)
+    orders = []
+    kinds, weights = zip(*ORDER_WEIGHTS.items())
+    while len(orders) < orders_count:
+        kind = rng.choices(kinds, weights)[0]
+        free = [cell for cell in cells if cell not in occupied]
+        if kind != 'storage' and not occupied or kind != 'retrieval' and not free:
+            continue
+        if kind == 'retrieval':
+            cell = rng.choice(sorted(occupied))
+            occupied.remove(cell)
+            orders.append([(StorageLocation.ASRS_PICK, *cell), (StorageLocation.CONVEYOR,)])
+        elif kind == 'storage':
+            cell = rng.choice(free)
+            occupied.add(cell)
+            orders.append([(StorageLocation.ASRS,), (StorageLocation.ASRS_PLACE, *cell)])
+        else:
+            from_cell, to_cell = rng.choice(sorted(occupied)), rng.choice(free)
+            occupied.remove(from_cell)
+            occupied.add(to_cell)
+            orders.append([(StorageLocation.ASRS_PICK, *from_cell), (StorageLocation.ASRS_PLACE, *to_cell)])
+    return initial, orders
+
+
+def percentile(sorted_values, share):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * share))]
+
+
+class BenchmarkRun:
+    def __init__(self, storage: Storage, speed):
+        """ Submits the orders to the storage and records the tasks latencies and the queue depth """
+        self.storage = storage
+        self.speed = speed
+        self.submitted = {}  # task id -> simulated time
+        self.finished = {}  # task id -> simulated time
+        self.queue_depth = []  # (simulated time, queued tasks count)
+        self._lock = threading.Lock()
+        self._start_time = None
+
+    def now(self):
+        return (time.monotonic() - self._start_time) * self.speed
+
+    def _submit(self, orders, rate, seed):
+        rng = random.Random(seed)
+        arrival = 0.0
+        for order in orders:
+            if rate:
+                arrival += rng.expovariate(rate)
+                time.sleep(max(0.0, (arrival - self.now()) / self.speed))
+            with self._lock:
+                task_ids = self.storage.move_to_locations([(task, 0, None) for task in order])
+                now = self.now()
+                for task_id in task_ids:
+                    self.submitted[task_id] = now
+
+    def _sample(self):
+        with self._lock:
+            now = self.now()
+            queued = {queued_task.id for queued_task in self.storage.queue.tasks()}
+            self.queue_depth.append((now, len(queued)))
+            # done ones are neither queued nor executed, coalesced ones are gone from the queue too
+            for task_id in self.submitted.keys() - self.finished.keys() - queued - {self.storage.current_task_id}:
+                self.finished[task_id] = now
+            return len(self.finished) == len(self.submitted)
+
+    def run(self, orders, rate, seed=1):
+        self._start_time = time.monotonic()
+        submitter = threading.Thread(target=self._submit, args=(orders, rate, seed), daemon=True)
+        submitter.start()
+        while not self._sample() or submitter.is_alive():
+            time.sleep(SAMPLE_INTERVAL)
+        return self.report()
+
+    def report(self):
+        duration = max(self.finished.values())
+        latencies = sorted(self.finished[task_id] - submitted for task_id, submitted in self.submitted.items())
+        statuses = [self.storage.task_status(task_id) for task_id in self.submitted]
+        depths = [depth for _, depth in self.queue_depth]
+        return {
+            'tasks': len(latencies),
+            'failed': statuses.count('failed'),
+            'duration': duration,
+            'throughput': len(latencies) / duration if duration else 0.0,
+            'latency_p50': percentile(latencies, 0.5),
+            'latency_p95': percentile(latencies, 0.95),
+            'latency_p99': percentile(latencies, 0.99),
+            'latency_max': latencies[-1],
+            'mean_queue_depth': sum(depths) / len(depths),
+            'max_queue_depth': max(depths),
+            'queue_depth': self.queue_depth,
+        }
+
+
+def depth_timeline(queue_depth, duration, rows=TIMELINE_ROWS):
+    """ Max queue depth by the time intervals: [(interval start, depth)] """
+    step = duration / rows or 1.0
+    timeline = [[row * step, 0] for row in range(rows)]
+    for moment, depth in queue_depth:
+        row = timeline[min(rows - 1, int(moment / step))]
+        row[1] = max(row[1], depth)
+    return [tuple(row) for row in timeline]
+
+
+def run(orders_count, rate, speed, framed=False, seed=1):
+    """ Runs the orders through the storage with the new simulator. Returns the report and the simulator """
+    storage_api_class = StorageHWAPIBySerialFramed if framed else StorageHWAPIBySerial
+    simulator = ASRSSimulator(Storage.SIDES, Storage.ROWS, Storage.COLUMNS, speed=speed)
+    GPIO.cleanup()
+    GPIO.attach(simulator)
+    listener = PtyListener(simulator)
+    listener.start()
+
+    class SimulatedStorageHWAPI(storage_api_class):
+        serial_config = dict(port=listener.port, timeout=0)
+
+    storage = Storage(SimulatedStorageHWAPI())
+    for timeout_name in ['idle_settle_time', 'busy_start_timeout', 'status_poll_min_interval',
+                         'status_poll_max_interval']:
+        setattr(storage, timeout_name, getattr(storage, timeout_name) / speed)
+    initial, orders = order_stream(orders_count, Storage.SIDES, Storage.ROWS, Storage.COLUMNS, seed)
+    for cell in initial:
+        storage.set_inventory_cell(*cell, True)
+    try:
+        report = BenchmarkRun(storage, speed).run(orders, rate, seed)
+    finally:
+        storage.stop()
+        storage.st_api.close()
+        listener.stop()
+        simulator.quit()
+    report['hw_busy_share'] = simulator.busy_time / report['duration']
+    return report, simulator
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    orders_count = int(args[0]) if len(args) > 0 else 50
+    rate = float(args[1]) if len(args) > 1 else 0.02
+    speed = float(args[2]) if len(args) > 2 else 20.0
+    framed = '--framed' in sys.argv
+
+    report, _ = run(orders_count, rate, speed, framed)
+    print(f'{report["tasks"]} tasks ({report["failed"]} failed) in {report["duration"]:.1f} s, '
+          f'{"framed" if framed else "status pins"} protocol, speed x{speed:g}')
+    print(f'throughput: {report["throughput"] * 3600:.1f} tasks/h, hw busy {report["hw_busy_share"]:.0%}')
+    print(f'latency, s: p50 {report["latency_p50"]:.1f}, p95 {report["latency_p95"]:.1f}, '
+          f'p99 {report["latency_p99"]:.1f}, max {report["latency_max"]:.1f}')
+    print(f'queue depth: mean {report["mean_queue_depth"]:.1f}, max {report["max_queue_depth"]}')
+    scale = min(1.0, TIMELINE_WIDTH / max(1, report['max_queue_depth']))
+    for moment, depth in depth_timeline(report['queue_depth'], report['duration']):
+        print(f'{moment:8.1f} s | {"#" * round(depth * scale)} {depth}')
@@ -0,0 +1,27 @@
+# durations of the ASRS commands, seconds. Commands of the cells ('PICK ASRS <side> <row> <column>' and
+# 'PLACE ASRS ...') take the travel from ASRS center to the cell (by CellTravelModel) and the handling,
+# 'PLACE ASRS_CENTER' from the cell takes the travel back
+command_durations = {
+    'PLACE HOME': 3.0,
+    'PLACE HOME_CENTER': 2.0,
+    'PLACE ASRS_CENTER': 2.0,
+    'PLACE PRE_CONV': 2.5,
+    'PICK PRE_CONV': 2.5,
+    'PLACE CONV': 3.5,
+    'PICK CONV': 3.5,
+}
+cell_row_duration = 1.0
+cell_column_duration = 0.6
+cell_handling_duration = 4.0
+# time from the received command to the BUSY status pins, and to the ACK answer of the framed protocol
+busy_delay = 0.02
+ack_delay = 0.005
+
+# ASRS status pins, like StorageHWAPIBySerial.GPIO_STATUS_PORTS, and their values
+status_ports = [4, 2, 0]
+idle_pins = (0, 0, 0)
+busy_pins = (0, 0, 1)
+e_stop_pins = (1, 1, 1)
+
+# simulated seconds per second: durations are divided by it
+speed = 1.0
@@ -0,0 +1,61 @@
+import os
+import tty
+import select
+import logging
+import threading
+
+from storage.simulation.simulation import ASRSSimulator
+
+
+class PtyListener:
+    ENCODING = '1251'
+    # reader checks the stop flag this often, seconds
+    poll_interval = 0.1
+
+    def __init__(self, simulator: ASRSSimulator):
+        """
+        Serial port of the simulated controller: pseudo-terminal pair, the storage opens the port (slave side)
+        as the real one, e.g. StorageHWAPIBySerial with serial_config = dict(port=listener.port, timeout=0).
+        Received lines go to the simulator, its answers are written back with '\\r\\n'
+        """
+        self.logger = logging.getLogger(f'{type(self).__name__}')
+        self.simulator = simulator
+        self._master, self._slave = os.openpty()
+        tty.setraw(self._slave)
+        self.port = os.ttyname(self._slave)
+        self._write_lock = threading.Lock()
+        self._stopped = False
+        self._reader_thread = threading.Thread(target=self._reader, daemon=True)
+        simulator.answer = self.write
+
+    def start(self):
+        self._reader_thread.start()
+
+    def write(self, line: str):
+        with self._write_lock:
+            os.write(self._master, f'{line}\r\n'.encode(self.ENCODING))
+
+    def _reader(self):
+        buffer = bytearray()
+        while not self._stopped:
+            readable, _, _ = select.select([self._master], [], [], self.poll_interval)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self._master, 1024)
+            except OSError:
+                # the port is closed
+                break
+            while b'\n' in buffer:
+                line, _, buffer = buffer.partition(b'\n')
+                line = line.decode(self.ENCODING, errors='replace').strip()
+                if line:
+                    self.logger.debug('Received: %r', line)
+                    self.simulator.handle_line(line)
+
+    def stop(self):
+        self._stopped = True
+        if self._reader_thread.is_alive():
+            self._reader_thread.join()
+        os.close(self._master)
+        os.close(self._slave)
@@ -0,0 +1,203 @@
+import time
+import queue
+import logging
+import threading
+
+from storage.hardware_api.inventory import Cell
+from storage.hardware_api.slotting import CellTravelModel
+from storage.simulation import config as sim_conf
+
+ASRS_TARGET = 'ASRS'
+ASRS_CENTER_TARGET = 'ASRS_CENTER'
+
+
+class ASRSSimulator:
+    def __init__(self, sides=2, rows=5, columns=5, command_durations=None, speed=sim_conf.speed):
+        """
+        Time-based simulation of the ASRS controller
+
+        Takes the lines of the serial protocol: 'PICK <target>' or 'PLACE <target>', the cells are
+        'PICK ASRS <side> <row> <column>'. With the sequence number ('<seq> PICK ...') it's the framed protocol:
+        'ACK <seq>' is answered when the command is taken, 'DONE <seq>' when it's executed and
+        'ERR <seq> <text>' for the unknown one. Commands are executed one by one in the order of receiving,
+        the status pins are BUSY while there are commands to execute, E_STOP while the emergency stop is set.
+
+        Durations are the simulated seconds (command_durations by the command, the cells by CellTravelModel),
+        they are divided by the speed for the wall clock
+        """
+        self.logger = logging.getLogger(f'{type(self).__name__}')
+        self.sides, self.rows, self.columns = sides, rows, columns
+        self.command_durations = dict(sim_conf.command_durations if command_durations is None else command_durations)
+        self.travel_model = CellTravelModel(rows, columns, row_time=sim_conf.cell_row_duration,
+                                            column_time=sim_conf.cell_column_duration,
+                                            handling_time=sim_conf.cell_handling_duration)
+        self.speed = speed
+        # location name or the Cell
+        self.position = 'HOME'
+        self.pins = sim_conf.idle_pins
+        # answers of the framed protocol are sent by it, set by the listener
+        self.answer = None
+        # (command, simulated duration) of the executed commands
+        self.executed = []
+        self.busy_time = 0.0
+        self._pins_subscribers = []
+        self._pins_lock = threading.Lock()
+        self._e_stop_released = threading.Event()
+        self._e_stop_released.set()
+        self._commands = queue.Queue()
+        self._worker_thread = threading.Thread(target=self._worker, daemon=True)
+        self._worker_thread.start()
+
+    def subscribe(self, callback):
+        """ callback(old_pins, new_pins) is called on each change of the status pins """
+        self._pins_subscribers.append(callback)
+
+    def _set_pins(self, pins):
+        with self._pins_lock:
+            old_pins, self.pins = self.pins, pins
+        if old_pins != pins:
+            for callback in list(self._pins_subscribers):
+                callback(old_pins, pins)
+
+    def _sleep(self, duration):
+        time.sleep(duration / self.speed)
+
+    def _send(self, answer):
+        if self.answer is not None:
+            self.answer(answer)
+
+    def parse_command(self, command):
+        """ Target of the command: location name or the Cell. ValueError if the command is unknown """
+        action, target, *cell = command.split()
+        if action not in ('PICK', 'PLACE'):
+            raise ValueError(f'Unknown action {action!r}')
+        if target == ASRS_TARGET:
+            side, row, column = (int(arg) for arg in cell)
+            if not (1 <= side <= self.sides and 1 <= row <= self.rows and 1 <= column <= self.columns):
+                raise ValueError(f'Cell {side} {row} {column} is out of the rack')
+            return Cell(side, row, column)
+        if cell or command not in self.command_durations:
+            raise ValueError(f'Unknown command {command!r}')
+        return target
+
+    def command_duration(self, command, position):
+        """ Simulated seconds of the command from the position """
+        target = self.parse_command(command)
+        if isinstance(target, Cell):
+            return self.travel_model.travel_time(target) + self.travel_model.handling_time
+        if target == ASRS_CENTER_TARGET and isinstance(position, Cell):
+            return self.travel_model.travel_time(position)
+        return self.command_durations[command]
+
+    def handle_line(self, line: str):
+        """ Takes one received line of the protocol """
+        seq, _, command = line.partition(' ')
+        if not seq.isdigit():
+            seq, command = None, line
+        try:
+            self.parse_command(command)
+        except ValueError as e:
+            self.logger.warning('Command %r is rejected: %s', line, e)
+            if seq is not None:
+                self._send(f'ERR {seq} {e}')
+            return
+        if seq is not None:
+            self._sleep(sim_conf.ack_delay)
+            self._send(f'ACK {seq}')
+        self._commands.put((seq, command))
+
+    def set_e_stop(self, is_set):
+        """ Emergency stop: status pins are E_STOP, the next commands wait for the release """
+        if is_set:
+            self._e_stop_released.clear()
+            self._set_pins(sim_conf.e_stop_pins)
+        else:
+            self._set_pins(sim_conf.busy_pins if self._commands.unfinished_tasks else sim_conf.idle_pins)
+            self._e_stop_released.set()
+
+    def _worker(self):
+        while True:
+            command = self._commands.get()
+            if command is None:
+                break
+            seq, text = command
+            self._e_stop_released.wait()
+            self._sleep(sim_conf.busy_delay)
+            self._set_pins(sim_conf.busy_pins)
+            duration = self.command_duration(text, self.position)
+            self._sleep(duration)
+            self.position = self.parse_command(text)
+            self.executed.append((text, duration))
+            self.busy_time += duration
+            self._commands.task_done()
+            if self._commands.empty() and self._e_stop_released.is_set():
+                self._set_pins(sim_conf.idle_pins)
+            if seq is not None:
+                self._send(f'DONE {seq}')
+
+    def quit(self):
+        self._commands.put(None)
+        self._worker_thread.join()
+
+
+class SimulatedGPIO:
+    BOARD = 'BOARD'
+    BCM = 'BCM'
+    IN = 'IN'
+    OUT = 'OUT'
+    HIGH = 1
+    LOW = 0
+    RISING = 'RISING'
+    FALLING = 'FALLING'
+    BOTH = 'BOTH'
+
+    def __init__(self, simulator: ASRSSimulator = None, status_ports=tuple(sim_conf.status_ports)):
+        """
+        RPi.GPIO replacement with the status pins of the simulator, edges of them call the event callbacks.
+        The other inputs are 0, the outputs are ignored
+        """
+        self.status_ports = list(status_ports)
+        self.simulator = None
+        self._callbacks = {}  # port -> (edge, callback)
+        if simulator is not None:
+            self.attach(simulator)
+
+    def attach(self, simulator: ASRSSimulator):
+        self.simulator = simulator
+        simulator.subscribe(self._on_pins_change)
+
+    def setmode(self, mode):
+        pass
+
+    def setwarnings(self, flag):
+        pass
+
+    def setup(self, port, mode):
+        pass
+
+    def output(self, port, value):
+        pass
+
+    def input(self, port):
+        if self.simulator is None or port not in self.status_ports:
+            return 0
+        return self.simulator.pins[self.status_ports.index(port)]
+
+    def add_event_detect(self, port, edge, callback=None, bouncetime=None):
+        if port in self._callbacks:
+            raise RuntimeError(f'Edge detection is already enabled for the port {port}')
+        self._callbacks[port] = (edge, callback)
+
+    def remove_event_detect(self, port):
+        self._callbacks.pop(port, None)
+
+    def cleanup(self):
+        self._callbacks.clear()
+
+    def _on_pins_change(self, old_pins, new_pins):
+        for port, old_value, new_value in zip(self.status_ports, old_pins, new_pins):
+            edge, callback = self._callbacks.get(port, (None, None))
+            if callback is None or old_value == new_value:
+                continue
+            if edge == self.BOTH or edge == (self.RISING if new_value else self.FALLING):
+                callback(port)
@@ -0,0 +1,59 @@
+import time
+from unittest import TestCase
+
+from storage.hardware_api.inventory import Cell
+from storage.simulation.simulation import ASRSSimulator, SimulatedGPIO
+from storage.simulation import benchmark
+
+
+class TestASRSSimulator(TestCase):
+
+    def setUp(self):
+        self.simulator = ASRSSimulator(speed=100)
+        self.answers = []
+        self.simulator.answer = self.answers.append
+        self.gpio = SimulatedGPIO(self.simulator)
+        self.edges = []
+        self.gpio.add_event_detect(0, self.gpio.BOTH, callback=self.edges.append)
+
+    def tearDown(self):
+        self.simulator.quit()
+
+    def _wait_idle(self):
+        for _ in range(100):
+            time.sleep(0.01)
+            if not self.simulator._commands.unfinished_tasks:
+                return
+
+    def test_status_pins(self):
+        self.simulator.handle_line('PLACE HOME_CENTER')
+        time.sleep(0.005)
+        self.assertEqual([self.gpio.input(port) for port in [4, 2, 0]], [0, 0, 1], "Status is not BUSY")
+        self._wait_idle()
+        self.assertEqual([self.gpio.input(port) for port in [4, 2, 0]], [0, 0, 0], "Status is not IDLE")
+        self.assertEqual(self.edges, [0, 0], "Status pin edges are incorrect")
+        self.assertEqual(self.simulator.position, 'HOME_CENTER', "Position is incorrect")
+
+    def test_framed(self):
+        self.simulator.handle_line('1 PICK ASRS 1 1 1')
+        self.simulator.handle_line('2 PLACE ASRS_CENTER')
+        self.simulator.handle_line('3 PICK NOWHERE')
+        self._wait_idle()
+        self.assertEqual(self.answers[:3], ['ACK 1', 'ACK 2', 'ERR 3 Unknown command \'PICK NOWHERE\''],
+                         "Answers are incorrect")
+        self.assertEqual(self.answers[3:], ['DONE 1', 'DONE 2'], "Answers are incorrect")
+        travel_time = self.simulator.travel_model.travel_time(Cell(1, 1, 1))
+        self.assertEqual([duration for _, duration in self.simulator.executed],
+                         [travel_time + self.simulator.travel_model.handling_time, travel_time],
+                         "Command durations are incorrect")
+
+
+class TestBenchmark(TestCase):
+
+    def test_run(self):
+        for framed in [False, True]:
+            report, simulator = benchmark.run(orders_count=3, rate=0, speed=200, framed=framed)
+            self.assertEqual(report['tasks'], 6, "Tasks count is incorrect")
+            self.assertEqual(report['failed'], 0, "Tasks have failed")
+            self.assertTrue(simulator.executed, "Commands have not reached the simulator")
+            self.assertLessEqual(report['latency_p50'], report['latency_max'], "Latency percentiles are incorrect")
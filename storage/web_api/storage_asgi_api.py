@@ -0,0 +1,260 @@
+"""
+asyncio (ASGI) variant of the storage web API: the same /api/v1/storage/* routes and JSON envelopes
+
+Storage calls (task queueing, serial debug output) are run by the bounded executor, so the event loop is never blocked.
+
+    uvicorn storage.web_api.storage_asgi_api:app --host 0.0.0.0 --port 5000
+"""
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import HTMLResponse
+from starlette.routing import Route, Mount
+
+from common.asgi import run_blocking, request_json, make_json_response, make_sse_response
+from storage.web_api.storage_web_common import st, st_hw_api, storage_feed, storage_api_url_prefix, StorageLocation, \
+    validate_side_row_column, validate_priority_deadline, validate_queue_submit, validate_location, validate_task_id, \
+    validate_free_cell, validate_inventory_cell, validate_auto_place, validate_batch_id, validate_batch, \
+    is_auto_place, batch_status_json, location_json, status_json, current_task_json, queue_json, cell_json, \
+    inventory_json, waypoint_metrics_json
+
+
+async def _handle_api_error(request, ex):
+    if request.url.path.startswith(storage_api_url_prefix):
+        return make_json_response({'status': 404, 'body': ''}, 404)
+    return HTMLResponse(ex.detail, status_code=ex.status_code)
+
+
+def _make_queued_response():
+    return make_json_response({"status": 200, "body": "added to queue"}, 200)
+
+
+async def _queue_cell_task(request, method, is_place=False):
+    params = await request_json(request)
+    error, side, row, column = validate_side_row_column(params or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+    if is_place:
+        error = validate_free_cell(side, row, column)
+        if error:
+            return make_json_response({"status": 409, "body": error}, 409)
+
+    await run_blocking(method, side, row, column)
+    return _make_queued_response()
+
+
+async def move_to_home(request):
+    await run_blocking(st.return_to_home)
+    return _make_queued_response()
+
+
+async def move_to_idle_position(request):
+    await run_blocking(st.move_to_idle_position)
+    return _make_queued_response()
+
+
+async def move_to_conveyor(request):
+    await run_blocking(st.move_to_conveyor_pick_place_position)
+    return _make_queued_response()
+
+
+async def pick_asrs(request):
+    return await _queue_cell_task(request, st.pick_from_asrs)
+
+
+async def pick_conveyor(request):
+    await run_blocking(st.pick_from_conveyor)
+    return _make_queued_response()
+
+
+async def place_asrs(request):
+    params = await request_json(request) or {}
+    if is_auto_place(params):
+        error, pallet_type = validate_auto_place(params)
+        if error:
+            return make_json_response({"status": 400, "body": error}, 400)
+        try:
+            cell = await run_blocking(lambda: st.place_to_asrs(pallet_type=pallet_type))
+        except AttributeError as e:
+            return make_json_response({"status": 409, "body": str(e)}, 409)
+        return make_json_response({"status": 200, "body": cell_json(cell)}, 200)
+    return await _queue_cell_task(request, st.place_to_asrs, is_place=True)
+
+
+async def place_conveyor(request):
+    await run_blocking(st.place_to_conveyor)
+    return _make_queued_response()
+
+
+async def location(request):
+    return make_json_response({"status": 200, "body": {'location': location_json()}}, 200)
+
+
+async def status(request):
+    return make_json_response({"status": 200, "body": {'status': status_json()}}, 200)
+
+
+async def current_task(request):
+    return make_json_response({"status": 200, "body": {'current_task': current_task_json()}}, 200)
+
+
+async def debug_output(request):
+    if st_hw_api is None:
+        return make_json_response({'status': 404, 'body': 'There is no output of the serial hw api'}, 404)
+    output = await run_blocking(st_hw_api.ser.getvalue)
+    return HTMLResponse(b'<br>'.join(output.split(b'\n\r')))
+
+
+async def queue(request):
+    return make_json_response({"status": 200, "body": {"queue": queue_json()}}, 200)
+
+
+async def queue_submit(request):
+    error, task, priority, deadline = validate_queue_submit(await request_json(request) or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+    if task[0] is StorageLocation.ASRS_PLACE:
+        error = validate_free_cell(*task[1:])
+        if error:
+            return make_json_response({"status": 409, "body": error}, 409)
+
+    task_id = await run_blocking(lambda: st.move_to_location(*task, priority=priority, deadline=deadline))
+    return make_json_response({"status": 200, "body": {"id": task_id}}, 200)
+
+
+async def queue_cancel(request):
+    error, task_id = validate_task_id(await request_json(request) or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+
+    if not await run_blocking(st.cancel_task, task_id):
+        return make_json_response({"status": 404, "body": f'There is no task {task_id} in the queue'}, 404)
+    return make_json_response({"status": 200, "body": "cancelled"}, 200)
+
+
+async def queue_reorder(request):
+    params = await request_json(request) or {}
+    error, task_id = validate_task_id(params)
+    if not error:
+        error, priority, deadline = validate_priority_deadline(params)
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+
+    if not await run_blocking(st.reorder_task, task_id, params.get('priority'), deadline):
+        return make_json_response({"status": 404, "body": f'There is no task {task_id} in the queue'}, 404)
+    return make_json_response({"status": 200, "body": {"queue": queue_json()}}, 200)
+
+
+async def batch(request):
+    errors, tasks = validate_batch(await request_json(request) or {})
+    if errors:
+        return make_json_response({"status": 400, "body": errors}, 400)
+
+    batch_id, task_ids = await run_blocking(st.submit_batch, tasks)
+    return make_json_response({"status": 200, "body": {"id": batch_id, "tasks": task_ids}}, 200)
+
+
+async def batch_status(request):
+    error, batch_id = validate_batch_id(await request_json(request) or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+
+    task_statuses = st.batch_status(batch_id)
+    if task_statuses is None:
+        return make_json_response({"status": 404, "body": f'There is no batch {batch_id}'}, 404)
+    return make_json_response({"status": 200, "body": batch_status_json(batch_id, task_statuses)}, 200)
+
+
+async def calibrate(request):
+    error, location = validate_location(await request_json(request) or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+
+    await run_blocking(st.calibrate, location)
+    return make_json_response({"status": 200, "body": location_json()}, 200)
+
+
+async def inventory(request):
+    return make_json_response({"status": 200, "body": {"inventory": inventory_json()}}, 200)
+
+
+async def inventory_cell(request):
+    error, cell = validate_inventory_cell(await request_json(request) or {})
+    if error:
+        return make_json_response({"status": 400, "body": error}, 400)
+
+    try:
+        await run_blocking(st.set_inventory_cell, *cell)
+    except ValueError as e:
+        return make_json_response({"status": 409, "body": str(e)}, 409)
+    return make_json_response({"status": 200, "body": {"inventory": inventory_json()}}, 200)
+
+
+async def inventory_nearest_free(request):
+    params = await request_json(request) or {}
+    row, column, side = (params.get(k) for k in ['row', 'column', 'side'])
+    if not all(arg is None or isinstance(arg, int) for arg in [row, column, side]):
+        return make_json_response({"status": 400, "body": 'All args must be integer'}, 400)
+
+    cell = st.inventory.nearest_free(row, column, side)
+    if cell is None:
+        return make_json_response({"status": 404, "body": 'There are no free cells'}, 404)
+    return make_json_response({"status": 200, "body": cell_json(cell)}, 200)
+
+
+async def inventory_find(request):
+    pallet = (await request_json(request) or {}).get('pallet')
+    cell = None if pallet is None else st.inventory.find(pallet)
+    if cell is None:
+        return make_json_response({"status": 404, "body": f'There is no pallet {pallet!r} in the ASRS'}, 404)
+    return make_json_response({"status": 200, "body": cell_json(cell, pallet)}, 200)
+
+
+async def command_metrics(request):
+    return make_json_response({"status": 200, "body": st.st_api.latency_metrics()}, 200)
+
+
+async def waypoint_metrics(request):
+    return make_json_response({"status": 200, "body": waypoint_metrics_json()}, 200)
+
+
+async def stream(request):
+    """ Server-Sent Events stream of the storage state, the same as the flask app has """
+    return make_sse_response(request, storage_feed)
+
+
+storage_api = Mount(storage_api_url_prefix, routes=[
+    Route('/move_to/home', move_to_home, methods=['GET', 'POST']),
+    Route('/move_to/idle_position', move_to_idle_position, methods=['GET', 'POST']),
+    Route('/move_to/conveyor', move_to_conveyor, methods=['GET', 'POST']),
+    Route('/pick/asrs', pick_asrs, methods=['GET', 'POST']),
+    Route('/pick/conveyor', pick_conveyor, methods=['GET', 'POST']),
+    Route('/place/asrs', place_asrs, methods=['GET', 'POST']),
+    Route('/place/conveyor', place_conveyor, methods=['GET', 'POST']),
+    Route('/location', location, methods=['GET', 'POST']),
+    Route('/status', status, methods=['GET', 'POST']),
+    Route('/current_task', current_task, methods=['GET', 'POST']),
+    Route('/debug/output', debug_output, methods=['GET', 'POST']),
+    Route('/queue', queue, methods=['GET', 'POST']),
+    Route('/queue/submit', queue_submit, methods=['POST']),
+    Route('/queue/cancel', queue_cancel, methods=['POST']),
+    Route('/queue/reorder', queue_reorder, methods=['POST']),
+    Route('/batch', batch, methods=['POST']),
+    Route('/batch/status', batch_status, methods=['GET', 'POST']),
+    Route('/calibrate', calibrate, methods=['POST']),
+    Route('/inventory', inventory, methods=['GET', 'POST']),
+    Route('/inventory/cell', inventory_cell, methods=['POST']),
+    Route('/inventory/nearest_free', inventory_nearest_free, methods=['GET', 'POST']),
+    Route('/inventory/find', inventory_find, methods=['GET', 'POST']),
+    Route('/metrics/commands', command_metrics, methods=['GET', 'POST']),
+    Route('/metrics/waypoints', waypoint_metrics, methods=['GET', 'POST']),
+    Route('/stream', stream, methods=['GET']),
+])
+
+app = Starlette(routes=[storage_api], exception_handlers={404: _handle_api_error}, middleware=[
+    Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+])
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0')
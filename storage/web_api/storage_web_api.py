@@ -1,22 +1,28 @@
-from flask import Flask, Blueprint, jsonify, request, make_response
+from flask import Flask, Blueprint, Response, jsonify, request, make_response
 from flask_cors import CORS
 
-from storage.hardware_api.storage_api import Storage, StorageHWAPIBySerial
-from storage.hardware_api.storage_test_api import st_hw_api
+from common.change_feed import StreamSlots, sse_stream, parse_since
+from storage.hardware_api import config
 
-app = Flask(__name__)
-CORS(app)
-
-# TODO: refactor this in next iteration
 # for debug purposes. in "prod" run by nginx (or uwsgi in my case)
 if __name__ == "__main__":
-    st = Storage(st_hw_api)
-else:
-    st = Storage(StorageHWAPIBySerial())
+    config.test_hw_api = True
+
+from storage.web_api.storage_web_common import st, st_hw_api, storage_feed, storage_api_url_prefix, StorageLocation, \
+    validate_side_row_column, validate_priority_deadline, validate_queue_submit, validate_location, validate_task_id, \
+    validate_free_cell, validate_inventory_cell, validate_auto_place, validate_batch_id, validate_batch, \
+    is_auto_place, batch_status_json, location_json, status_json, current_task_json, queue_json, cell_json, \
+    inventory_json, waypoint_metrics_json
+
+app = Flask(__name__)
+CORS(app)
 
-storage_api_url_prefix = '/api/v1/storage'
 storage_api = Blueprint('storage_api', __name__, url_prefix=storage_api_url_prefix)
 
+# each /stream client holds a worker thread, the rest of them are for the requests. The ASGI app has no limit
+STREAM_MAX_CLIENTS = 8
+stream_slots = StreamSlots(STREAM_MAX_CLIENTS)
+
 
 @app.errorhandler(404)
 def _handle_api_error(ex):
@@ -26,22 +32,6 @@ def _handle_api_error(ex):
         return ex
 
 
-def _validate_side_row_column(request_json):
-    error = None
-    side, row, column = (request_json.get(k) for k in ['side', 'row', 'column'])
-    if not all([side, row, column]):
-        error = "You need to pass 'row', 'side' and 'column'"
-    elif not all(isinstance(arg, int) for arg in [side, row, column]):
-        error = 'All args must be integer'
-    elif not 1 <= side <= st.SIDES:
-        error = f'Number of sides must be in range of [1; {st.SIDES}], got {side}'
-    elif not 1 <= row <= st.ROWS:
-        error = f'Number of sides must be in range of [1; {st.ROWS}], got {row}'
-    elif not 1 <= column <= st.COLUMNS:
-        error = f'Number of sides must be in range of [1; {st.COLUMNS}], got {column}'
-    return error, side, row, column
-
-
 @storage_api.route('/move_to/home', methods=['GET', 'POST'])
 def move_to_home():
     st.return_to_home()
@@ -69,7 +59,7 @@ def move_to_conveyor():
 @storage_api.route('/pick/asrs', methods=['GET', 'POST'])
 def pick_asrs():
     params = request.json
-    error, side, row, column = _validate_side_row_column(params)
+    error, side, row, column = validate_side_row_column(params)
     if error:
         resp_json = {"status": 400, "body": error}
         return make_response(jsonify(resp_json), 400)
@@ -90,11 +80,29 @@ def pick_conveyor():
 
 @storage_api.route('/place/asrs', methods=['GET', 'POST'])
 def place_asrs():
-    params = request.json
-    error, side, row, column = _validate_side_row_column(params)
+    """ Places to the given cell, or to the cell chosen by the storage if there are no side, row and column """
+    params = request.json or {}
+    if is_auto_place(params):
+        error, pallet_type = validate_auto_place(params)
+        if error:
+            resp_json = {"status": 400, "body": error}
+            return make_response(jsonify(resp_json), 400)
+        try:
+            cell = st.place_to_asrs(pallet_type=pallet_type)
+        except AttributeError as e:
+            resp_json = {"status": 409, "body": str(e)}
+            return make_response(jsonify(resp_json), 409)
+        resp_json = {"status": 200, "body": cell_json(cell)}
+        return make_response(jsonify(resp_json), 200)
+
+    error, side, row, column = validate_side_row_column(params)
     if error:
         resp_json = {"status": 400, "body": error}
         return make_response(jsonify(resp_json), 400)
+    error = validate_free_cell(side, row, column)
+    if error:
+        resp_json = {"status": 409, "body": error}
+        return make_response(jsonify(resp_json), 409)
 
     st.place_to_asrs(side, row, column)
 
@@ -112,49 +120,221 @@ def place_conveyor():
 
 @storage_api.route('/location', methods=['GET', 'POST'])
 def location():
-    _location = st.location
-
-    resp_json = {"status": 200, "body": {'location': {'name': _location.name,
-                                                      'value': _location.value}}}
+    resp_json = {"status": 200, "body": {'location': location_json()}}
     return make_response(jsonify(resp_json), 200)
 
 
 @storage_api.route('/status', methods=['GET', 'POST'])
 def status():
-    _status = st.status
-    
-    resp_json = {"status": 200, "body": {'status': {'name': _status.name,
-                                                    'value': _status.value}}}
+    resp_json = {"status": 200, "body": {'status': status_json()}}
     return make_response(jsonify(resp_json), 200)
 
 
 @storage_api.route('/current_task', methods=['GET', 'POST'])
 def current_task():
-    _current_task = st.current_task
-    if _current_task:
-        _current_task, *_task_args = st.current_task
-
-        resp_json = {"status": 200, "body": {'current_task': {'name': _current_task.name,
-                                                              'value': _current_task.value,
-                                                              'task_args': _task_args}}}
-    else:
-        resp_json = {"status": 200, "body": {'current_task': None}}
+    resp_json = {"status": 200, "body": {'current_task': current_task_json()}}
     return make_response(jsonify(resp_json), 200)
 
 
 @storage_api.route('/debug/output', methods=['GET', 'POST'])
 def debug_output():
-
+    if st_hw_api is None:
+        return make_response(jsonify({'status': 404, 'body': 'There is no output of the serial hw api'}), 404)
     return b'<br>'.join(st_hw_api.ser.getvalue().split(b'\n\r'))
 
 
 @storage_api.route('/queue', methods=['GET', 'POST'])
 def queue():
-    _queue = [[loc.name, loc.value, args] for loc, *args in st.queue.queue]
-    resp_json = {"status": 200, "body": {"queue": _queue}}
+    resp_json = {"status": 200, "body": {"queue": queue_json()}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/queue/submit', methods=['POST'])
+def queue_submit():
+    """ Queues the task with priority (greater is earlier, 0 by default) and deadline (seconds from now, optional) """
+    error, task, priority, deadline = validate_queue_submit(request.json or {})
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+    if task[0] is StorageLocation.ASRS_PLACE:
+        error = validate_free_cell(*task[1:])
+        if error:
+            resp_json = {"status": 409, "body": error}
+            return make_response(jsonify(resp_json), 409)
+
+    task_id = st.move_to_location(*task, priority=priority, deadline=deadline)
+
+    resp_json = {"status": 200, "body": {"id": task_id}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/queue/cancel', methods=['POST'])
+def queue_cancel():
+    error, task_id = validate_task_id(request.json or {})
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+
+    if not st.cancel_task(task_id):
+        resp_json = {"status": 404, "body": f'There is no task {task_id} in the queue'}
+        return make_response(jsonify(resp_json), 404)
+
+    resp_json = {"status": 200, "body": "cancelled"}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/queue/reorder', methods=['POST'])
+def queue_reorder():
+    """ Changes priority and (or) deadline of the pending task """
+    params = request.json or {}
+    error, task_id = validate_task_id(params)
+    if not error:
+        error, priority, deadline = validate_priority_deadline(params)
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+
+    if not st.reorder_task(task_id, params.get('priority'), deadline):
+        resp_json = {"status": 404, "body": f'There is no task {task_id} in the queue'}
+        return make_response(jsonify(resp_json), 404)
+
+    resp_json = {"status": 200, "body": {"queue": queue_json()}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/batch', methods=['POST'])
+def batch():
+    """
+    Queues the operations (as /queue/submit tasks) all or nothing: if any of them is invalid, nothing is queued
+
+    Returns the batch id for /batch/status and ids of the tasks in the order of the operations
+    """
+    errors, tasks = validate_batch(request.json or {})
+    if errors:
+        resp_json = {"status": 400, "body": errors}
+        return make_response(jsonify(resp_json), 400)
+
+    batch_id, task_ids = st.submit_batch(tasks)
+
+    resp_json = {"status": 200, "body": {"id": batch_id, "tasks": task_ids}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/batch/status', methods=['GET', 'POST'])
+def batch_status():
+    """ Status of the batch ('in_progress', 'done', 'failed' or 'expired') and of its tasks """
+    error, batch_id = validate_batch_id(request.get_json(silent=True) or {})
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+
+    task_statuses = st.batch_status(batch_id)
+    if task_statuses is None:
+        resp_json = {"status": 404, "body": f'There is no batch {batch_id}'}
+        return make_response(jsonify(resp_json), 404)
+
+    resp_json = {"status": 200, "body": batch_status_json(batch_id, task_statuses)}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/calibrate', methods=['POST'])
+def calibrate():
+    """ Sets the actual location, e.g. after the restart in the middle of the move, and resumes the queue """
+    error, location = validate_location(request.json or {})
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+
+    st.calibrate(location)
+
+    resp_json = {"status": 200, "body": location_json()}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/inventory', methods=['GET', 'POST'])
+def inventory():
+    resp_json = {"status": 200, "body": {"inventory": inventory_json()}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/inventory/cell', methods=['POST'])
+def inventory_cell():
+    """ Sets the cell on the stocktaking, or names the pallet placed from the conveyor """
+    error, cell = validate_inventory_cell(request.json or {})
+    if error:
+        resp_json = {"status": 400, "body": error}
+        return make_response(jsonify(resp_json), 400)
+
+    try:
+        st.set_inventory_cell(*cell)
+    except ValueError as e:
+        resp_json = {"status": 409, "body": str(e)}
+        return make_response(jsonify(resp_json), 409)
+
+    resp_json = {"status": 200, "body": {"inventory": inventory_json()}}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/inventory/nearest_free', methods=['GET', 'POST'])
+def inventory_nearest_free():
+    """ The nearest free cell to 'row' and 'column' (the center of the rack by default), optionally on the 'side' """
+    params = request.get_json(silent=True) or {}
+    row, column, side = (params.get(k) for k in ['row', 'column', 'side'])
+    if not all(arg is None or isinstance(arg, int) for arg in [row, column, side]):
+        resp_json = {"status": 400, "body": 'All args must be integer'}
+        return make_response(jsonify(resp_json), 400)
+
+    cell = st.inventory.nearest_free(row, column, side)
+    if cell is None:
+        resp_json = {"status": 404, "body": 'There are no free cells'}
+        return make_response(jsonify(resp_json), 404)
+
+    resp_json = {"status": 200, "body": cell_json(cell)}
     return make_response(jsonify(resp_json), 200)
 
 
+@storage_api.route('/inventory/find', methods=['GET', 'POST'])
+def inventory_find():
+    pallet = (request.get_json(silent=True) or {}).get('pallet')
+    cell = None if pallet is None else st.inventory.find(pallet)
+    if cell is None:
+        resp_json = {"status": 404, "body": f'There is no pallet {pallet!r} in the ASRS'}
+        return make_response(jsonify(resp_json), 404)
+
+    resp_json = {"status": 200, "body": cell_json(cell, pallet)}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/metrics/commands', methods=['GET', 'POST'])
+def command_metrics():
+    """ Round-trip latencies of the serial commands (ACK and DONE), in the framed serial mode only """
+    resp_json = {"status": 200, "body": st.st_api.latency_metrics()}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/metrics/waypoints', methods=['GET', 'POST'])
+def waypoint_metrics():
+    """ Timings of the recent waypoints: waiting for IDLE before the command, sending it and waiting after it """
+    resp_json = {"status": 200, "body": waypoint_metrics_json()}
+    return make_response(jsonify(resp_json), 200)
+
+
+@storage_api.route('/stream', methods=['GET'])
+def stream():
+    """
+    Server-Sent Events stream of the storage state: "state" event with the whole state at first, then "delta" events
+    with changed keys ("location", "status", "queue", "current_task", "inventory").
+    Resumes from Last-Event-ID or ?since=
+    """
+    since = parse_since(storage_feed, request.headers.get('Last-Event-ID'), request.args.get('since'))
+    events = stream_slots.stream(sse_stream(storage_feed, since))
+    if events is None:
+        resp_json = {"status": 503, "body": f'There are {STREAM_MAX_CLIENTS} streams already, use the ASGI app'}
+        return make_response(jsonify(resp_json), 503, {'Retry-After': '5'})
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
 app.register_blueprint(storage_api)
 
 
@@ -0,0 +1,31 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch, MagicMock
+
+from storage.hardware_api import config
+from storage.hardware_api.storage_test_api import GPIOMock
+
+MockGPIO = GPIOMock()
+
+with patch.dict("sys.modules", {"RPi": MagicMock(GPIO=MockGPIO), "RPi.GPIO": MockGPIO}), \
+        patch.object(config, 'test_hw_api', True):
+    from storage.web_api.storage_web_api import app, storage_api_url_prefix
+
+
+class TestStorageWebAPI(TestCase):
+    def setUp(self):
+        self.client = app.test_client()
+
+    def test_task_on_test_hw_api(self):
+        resp = self.client.post(f'{storage_api_url_prefix}/batch', json={'operations': [{'location': 'CONVEYOR'}]})
+        self.assertEqual(200, resp.status_code, "Batch status code is incorrect")
+        batch_id = resp.json['body']['id']
+
+        deadline = time.monotonic() + 10
+        while True:
+            resp = self.client.post(f'{storage_api_url_prefix}/batch/status', json={'id': batch_id})
+            status = resp.json['body']['status']
+            if status != 'in_progress' or time.monotonic() > deadline:
+                break
+            time.sleep(0.1)
+        self.assertEqual('done', status, "Status of the batch is incorrect")
@@ -0,0 +1,216 @@
+"""
+Storage of the web apps (flask and ASGI ones): its construction, the state feed, the request validators and
+the JSON serialisers, so both apps serve the same /api/v1/storage/* responses
+"""
+from common.change_feed import ChangeFeed
+from storage.hardware_api import config
+from storage.hardware_api.logging_config import configure_logging
+from storage.hardware_api.storage_api import Storage, StorageHWAPIBySerial, StorageHWAPIBySerialFramed, \
+    StorageLocation
+from storage.hardware_api.storage_test_api import make_st_hw_api
+
+configure_logging()
+
+# the commands of the test hw api are shown by /debug/output, there is nothing to show for the serial one
+st_hw_api = None
+if config.test_hw_api:
+    st_hw_api = make_st_hw_api()
+    st = Storage(st_hw_api)
+else:
+    st_api = StorageHWAPIBySerialFramed() if config.serial_framed else StorageHWAPIBySerial()
+    st = Storage(st_api, journal_file=config.journal_file)
+
+storage_api_url_prefix = '/api/v1/storage'
+BATCH_MAX_SIZE = 1000
+
+
+def validate_side_row_column(request_json):
+    error = None
+    side, row, column = (request_json.get(k) for k in ['side', 'row', 'column'])
+    if not all([side, row, column]):
+        error = "You need to pass 'row', 'side' and 'column'"
+    elif not all(isinstance(arg, int) for arg in [side, row, column]):
+        error = 'All args must be integer'
+    elif not 1 <= side <= st.SIDES:
+        error = f'Number of sides must be in range of [1; {st.SIDES}], got {side}'
+    elif not 1 <= row <= st.ROWS:
+        error = f'Number of sides must be in range of [1; {st.ROWS}], got {row}'
+    elif not 1 <= column <= st.COLUMNS:
+        error = f'Number of sides must be in range of [1; {st.COLUMNS}], got {column}'
+    return error, side, row, column
+
+
+def validate_priority_deadline(request_json):
+    error = None
+    priority, deadline = request_json.get('priority', 0), request_json.get('deadline')
+    if not isinstance(priority, int) or isinstance(priority, bool):
+        error = f'Priority must be integer, got {priority!r}'
+    elif deadline is not None and (not isinstance(deadline, (int, float)) or deadline <= 0):
+        error = f'Deadline must be positive number of seconds, got {deadline!r}'
+    return error, priority, deadline
+
+
+def validate_queue_submit(request_json):
+    """ Task of /queue/submit: location name (cell for ASRS_PICK and ASRS_PLACE), priority and deadline """
+    error, location = validate_location(request_json)
+    if error:
+        return error, None, None, None
+    args = ()
+    if location in [StorageLocation.ASRS_PICK, StorageLocation.ASRS_PLACE]:
+        error, *args = validate_side_row_column(request_json)
+        if error:
+            return error, None, None, None
+    error, priority, deadline = validate_priority_deadline(request_json)
+    return error, (location, *args), priority, deadline
+
+
+def validate_location(request_json):
+    location_name = request_json.get('location')
+    if location_name not in StorageLocation.__members__:
+        return f'Location must be one of {list(StorageLocation.__members__)}, got {location_name!r}', None
+    return None, StorageLocation[location_name]
+
+
+def validate_task_id(request_json):
+    task_id = request_json.get('id')
+    if not isinstance(task_id, int) or isinstance(task_id, bool):
+        return f'Task id must be integer, got {task_id!r}', None
+    return None, task_id
+
+
+def validate_free_cell(side, row, column):
+    if st.inventory.is_occupied(side, row, column):
+        return f'Cell side: {side}, row: {row}, column: {column} is occupied by {st.inventory.pallet(side, row, column)!r}'
+
+
+def validate_inventory_cell(request_json):
+    """ Cell of /inventory/cell: side, row, column, occupied flag and optional pallet id """
+    error, side, row, column = validate_side_row_column(request_json)
+    if error:
+        return error, None
+    occupied, pallet = request_json.get('occupied'), request_json.get('pallet')
+    if not isinstance(occupied, bool):
+        return f'Occupied must be boolean, got {occupied!r}', None
+    if pallet is not None and (not isinstance(pallet, (str, int)) or isinstance(pallet, bool)):
+        return f'Pallet id must be string or integer, got {pallet!r}', None
+    return None, (side, row, column, occupied, pallet)
+
+
+def validate_auto_place(request_json):
+    """ Place without the cell: the storage chooses it for the optional 'pallet_type' """
+    pallet_type = request_json.get('pallet_type')
+    if pallet_type is not None and (not isinstance(pallet_type, (str, int)) or isinstance(pallet_type, bool)):
+        return f'Pallet type must be string or integer, got {pallet_type!r}', None
+    return None, pallet_type
+
+
+def validate_batch_id(request_json):
+    batch_id = request_json.get('id')
+    if not isinstance(batch_id, int) or isinstance(batch_id, bool):
+        return f'Batch id must be integer, got {batch_id!r}', None
+    return None, batch_id
+
+
+def validate_batch(request_json):
+    """
+    Operations of /batch, each one as /queue/submit task, in one pass: [(task, priority, deadline)] or the errors
+
+    Cells are checked along the batch: the cell picked by the previous operation can be placed to
+    """
+    operations = request_json.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return ["'operations' must be non-empty list"], None
+    if len(operations) > BATCH_MAX_SIZE:
+        return [f'Batch is limited to {BATCH_MAX_SIZE} operations, got {len(operations)}'], None
+
+    errors, tasks = [], []
+    occupied = {cell for cell, _ in st.inventory.cells()}
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append({'index': index, 'error': f'Operation must be object, got {operation!r}'})
+            continue
+        error, task, priority, deadline = validate_queue_submit(operation)
+        if not error and task[0] is StorageLocation.ASRS_PLACE:
+            if tuple(task[1:]) in occupied:
+                error = f'Cell side: {task[1]}, row: {task[2]}, column: {task[3]} is occupied'
+            occupied.add(tuple(task[1:]))
+        elif not error and task[0] is StorageLocation.ASRS_PICK:
+            occupied.discard(tuple(task[1:]))
+        if error:
+            errors.append({'index': index, 'error': error})
+        else:
+            tasks.append((task, priority, deadline))
+    return errors, tasks
+
+
+def batch_status_json(batch_id, task_statuses):
+    """ Tasks forgotten by the storage (it keeps the latest results only) are 'expired': their result is unknown """
+    task_statuses = [(task_id, 'expired' if task_status is None else task_status)
+                     for task_id, task_status in task_statuses]
+    statuses = {task_status for _, task_status in task_statuses}
+    if statuses & {'queued', 'running'}:
+        batch_status = 'in_progress'
+    elif statuses <= {'done'}:
+        batch_status = 'done'
+    elif statuses & {'failed', 'cancelled'}:
+        batch_status = 'failed'
+    else:
+        batch_status = 'expired'
+    return {'id': batch_id, 'status': batch_status,
+            'tasks': [{'id': task_id, 'status': task_status} for task_id, task_status in task_statuses]}
+
+
+def is_auto_place(request_json):
+    return all(request_json.get(k) is None for k in ['side', 'row', 'column'])
+
+
+def location_json():
+    _location = st.location
+    return {'name': _location.name, 'value': _location.value}
+
+
+def status_json():
+    _status = st.status
+    return {'name': _status.name, 'value': _status.value}
+
+
+def current_task_json():
+    _current_task = st.current_task
+    if not _current_task:
+        return None
+    _current_task, *_task_args = _current_task
+    return {'name': _current_task.name, 'value': _current_task.value, 'task_args': _task_args,
+            'id': st.current_task_id}
+
+
+def queue_json():
+    """ [location name, location value, args, id, priority, deadline as unix time or None] in the order of execution """
+    return [[loc.name, loc.value, args, queued_task.id, queued_task.priority, queued_task.deadline_at]
+            for queued_task in st.queue.tasks() for loc, *args in [queued_task.task]]
+
+
+def cell_json(cell, pallet=None):
+    return {'side': cell.side, 'row': cell.row, 'column': cell.column, 'pallet': pallet}
+
+
+def inventory_json():
+    inventory = st.inventory
+    return {'sides': inventory.sides, 'rows': inventory.rows, 'columns': inventory.columns,
+            'free': inventory.free_count, 'carried': inventory.carried,
+            'occupied': [cell_json(cell, pallet) for cell, pallet in inventory.cells()]}
+
+
+def _storage_feed_state():
+    return {'location': location_json(), 'status': status_json(),
+            'queue': queue_json(), 'current_task': current_task_json(), 'inventory': inventory_json()}
+
+
+def waypoint_metrics_json(recent_count=20):
+    recent = [timing._replace(location=timing.location.name)._asdict()
+              for timing in list(st.waypoint_timings)[-recent_count:]]
+    return {'by_location': st.waypoint_metrics(), 'recent': recent}
+
+# one producer of the state deltas for all the /stream clients
+storage_feed = ChangeFeed(_storage_feed_state)
+storage_feed.start()
+st.subscribe(storage_feed.notify)
@@ -3,6 +3,9 @@
 let storage_api_ip;
 let storage_api_prefix = '/api/v1/';
 let connected_with_web_hw_api = false;
+// true while the push stream is alive, pollers are paused then
+let streaming = false;
+let event_source = null;
 
 let web_hw_api_ip_key = 'web_hw_api_ip';
 let web_hw_api_element = document.getElementById('web_hw_api');
@@ -66,6 +69,7 @@ web_hw_api_element.addEventListener('click', () => {
             update_global_storage_api_ip(web_hw_api_ip_arr);
             // console.log('Updated ip', storage_api_ip)
             connected_with_web_hw_api = true
+            start_stream();
 
         } else if ('web_hw_api_ip_disconnect' === sectionId) {
             let web_hw_api_ip_arr = [];
@@ -79,6 +83,7 @@ web_hw_api_element.addEventListener('click', () => {
             // console.log([web_hw_api_ip_arr.slice(0, 4).join('.'), web_hw_api_ip_arr[4]].join(':'));
 
             connected_with_web_hw_api = false
+            stop_stream();
         }
     }
 })
@@ -99,7 +104,7 @@ async function get_status() {
 
     while (true) {
 
-        if (connected_with_web_hw_api) {
+        if (connected_with_web_hw_api && !streaming) {
             let get_status_api_url = storage_api_ip + 'storage/status';
             // console.log(get_status_api_url)
             xhr.open('POST', get_status_api_url, true);
@@ -126,7 +131,7 @@ async function get_location() {
     let xhr = new XMLHttpRequest();
 
     while (true) {
-        if (connected_with_web_hw_api) {
+        if (connected_with_web_hw_api && !streaming) {
             let get_location_api_url = storage_api_ip + 'storage/location';
             xhr.open('POST', get_location_api_url, true);
             xhr.onreadystatechange = function() {
@@ -166,7 +171,7 @@ async function get_queue() {
     let xhr = new XMLHttpRequest();
 
     while (true) {
-        if (connected_with_web_hw_api) {
+        if (connected_with_web_hw_api && !streaming) {
             let get_location_api_url = storage_api_ip + 'storage/queue';
             xhr.open('POST', get_location_api_url, true);
             xhr.onreadystatechange = function() {
@@ -199,7 +204,7 @@ async function get_current_task() {
 
 
     while (true) {
-        if (connected_with_web_hw_api) {
+        if (connected_with_web_hw_api && !streaming) {
             let get_location_api_url = storage_api_ip + 'storage/current_task';
             xhr.open('POST', get_location_api_url, true);
             xhr.onreadystatechange = function() {
@@ -214,6 +219,49 @@ async function get_current_task() {
     }
 }
 
+function apply_storage_state(state) {
+    // state is the whole state or the delta, it has the same keys as the bodies of the polling endpoints
+    if ('status' in state) {
+        status_update({'body': {'status': state['status']}});
+    }
+    if ('location' in state) {
+        location_update({'body': {'location': state['location']}});
+    }
+    if ('queue' in state) {
+        queue_update({'body': {'queue': state['queue']}});
+    }
+    if ('current_task' in state) {
+        current_task_update({'body': {'current_task': state['current_task']}});
+    }
+}
+
+function start_stream() {
+    if (!window.EventSource || event_source !== null) {
+        return;
+    }
+    event_source = new EventSource(storage_api_ip + 'storage/stream');
+    event_source.onopen = function() {
+        streaming = true;
+    };
+    // EventSource reconnects by itself with Last-Event-ID, pollers work meanwhile
+    event_source.onerror = function() {
+        streaming = false;
+    };
+    let handler = function(event) {
+        apply_storage_state(JSON.parse(event.data));
+    };
+    event_source.addEventListener('state', handler);
+    event_source.addEventListener('delta', handler);
+}
+
+function stop_stream() {
+    if (event_source !== null) {
+        event_source.close();
+        event_source = null;
+    }
+    streaming = false;
+}
+
 const application = document.getElementById('application');
 
 let buttons_and_urls = [];